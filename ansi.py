@@ -0,0 +1,174 @@
+"""ANSI 转义序列解析
+
+把带颜色的终端输出切分成 (样式, 文本) 片段。样式是不可变的元组，可以直接作为
+缓存键，界面层按样式缓存对应的文本格式。解析是流式的：被拆到两次输出之间的
+转义序列会保留到下一次再处理。颜色和粗体等 SGR 序列转成样式，光标移动、清屏、
+窗口标题等其余序列直接丢弃。本模块不依赖 Qt。
+"""
+import re
+
+# CSI 序列、OSC 序列（以 BEL 或 ST 结束）以及其余两字符的 ESC 序列
+ESC_RE = re.compile(r'\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-Z\\^-~])')
+# 未结束的转义序列最多保留这么多字符，超过后当作普通文本丢弃
+MAX_PENDING = 4096
+
+# 样式: (前景色, 背景色, 粗体, 斜体, 下划线, 反色)
+# 颜色为 0-255 的调色板下标或 (r, g, b)，None 表示默认颜色
+DEFAULT_STYLE = (None, None, False, False, False, False)
+
+
+def apply_sgr(style, params):
+    """按 SGR 参数（例如 '1;31'）计算新样式"""
+    fg, bg, bold, italic, underline, inverse = style
+    codes = [int(p) if p.isdigit() else 0 for p in params.split(';')] if params else [0]
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if code == 0:
+            fg, bg, bold, italic, underline, inverse = DEFAULT_STYLE
+        elif code == 1:
+            bold = True
+        elif code == 3:
+            italic = True
+        elif code == 4:
+            underline = True
+        elif code == 7:
+            inverse = True
+        elif code in (21, 22):
+            bold = False
+        elif code == 23:
+            italic = False
+        elif code == 24:
+            underline = False
+        elif code == 27:
+            inverse = False
+        elif 30 <= code <= 37:
+            fg = code - 30
+        elif 90 <= code <= 97:
+            fg = code - 90 + 8
+        elif code == 39:
+            fg = None
+        elif 40 <= code <= 47:
+            bg = code - 40
+        elif 100 <= code <= 107:
+            bg = code - 100 + 8
+        elif code == 49:
+            bg = None
+        elif code in (38, 48):
+            # 38;5;n 为 256 色，38;2;r;g;b 为真彩色
+            color = None
+            if i + 2 < len(codes) and codes[i + 1] == 5:
+                color = codes[i + 2] & 0xff
+                i += 2
+            elif i + 4 < len(codes) and codes[i + 1] == 2:
+                color = tuple(c & 0xff for c in codes[i + 2:i + 5])
+                i += 4
+            if code == 38:
+                fg = color
+            else:
+                bg = color
+        i += 1
+    return fg, bg, bold, italic, underline, inverse
+
+
+# (样式, SGR 参数) -> 新样式，输出中反复出现的颜色序列只解析一次
+sgr_cache = {}
+
+
+def sgr_style(style, params):
+    key = (style, params)
+    new_style = sgr_cache.get(key)
+    if new_style is None:
+        if len(sgr_cache) > 4096:
+            sgr_cache.clear()
+        new_style = sgr_cache[key] = apply_sgr(style, params)
+    return new_style
+
+
+class AnsiParser:
+    def __init__(self):
+        self.style = DEFAULT_STYLE
+        self.pending = ''
+
+    def take(self, text):
+        """拼上上次留下的不完整转义序列，本次结尾不完整的序列留到下一次"""
+        if self.pending:
+            text = self.pending + text
+            self.pending = ''
+        if '\x1b' not in text:
+            return text
+        tail = text.rfind('\x1b')
+        if ESC_RE.match(text, tail) is None and len(text) - tail < MAX_PENDING:
+            self.pending = text[tail:]
+            text = text[:tail]
+        return text
+
+    def feed(self, text):
+        """返回 [(样式, 文本)]，相邻的同样式片段会合并"""
+        text = self.take(text)
+        if '\x1b' not in text:
+            return [(self.style, text)] if text else []
+
+        # split 的结果为 文本, 参数, 结束符, 文本, 参数, 结束符, ..., 文本
+        parts = ESC_RE.split(text)
+        segments = []
+        style = self.style
+        pieces = [parts[0]]
+        for i in range(1, len(parts), 3):
+            if parts[i + 1] == 'm':
+                new_style = sgr_style(style, parts[i])
+                if new_style != style:
+                    self.add(segments, style, pieces)
+                    style = new_style
+                    pieces = []
+            pieces.append(parts[i + 2])
+        self.add(segments, style, pieces)
+        self.style = style
+        return segments
+
+    def skip(self, text):
+        """只更新样式不生成片段，用于不会显示出来的输出，比 feed 快得多"""
+        text = self.take(text)
+        if '\x1b' not in text:
+            return
+        # 最后一个重置序列之前的颜色序列不影响最终的样式，从它开始计算即可
+        start = max(text.rfind('\x1b[0m'), text.rfind('\x1b[m'), 0)
+        style = self.style
+        for params, final in ESC_RE.findall(text, start):
+            if final == 'm':
+                style = sgr_style(style, params)
+        self.style = style
+
+    @staticmethod
+    def add(segments, style, pieces):
+        # 丢弃无法识别的孤立 ESC
+        text = ''.join(pieces).replace('\x1b', '')
+        if text:
+            segments.append((style, text))
+
+
+def strip_ansi(text):
+    """去掉所有转义序列，用于显示日志文件中的原始输出"""
+    if '\x1b' not in text:
+        return text
+    return ESC_RE.sub('', text).replace('\x1b', '')
+
+
+def palette_rgb(index):
+    """xterm 256 色调色板"""
+    if index < 16:
+        return BASE_COLORS[index]
+    if index < 232:
+        index -= 16
+        levels = (0, 95, 135, 175, 215, 255)
+        return levels[index // 36], levels[index // 6 % 6], levels[index % 6]
+    gray = 8 + (index - 232) * 10
+    return gray, gray, gray
+
+
+BASE_COLORS = [
+    (0, 0, 0), (205, 49, 49), (13, 188, 121), (229, 229, 16),
+    (36, 114, 200), (188, 63, 188), (17, 168, 205), (229, 229, 229),
+    (102, 102, 102), (241, 76, 76), (35, 209, 139), (245, 245, 67),
+    (59, 142, 234), (214, 112, 214), (41, 184, 219), (255, 255, 255),
+]
@@ -0,0 +1,272 @@
+"""性能基准
+
+在无界面环境（QT_QPA_PLATFORM=offscreen）下运行，测量大目录下的配置读写、命令树
+构建、参数对话框创建，以及大量输出（可带 ANSI 颜色）经过终端输出管线的渲染情况。
+结果保存为 JSON，可以用 --compare 与之前的结果对比：
+
+    python bench.py
+    python bench.py --sizes 1000,50000 --flood-mb 10,1000 --output before.json
+    python bench.py --compare before.json
+
+所有文件都写在临时目录中，不会影响当前目录下的 commands.json 和日志。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+
+FEED_CHUNK = 64 * 1024
+# 模拟管道的背压：积压超过这么多字节时暂停喂数据
+MAX_BACKLOG = 8 * 1024 * 1024
+PLAIN_LINE = b'192.168.1.%d:%d open tcp service banner text padding padding padding\n'
+ANSI_LINE = (b'\x1b[34m[INF]\x1b[0m http://192.168.1.%d:%d [\x1b[32m200\x1b[0m] '
+             b'[\x1b[35mnginx\x1b[0m] title text padding\n')
+
+
+def make_catalog(commands, per_tool=10, tools_per_category=10):
+    """生成约 commands 条命令的目录"""
+    categories = []
+    n = 0
+    while n < commands:
+        cat = {'name': f'分类{len(categories)}', 'tools': []}
+        for t in range(tools_per_category):
+            if n >= commands:
+                break
+            tool = {'name': f'tool{len(categories)}_{t}', 'description': f'工具说明 {n}', 'commands': []}
+            for c in range(per_tool):
+                if n >= commands:
+                    break
+                tool['commands'].append({
+                    'name': f'cmd{n}',
+                    'template': f'tool{n} -h {{host}} -p {{port}} -o {{output}} --threads {{{{threads}}}}',
+                    'param_types': {'host': '字符串', 'port': '字符串', 'output': '文件', 'threads': '字符串'},
+                })
+                n += 1
+            cat['tools'].append(tool)
+        categories.append(cat)
+    return categories
+
+
+def timed(func, repeat=1):
+    """返回 func 的最短和平均耗时（毫秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': round(min(samples), 3), 'mean_ms': round(sum(samples) / len(samples), 3)}
+
+
+def wait_until(app, condition, timeout=600):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError('等待超时')
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def bench_catalog(app, main, win, commands, repeat):
+    from configstore import ConfigStore
+
+    config = main.default_config()
+    config['categories'] = make_catalog(commands)
+    # 直接写配置文件前先停掉写入线程并清空变更日志，否则旧的变更会被重放
+    win.store.close()
+    if os.path.exists(win.store.journal_path):
+        os.remove(win.store.journal_path)
+    with open(main.CONFIG_FILE, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    results = {'file_bytes': os.path.getsize(main.CONFIG_FILE)}
+
+    def load():
+        win.store.close()
+        win.store = ConfigStore(main.CONFIG_FILE, delay=0)
+        win.load_config()
+    results['load_config'] = timed(load, repeat)
+    assert len(win.config['categories']) == len(config['categories'])
+
+    def first_build():
+        win.catalog.set_catalog({'categories': []})
+        win.refresh_tree()
+    results['refresh_tree_first'] = timed(first_build, repeat)
+    results['refresh_tree'] = timed(win.refresh_tree, repeat)
+
+    results['search_index_build'] = timed(lambda: wait_until(app, lambda: (
+        win.search_index.ready and win.search_index.vocab is not None)), 1)
+
+    # 界面线程只负责记录变更，磁盘写入在后台线程
+    results['save_config_ui'] = timed(win.save_config, repeat)
+    results['save_config_disk'] = timed(lambda: (win.save_config(), win.store.flush()), repeat)
+
+    cmd = config['categories'][0]['tools'][0]['commands'][0]
+
+    def dialog():
+        dlg = main.ParamInputDialog(cmd['template'], cmd['param_types'], win)
+        dlg.deleteLater()
+    results['param_dialog'] = timed(dialog, repeat * 5)
+    app.processEvents()
+    return results
+
+
+def bench_flood(app, main, win, megabytes, ansi):
+    # 终端输出由 ShellSupervisor.output 直接连到 win.output.feed，这里绕过 shell 进程
+    # 直接喂数据，测的是同一条渲染路径，不受进程和管道速度影响
+    pipeline = win.output
+    line = ANSI_LINE if ansi else PLAIN_LINE
+    block = b''.join(line % (i % 256, i % 65536) for i in range(2000))
+    total = megabytes * 1024 * 1024
+
+    flush_times = []
+    original = pipeline.flush
+
+    def timed_flush():
+        start = time.perf_counter()
+        original()
+        flush_times.append(time.perf_counter() - start)
+    pipeline.timer.timeout.disconnect()
+    pipeline.timer.timeout.connect(timed_flush)
+
+    fed = 0
+    offset = 0
+    start = time.perf_counter()
+    try:
+        while fed < total:
+            if len(pipeline.buffer) < MAX_BACKLOG:
+                chunk = block[offset:offset + FEED_CHUNK]
+                if len(chunk) < FEED_CHUNK:
+                    chunk += block[:FEED_CHUNK - len(chunk)]
+                offset = (offset + FEED_CHUNK) % len(block)
+                pipeline.feed(chunk)
+                fed += len(chunk)
+            app.processEvents()
+        fed_seconds = time.perf_counter() - start
+        wait_until(app, lambda: not pipeline.buffer and not pipeline.timer.isActive())
+        seconds = time.perf_counter() - start
+    finally:
+        pipeline.timer.timeout.disconnect()
+        pipeline.timer.timeout.connect(original)
+
+    flush_ms = sorted(t * 1000 for t in flush_times) or [0]
+    return {
+        'bytes': fed,
+        'seconds': round(seconds, 3),
+        'throughput_mb_s': round(fed / 1024 / 1024 / seconds, 2),
+        # 最后一块数据喂入后到全部显示完成的时间
+        'drain_ms': round((seconds - fed_seconds) * 1000, 1),
+        'flushes': len(flush_times),
+        'flush_p50_ms': round(flush_ms[len(flush_ms) // 2], 2),
+        'flush_p95_ms': round(flush_ms[int(len(flush_ms) * 0.95)], 2),
+        'flush_max_ms': round(flush_ms[-1], 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """把嵌套结果展开为 {'catalog.1000.load_config.mean_ms': 值}"""
+    flat = {}
+    for key, value in results.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+def compare(old_path, new):
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    before = flatten(old['results'])
+    after = flatten(new['results'])
+    print(f"\n与 {old_path}（{old['meta'].get('revision')}）对比：")
+    for name in sorted(set(before) & set(after)):
+        a, b = before[name], after[name]
+        ratio = f'{b / a:6.2f}x' if a else '     -'
+        print(f'  {name:<48}{a:>12}{b:>12}  {ratio}')
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description='CommandToGUI 性能基准')
+    parser.add_argument('--sizes', default='1000,10000,50000', help='目录命令数，逗号分隔')
+    parser.add_argument('--flood-mb', default='10,100', help='输出量（MB），逗号分隔，最大可到 1000')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    parser.add_argument('--output', help='结果文件，默认 bench-results/<时间>-<提交>.json')
+    parser.add_argument('--compare', help='与之前保存的结果对比')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    floods = [int(s) for s in args.flood_mb.split(',') if s]
+    revision = git_revision()
+    output = args.output or os.path.join(
+        ROOT, 'bench-results', f"{time.strftime('%Y%m%d-%H%M%S')}-{revision or 'unknown'}.json"
+    )
+    output = os.path.abspath(output)
+
+    workdir = tempfile.mkdtemp(prefix='ctg-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    app = QApplication.instance() or QApplication([])
+    try:
+        import main
+        win = main.ToolRunner()
+        win.show()
+        app.processEvents()
+        results = {'catalog': {}, 'flood': {}}
+        for size in sizes:
+            print(f'目录 {size} 条命令...', file=sys.stderr)
+            results['catalog'][str(size)] = bench_catalog(app, main, win, size, args.repeat)
+        for megabytes in floods:
+            for ansi in (False, True):
+                name = f"{megabytes}MB{'-ansi' if ansi else ''}"
+                print(f'输出 {name}...', file=sys.stderr)
+                results['flood'][name] = bench_flood(app, main, win, megabytes, ansi)
+        win.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'revision': revision,
+            'python': platform.python_version(),
+            'qt': QT_VERSION_STR,
+            'pyqt': PYQT_VERSION_STR,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f'结果已保存到 {output}', file=sys.stderr)
+    if args.compare:
+        compare(args.compare, report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_bench())
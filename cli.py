@@ -0,0 +1,237 @@
+"""命令行模式
+
+在没有图形界面的服务器上直接使用 commands.json 中的命令：
+
+    python main.py cli list
+    python main.py cli render 信息收集/fscan/扫描 --param ip=10.0.0.1
+    python main.py cli run fscan/扫描 --targets hosts.txt -j 8
+
+命令可以写完整路径 分类/工具/命令，也可以只写末尾部分，只要能唯一确定。
+本模块不导入 PyQt5。
+"""
+import os
+import sys
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from configstore import ConfigStore, ConfigCorrupted
+from templating import compile_template, load_batch_values, expand_batch, job_shell_command
+
+CONFIG_FILE = 'commands.json'
+
+
+class CliError(Exception):
+    """参数或配置错误，直接输出提示并以状态码 2 退出"""
+
+
+def load_catalog(path):
+    if not os.path.exists(path):
+        raise CliError(f'配置文件不存在: {path}')
+    try:
+        # 只读，不备份也不改动损坏的配置文件
+        data = ConfigStore(path).load(backup=False)
+    except ConfigCorrupted as e:
+        raise CliError(str(e))
+    if isinstance(data, list):
+        return data
+    return (data or {}).get('categories', [])
+
+
+def iter_commands(categories):
+    for cat in categories:
+        for tool in cat.get('tools', []):
+            for cmd in tool.get('commands', []):
+                yield (cat['name'], tool['name'], cmd['name']), cmd
+
+
+def find_command(categories, spec):
+    """按 分类/工具/命令 路径或其末尾部分查找命令"""
+    parts = tuple(p for p in spec.split('/') if p)
+    if not parts:
+        raise CliError('未指定命令')
+    matches = [(path, cmd) for path, cmd in iter_commands(categories)
+               if path[-len(parts):] == parts]
+    if not matches:
+        raise CliError(f'找不到命令: {spec}')
+    if len(matches) > 1:
+        names = '\n'.join('  ' + '/'.join(path) for path, _ in matches)
+        raise CliError(f'命令 {spec} 不唯一，请写出更完整的路径：\n{names}')
+    return matches[0]
+
+
+def parse_params(items):
+    values = {}
+    for item in items or []:
+        key, sep, value = item.partition('=')
+        if not sep:
+            raise CliError(f'参数格式应为 名称=值: {item}')
+        values[key] = value
+    return values
+
+
+def build_commands(args, cmd):
+    """返回 [(目标说明, 命令)]，没有批量参数时只有一条，目标说明为空"""
+    template = compile_template(cmd['template'])
+    values = parse_params(args.param)
+    batch = {}
+    for item in args.batch or []:
+        key, sep, path = item.partition('=')
+        if not sep:
+            raise CliError(f'批量参数格式应为 名称=文件: {item}')
+        batch[key] = path
+    if args.targets:
+        name = args.target_param
+        if name is None:
+            unfilled = [p for p in template.params if p not in values and p not in batch]
+            if len(unfilled) != 1:
+                raise CliError('无法确定目标列表对应的参数，请用 --target-param 指定')
+            name = unfilled[0]
+        batch[name] = args.targets
+
+    unknown = [p for p in list(values) + list(batch) if p not in template.params]
+    if unknown:
+        raise CliError(f"模板中没有参数: {', '.join(unknown)}（可用参数: {', '.join(template.params)}）")
+    # 显式给出的空值（-p name=）视为有意留空
+    missing = [p for p in template.params if p not in values and p not in batch]
+    if missing:
+        raise CliError(f"缺少参数: {', '.join(missing)}")
+
+    quote = not args.no_quote
+    if not batch:
+        return [('', template.render(values, quote))]
+    batch_values = {}
+    for name, path in batch.items():
+        try:
+            if path == '-':
+                batch_values[name] = load_batch_values(('list', sys.stdin.read().splitlines()))
+            else:
+                batch_values[name] = load_batch_values(('file', path))
+        except OSError as e:
+            raise CliError(f'读取目标列表失败: {e}')
+        if not batch_values[name]:
+            raise CliError(f'批量参数 {name} 没有可用的值')
+    return expand_batch(cmd['template'], values, batch_values, quote)
+
+
+class PrefixedWriter:
+    """多个进程的输出按行加上目标前缀写到同一个流，行与行之间不会交错"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write_line(self, prefix, line):
+        with self.lock:
+            self.stream.write(prefix + line)
+            self.stream.flush()
+
+
+def run_one(label, command, writer, processes):
+    program, args = job_shell_command(command)
+    proc = subprocess.Popen(
+        [program] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL
+    )
+    processes.append(proc)
+    prefix = f'[{label}] ' if label else ''
+    for raw in iter(proc.stdout.readline, b''):
+        line = raw.decode('utf-8', errors='replace')
+        if not line.endswith('\n'):
+            line += '\n'
+        writer.write_line(prefix, line)
+    proc.stdout.close()
+    code = proc.wait()
+    if label:
+        writer.write_line(prefix, f'退出码 {code}\n')
+    return code
+
+
+def cmd_list(args):
+    categories = load_catalog(args.config)
+    for cat in categories:
+        print(cat['name'])
+        for tool in cat.get('tools', []):
+            desc = f"  - {tool['description']}" if tool.get('description') else ''
+            print(f"  {tool['name']}{desc}")
+            for cmd in tool.get('commands', []):
+                if args.verbose:
+                    print(f"    {cmd['name']}: {cmd['template']}")
+                else:
+                    params = ', '.join(compile_template(cmd['template']).params)
+                    print(f"    {cmd['name']}" + (f'  ({params})' if params else ''))
+    return 0
+
+
+def cmd_render(args):
+    _, cmd = find_command(load_catalog(args.config), args.command)
+    for label, command in build_commands(args, cmd):
+        print(f'[{label}] {command}' if label else command)
+    return 0
+
+
+def cmd_run(args):
+    _, cmd = find_command(load_catalog(args.config), args.command)
+    commands = build_commands(args, cmd)
+    writer = PrefixedWriter(sys.stdout)
+    processes = []
+    workers = max(1, min(args.jobs, len(commands)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = []
+    try:
+        for label, command in commands:
+            futures.append(pool.submit(run_one, label, command, writer, processes))
+        codes = [f.result() for f in futures]
+    except KeyboardInterrupt:
+        for f in futures:
+            f.cancel()
+        for proc in processes:
+            if proc.poll() is None:
+                proc.terminate()
+        pool.shutdown(wait=False)
+        return 130
+    pool.shutdown()
+
+    if len(codes) == 1:
+        return codes[0]
+    failed = sum(1 for c in codes if c != 0)
+    print(f'共 {len(codes)} 个目标，成功 {len(codes) - failed}，失败 {failed}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+def add_run_options(parser):
+    parser.add_argument('command', help='分类/工具/命令，或能唯一确定命令的末尾部分')
+    parser.add_argument('-p', '--param', action='append', metavar='名称=值', help='参数值，可重复')
+    parser.add_argument('--batch', action='append', metavar='名称=文件',
+                        help='把参数绑定到目标列表文件（每行一个值，- 表示标准输入），可重复')
+    parser.add_argument('--targets', metavar='文件', help='目标列表文件，绑定到唯一未填写的参数')
+    parser.add_argument('--target-param', metavar='名称', help='--targets 对应的参数名')
+    parser.add_argument('--no-quote', action='store_true', help='参数值不加引号，原样插入')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='main.py cli', description='CommandToGUI 命令行模式')
+    parser.add_argument('-c', '--config', default=CONFIG_FILE, help='配置文件（默认 commands.json）')
+    sub = parser.add_subparsers(dest='action', required=True)
+
+    p = sub.add_parser('list', help='列出分类、工具和命令')
+    p.add_argument('-v', '--verbose', action='store_true', help='同时显示命令模板')
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser('render', help='只输出渲染后的命令，不执行')
+    add_run_options(p)
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser('run', help='渲染并执行命令，批量目标并行执行，输出带目标前缀')
+    add_run_options(p)
+    p.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 4, help='并发数')
+    p.set_defaults(func=cmd_run)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except CliError as e:
+        print(f'错误: {e}', file=sys.stderr)
+        return 2
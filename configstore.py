@@ -0,0 +1,327 @@
+"""命令配置的持久化
+
+每次修改在内存中执行成功后以一行 JSON 追加到变更日志（commands.json.journal），再由后台线程
+合并一段时间内的修改，把完整配置通过“临时文件 + 重命名”原子地写回
+commands.json，写入成功后清空变更日志。程序崩溃时最多丢失最后一次修改：
+启动时先读取配置文件，再重放变更日志中尚未写入配置文件的修改。
+
+解析大的配置文件很慢，因此每次写入或解析配置文件后，在旁边另存一份 marshal
+格式的快照缓存（commands.json.cache）。缓存记录了配置文件的修改时间、大小和
+内容摘要，三者都一致时直接读取缓存，否则重新解析 JSON 并更新缓存。缓存只是
+派生数据，删除或损坏都不影响配置。
+"""
+import gc
+import os
+import sys
+import json
+import time
+import queue
+import marshal
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# 配置文件中记录已包含的最后一条变更序号，重放时跳过这些变更
+SEQ_KEY = 'journal_seq'
+# 写入线程等待超时，表示该写入配置文件了
+CHECKPOINT = object()
+# marshal 格式随 Python 版本变化，版本不同的缓存视为过期
+CACHE_VERSION = (1, marshal.version, tuple(sys.version_info[:2]))
+
+
+class ConfigCorrupted(Exception):
+    """配置文件无法解析，原文件已被移到 backup"""
+    def __init__(self, path, backup, error):
+        message = f'{path} 无法解析（{error}）'
+        if backup:
+            message += f'，已备份到 {backup}'
+        super().__init__(message)
+        self.path = path
+        self.backup = backup
+
+
+def apply_change(doc, change):
+    """在 doc 上执行一条变更，返回执行后的文档"""
+    op, path, value = change['op'], change.get('path', []), change.get('value')
+    if op == 'replace':
+        return value
+    target = doc
+    for key in path[:-1]:
+        target = target[key]
+    last = path[-1]
+    if op == 'set':
+        target[last] = value
+    elif op == 'append':
+        target.setdefault(last, []).append(value)
+    elif op == 'delete':
+        del target[last]
+    else:
+        raise ValueError(f'未知的变更类型: {op}')
+    return doc
+
+
+def write_json_atomic(path, doc):
+    """写临时文件、fsync 后再重命名，任何时刻磁盘上都是完整的文件；返回内容摘要"""
+    data = json.dumps(doc, indent=2, ensure_ascii=False).encode('utf-8')
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return content_digest(data)
+
+
+@contextmanager
+def gc_paused():
+    """反序列化大量小对象时暂停循环垃圾回收，否则大部分时间花在反复的回收扫描上"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def cache_key(stat, digest):
+    return (CACHE_VERSION, stat.st_mtime_ns, stat.st_size, digest)
+
+
+def read_cache(cache_path, key):
+    """缓存与 key（配置文件的修改时间、大小和摘要）一致时返回缓存的文档，否则返回 None"""
+    try:
+        with open(cache_path, 'rb') as f:
+            data = f.read()
+        # 文件结构: 4 字节的键长度、marshal 序列化的键、marshal 序列化的文档
+        size = int.from_bytes(data[:4], 'little')
+        if marshal.loads(data[4:4 + size]) != key:
+            return None
+        with gc_paused():
+            return marshal.loads(memoryview(data)[4 + size:])
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+
+def write_cache(cache_path, key, doc):
+    """写入快照缓存，失败时删除旧缓存，不影响配置本身"""
+    directory = os.path.dirname(os.path.abspath(cache_path))
+    try:
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(cache_path) + '.')
+        try:
+            header = marshal.dumps(key)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(len(header).to_bytes(4, 'little'))
+                f.write(header)
+                f.write(marshal.dumps(doc))
+            os.replace(tmp, cache_path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    except (OSError, ValueError):
+        try:
+            os.unlink(cache_path)
+        except OSError:
+            pass
+
+
+class ConfigStore:
+    def __init__(self, path, delay=1.0, max_delay=10.0, on_error=None):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.cache_path = path + '.cache'
+        self.delay = delay
+        self.max_delay = max_delay
+        self.on_error = on_error
+        self.seq = 0
+        self.queue = queue.Queue()
+        self.thread = None
+        # 只读时丢弃所有变更，用于配置无法读取、又不能覆盖原文件的情况
+        self.read_only = False
+
+    def load(self, backup=True):
+        """读取配置并重放变更日志，没有配置时返回 None
+
+        配置文件无法解析或变更日志无法重放时，把配置文件和变更日志一起改名备份
+        并抛出 ConfigCorrupted，不会用默认配置覆盖原文件。backup 为 False 时只读取，
+        不改动任何文件：出错时只抛出异常，也不写快照缓存（命令行工具使用）。
+        """
+        doc = None
+        base_seq = 0
+        if os.path.exists(self.path):
+            try:
+                doc = self.read_file(update_cache=backup)
+            except ValueError as e:
+                raise self.corrupted(e, backup)
+            if isinstance(doc, dict):
+                base_seq = doc.pop(SEQ_KEY, 0)
+
+        self.seq = base_seq
+        for change in self.read_journal():
+            try:
+                if change['seq'] <= base_seq:
+                    continue
+                if doc is None and change['op'] != 'replace':
+                    continue
+                doc = apply_change(doc, change)
+                self.seq = change['seq']
+            except (KeyError, IndexError, TypeError, ValueError, AttributeError) as e:
+                # 变更与配置文件对不上，继续使用只会丢失或写错数据
+                raise self.corrupted(f'变更日志无法重放: {e!r}', backup)
+        return doc
+
+    def corrupted(self, error, backup):
+        """把配置文件和变更日志改名备份，返回要抛出的 ConfigCorrupted"""
+        if not backup:
+            return ConfigCorrupted(self.path, None, error)
+        backup = self.path + time.strftime('.corrupt-%Y%m%d-%H%M%S')
+        if os.path.exists(self.path):
+            os.replace(self.path, backup)
+        if os.path.exists(self.journal_path):
+            os.replace(self.journal_path, backup + '.journal')
+        return ConfigCorrupted(self.path, backup, error)
+
+    def read_file(self, update_cache=True):
+        """优先读取快照缓存，缓存过期时解析 JSON，update_cache 为 True 时更新缓存"""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+            key = cache_key(os.fstat(f.fileno()), content_digest(data))
+        doc = read_cache(self.cache_path, key)
+        if doc is None:
+            with gc_paused():
+                doc = json.loads(data.decode('utf-8'))
+            if update_cache:
+                write_cache(self.cache_path, key, doc)
+        return doc
+
+    def read_journal(self):
+        try:
+            f = open(self.journal_path, 'r', encoding='utf-8')
+        except OSError:
+            return
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # 崩溃时写了一半的最后一行
+                    return
+
+    def start(self, doc):
+        """启动后台写入线程，doc 为当前（已重放变更后的）配置"""
+        # 写入线程持有一份独立的副本：这里只做较快的 marshal 序列化，还原在写入线程中完成
+        frozen = marshal.dumps(doc)
+        self.thread = threading.Thread(
+            target=self.run, args=(frozen, self.seq), name='config-writer', daemon=True
+        )
+        self.thread.start()
+
+    def record(self, op, path=(), value=None):
+        """记录一条变更，序列化在调用方线程完成，写盘在后台线程"""
+        if self.read_only:
+            return
+        self.seq += 1
+        change = {'seq': self.seq, 'op': op, 'path': list(path), 'value': value}
+        self.queue.put(json.dumps(change, ensure_ascii=False))
+
+    def set(self, path, value):
+        self.record('set', path, value)
+
+    def append(self, path, value):
+        self.record('append', path, value)
+
+    def delete(self, path):
+        self.record('delete', path)
+
+    def replace(self, doc):
+        self.record('replace', (), doc)
+
+    def flush(self, timeout=None):
+        """等待之前记录的变更全部写入配置文件"""
+        if self.thread is None:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self, frozen, seq):
+        with gc_paused():
+            doc = marshal.loads(frozen)
+        del frozen
+        journal = open(self.journal_path, 'a', encoding='utf-8')
+        dirty_since = None
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = CHECKPOINT
+
+                if isinstance(item, str):
+                    # 先在内存中执行，只记录执行成功的变更：执行不了的变更写进日志后，
+                    # 下次启动重放失败会把配置文件当作损坏。apply_change 出错时不改动 doc
+                    try:
+                        change = json.loads(item)
+                        doc = apply_change(doc, change)
+                        seq = change['seq']
+                    except Exception as e:
+                        self.report(e)
+                        continue
+                    try:
+                        journal.write(item + '\n')
+                        journal.flush()
+                        os.fsync(journal.fileno())
+                    except Exception as e:
+                        self.report(e)
+                    now = time.monotonic()
+                    if dirty_since is None:
+                        dirty_since = now
+                    # 连续修改时推迟写入，但不超过 max_delay
+                    deadline = min(now + self.delay, dirty_since + self.max_delay)
+                    continue
+
+                if dirty_since is not None:
+                    try:
+                        self.checkpoint(doc, seq, journal)
+                    except Exception as e:
+                        self.report(e)
+                    dirty_since = deadline = None
+                if item is None:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+        finally:
+            journal.close()
+
+    def checkpoint(self, doc, seq, journal):
+        """原子写入完整配置，然后压缩（清空）变更日志"""
+        snapshot = dict(doc) if isinstance(doc, dict) else {'categories': doc}
+        snapshot[SEQ_KEY] = seq
+        digest = write_json_atomic(self.path, snapshot)
+        journal.seek(0)
+        journal.truncate()
+        write_cache(self.cache_path, cache_key(os.stat(self.path), digest), snapshot)
+
+    def report(self, error):
+        if self.on_error is not None:
+            self.on_error(str(error))
@@ -0,0 +1,126 @@
+"""输出结果提取
+
+命令配置中的 extract_rules 是一组带命名分组的正则，例如
+    [{"name": "端口", "pattern": "(?P<host>\\d+(?:\\.\\d+){3}):(?P<port>\\d+)"}]
+输出按到达顺序增量处理：只处理完整的行，未结束的行留到下一次，去掉 ANSI 颜色后
+逐条规则匹配。结果按 (规则, 各字段值) 在字典中去重，重复出现只累加次数，
+大量输出最终只留下不重复的发现。没有命名分组的规则把整个匹配作为 match 字段。
+本模块不依赖 Qt。
+"""
+import re
+import codecs
+
+from ansi import strip_ansi
+
+
+def compile_rules(rules):
+    """返回 [(名称, 正则, 字段列表)]，正则有误时抛出 ValueError"""
+    compiled = []
+    for i, rule in enumerate(rules):
+        name = rule.get('name') or f'规则{i + 1}'
+        try:
+            regex = re.compile(rule['pattern'], re.MULTILINE)
+        except (KeyError, re.error) as e:
+            raise ValueError(f'提取规则 {name} 有误: {e}') from None
+        fields = list(regex.groupindex) or ['match']
+        compiled.append((name, regex, fields))
+    return compiled
+
+
+def parse_rules_text(text):
+    """把编辑框中每行一条的 名称=正则 转成规则列表，空行和 # 开头的行忽略"""
+    rules = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        name, sep, pattern = line.partition('=')
+        if not sep or not name.strip() or not pattern.strip():
+            raise ValueError(f'第 {number} 行格式应为 名称=正则')
+        rules.append({'name': name.strip(), 'pattern': pattern.strip()})
+    compile_rules(rules)
+    return rules
+
+
+def format_rules_text(rules):
+    return '\n'.join(f"{rule['name']}={rule['pattern']}" for rule in rules)
+
+
+class Extractor:
+    """增量提取并去重，rows 中每行为 [规则, 各字段值..., 次数, 首次出现的行号]"""
+    def __init__(self, rules):
+        self.rules = compile_rules(rules)
+        # 所有规则字段的并集，作为结果表的列
+        self.fields = []
+        for _, _, fields in self.rules:
+            self.fields.extend(f for f in fields if f not in self.fields)
+        self.slots = [[self.fields.index(f) for f in fields] for _, _, fields in self.rules]
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.carry = ''
+        self.lines = 0
+        self.hits = 0
+        # (规则, 字段值) -> 行下标
+        self.index = {}
+        self.rows = []
+        # 自上次 take_changes 以来新增的第一行和次数变化的行
+        self.first_new = 0
+        self.touched = set()
+
+    @property
+    def count_column(self):
+        return len(self.fields) + 1
+
+    def feed(self, data):
+        text = self.carry + self.decoder.decode(data)
+        cut = text.rfind('\n') + 1
+        self.carry = text[cut:]
+        if cut:
+            self.scan(text[:cut])
+
+    def finish(self):
+        """处理最后一行没有换行符的输出"""
+        text = self.carry + self.decoder.decode(b'', final=True)
+        self.carry = ''
+        if text:
+            self.scan(text + '\n')
+
+    def scan(self, text):
+        text = strip_ansi(text)
+        base = self.lines
+        width = len(self.fields)
+        for (name, regex, fields), slots in zip(self.rules, self.slots):
+            # 行号只在出现新结果时计算，从上一个结果的位置继续数换行符
+            last_pos = 0
+            last_line = base
+            for match in regex.finditer(text):
+                self.hits += 1
+                values = [''] * width
+                if regex.groupindex:
+                    for slot, field in zip(slots, fields):
+                        values[slot] = match.group(field) or ''
+                else:
+                    values[slots[0]] = match.group(0)
+                key = (name, tuple(values))
+                row = self.index.get(key)
+                if row is not None:
+                    self.rows[row][-2] += 1
+                    if row < self.first_new:
+                        self.touched.add(row)
+                    continue
+                last_line += text.count('\n', last_pos, match.start())
+                last_pos = match.start()
+                self.index[key] = len(self.rows)
+                self.rows.append([name] + values + [1, last_line + 1])
+        self.lines = base + text.count('\n')
+
+    def take_changes(self):
+        """返回 (新增行的起始下标, 次数变化的已有行)，并清空记录"""
+        first, touched = self.first_new, self.touched
+        self.first_new = len(self.rows)
+        self.touched = set()
+        return first, touched
+
+    def records(self):
+        """结果列表，用于导出"""
+        keys = ['rule'] + self.fields + ['count', 'first_line']
+        return [dict(zip(keys, row)) for row in self.rows]
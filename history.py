@@ -0,0 +1,233 @@
+"""命令历史
+
+历史保存在 JSON Lines 文件中，每次运行只追加一行，不会重写整个文件：
+    {"time": 时间戳, "command": 命令, "path": [分类, 工具, 命令], "values": {参数: 值}, "batch": [参数]}
+终端中输入的命令没有 path、values 和 batch。同一条命令再次运行时只保留最新的一条，
+文件中的重复行在加载时去掉，重复过多时整理重写一次。
+反向搜索使用三字母组（trigram）倒排索引：从查询中出现最少的三字母组对应的
+条目里由新到旧逐条核对，十万条历史也不用全部扫描。读取文件和建立索引都可以
+在后台线程中完成，索引建好之前的查询退回到逐条扫描。本模块不依赖 Qt。
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+from array import array
+
+HISTORY_FILE = 'history.jsonl'
+MAX_ENTRIES = 100000
+
+
+def trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def build_index(texts, start=0, index=None):
+    """三字母组 -> 条目下标（递增），texts 中的 None 跳过"""
+    index = {} if index is None else index
+    for pos, text in enumerate(texts, start):
+        if text is None:
+            continue
+        for gram in trigrams(text):
+            postings = index.get(gram)
+            if postings is None:
+                postings = index[gram] = array('l')
+            postings.append(pos)
+    return index
+
+
+class History:
+    """add 只追加写入；读取文件推迟到 load_async 或第一次查询"""
+    def __init__(self, path=HISTORY_FILE, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.file = None
+        self.lock = threading.Lock()
+        self.loader = None
+        self.loaded = threading.Event()
+        # 条目按时间顺序排列，被更新的旧条目置为 None
+        self.entries = []
+        self.lowered = []
+        # 命令 -> 条目下标
+        self.positions = {}
+        # 三字母组索引，建立完成前为 None
+        self.index = None
+        # 每次整理后加一，用于丢弃按旧下标建立的索引
+        self.generation = 0
+
+    def __len__(self):
+        self.ensure_loaded()
+        return len(self.positions)
+
+    def load_async(self):
+        """在后台线程中读取历史并建立索引"""
+        with self.lock:
+            if self.loader is not None:
+                return
+            self.loader = threading.Thread(target=self.load, name='history-loader', daemon=True)
+        self.loader.start()
+
+    def ensure_loaded(self):
+        """等待条目读取完成，索引仍在后台建立"""
+        if not self.loaded.is_set():
+            self.load_async()
+            self.loaded.wait()
+
+    def load(self):
+        try:
+            self.read_file()
+        finally:
+            self.loaded.set()
+        self.update_index()
+
+    def read_file(self):
+        entries = {}
+        lines = 0
+        try:
+            with open(self.path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 写到一半的最后一行
+                        continue
+                    if isinstance(entry, dict) and entry.get('command'):
+                        # 重复的命令只保留最新的一条
+                        entries.pop(entry['command'], None)
+                        entries[entry['command']] = entry
+        except OSError:
+            pass
+        live = list(entries.values())[-self.max_entries:]
+        with self.lock:
+            # 读取期间追加的条目已经在 self.entries 中
+            added = [e for e in self.entries if e is not None]
+            self.entries = []
+            self.lowered = []
+            self.positions = {}
+            for entry in live + added:
+                self.insert(entry)
+            if lines > 2 * len(self.positions) + 1000:
+                self.rewrite()
+
+    def update_index(self):
+        """按当前条目建立索引，建立期间新增的条目最后补上"""
+        with self.lock:
+            generation = self.generation
+            texts = list(self.lowered)
+        index = build_index(texts)
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.index = build_index(self.lowered[len(texts):], len(texts), index)
+
+    def add(self, command, path=None, values=None, batch=None):
+        """追加一条历史；模板运行时 path 为命令路径，batch 为按目标列表展开的参数"""
+        command = command.strip()
+        if not command:
+            return None
+        entry = {'time': time.time(), 'command': command}
+        if path:
+            entry['path'] = list(path)
+            entry['values'] = dict(values or {})
+            if batch:
+                entry['batch'] = list(batch)
+        with self.lock:
+            if self.file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.file.flush()
+            self.insert(entry)
+            compact = (self.loaded.is_set() and
+                       len(self.entries) > 2 * min(len(self.positions), self.max_entries) + 1000)
+        if compact:
+            self.compact()
+        return entry
+
+    def insert(self, entry):
+        # 调用方持有 self.lock
+        old = self.positions.get(entry['command'])
+        if old is not None:
+            self.entries[old] = None
+            self.lowered[old] = None
+        pos = len(self.entries)
+        self.positions[entry['command']] = pos
+        self.entries.append(entry)
+        text = entry['command'].lower()
+        self.lowered.append(text)
+        if self.index is not None:
+            build_index([text], pos, self.index)
+
+    def compact(self):
+        """去掉被更新的旧条目和超出上限的最早条目，在后台重建索引"""
+        with self.lock:
+            live = [e for e in self.entries if e is not None][-self.max_entries:]
+            self.entries = []
+            self.lowered = []
+            self.positions = {}
+            self.index = None
+            self.generation += 1
+            for entry in live:
+                self.insert(entry)
+        threading.Thread(target=self.update_index, name='history-index', daemon=True).start()
+
+    def rewrite(self):
+        """把去重后的历史原子地写回文件，调用方持有 self.lock"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(self.path) + '.')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for entry in self.entries:
+                    if entry is not None:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            os.replace(tmp, self.path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def search(self, query, limit=50):
+        """由新到旧返回包含 query（不区分大小写）的条目"""
+        self.ensure_loaded()
+        query = query.lower()
+        with self.lock:
+            if len(query) < 3 or self.index is None:
+                candidates = range(len(self.entries) - 1, -1, -1)
+            else:
+                postings = [self.index.get(gram) for gram in trigrams(query)]
+                if any(p is None for p in postings):
+                    return []
+                candidates = reversed(min(postings, key=len))
+            results = []
+            for pos in candidates:
+                text = self.lowered[pos]
+                if text is not None and query in text:
+                    results.append(self.entries[pos])
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def neighbor(self, pos, direction):
+        """pos 之前（direction < 0）或之后的第一条有效条目下标，没有时返回 None"""
+        self.ensure_loaded()
+        pos += direction
+        while 0 <= pos < len(self.entries):
+            if self.entries[pos] is not None:
+                return pos
+            pos += direction
+        return None
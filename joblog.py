@@ -0,0 +1,168 @@
+"""任务输出日志
+
+每次运行的原始输出写到独立的日志文件（按工具、命令和时间命名），与界面显示互不影响。
+文件超过设定大小时切换到下一个分卷，可以边写边用 gzip 或 xz(lzma) 压缩。
+所有日志共用一个后台写入线程，界面线程只把数据放进队列，不会被磁盘 I/O 阻塞。
+"""
+import os
+import re
+import gzip
+import lzma
+import time
+import queue
+import threading
+
+JOB_LOG_DIR = os.path.join('logs', 'jobs')
+COMPRESSIONS = {'': '', 'gzip': '.gz', 'xz': '.xz'}
+# 队列空闲这么久（秒）后把缓冲写到磁盘，便于运行中查看日志
+IDLE_FLUSH = 1.0
+BUFFER_SIZE = 1024 * 1024
+UNSAFE_RE = re.compile(r'[\\/:*?"<>|\s]+')
+
+
+def safe_name(name):
+    return UNSAFE_RE.sub('_', name).strip('._') or 'job'
+
+
+class JobLog:
+    """单个任务的日志，write/close 可以在界面线程直接调用"""
+    def __init__(self, writer, base, max_bytes, compression):
+        self.writer = writer
+        self.base = base
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.part = 0
+        self.file = None
+        self.written = 0
+        self.failed = False
+        self.paths = []
+
+    def write(self, data):
+        if data:
+            self.writer.queue.put((self, bytes(data)))
+
+    def close(self):
+        self.writer.queue.put((self, None))
+
+    # 以下方法只在写入线程中调用
+    def next_path(self):
+        self.part += 1
+        suffix = '' if self.part == 1 else f'.{self.part}'
+        return f'{self.base}{suffix}.log{COMPRESSIONS[self.compression]}'
+
+    def open_part(self):
+        path = self.next_path()
+        if self.compression == 'gzip':
+            self.file = gzip.open(path, 'wb', compresslevel=6)
+        elif self.compression == 'xz':
+            self.file = lzma.open(path, 'wb', preset=3)
+        else:
+            self.file = open(path, 'wb', buffering=BUFFER_SIZE)
+        self.paths.append(path)
+        self.written = 0
+
+    def write_data(self, data):
+        view = memoryview(data)
+        while view:
+            if self.file is None:
+                self.open_part()
+            # 按未压缩的字节数切分卷
+            room = len(view) if self.max_bytes <= 0 else self.max_bytes - self.written
+            chunk = view[:room]
+            self.file.write(chunk)
+            self.written += len(chunk)
+            view = view[len(chunk):]
+            if self.max_bytes > 0 and self.written >= self.max_bytes:
+                self.file.close()
+                self.file = None
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class JobLogWriter:
+    def __init__(self, directory=JOB_LOG_DIR, on_error=None):
+        self.directory = directory
+        self.on_error = on_error
+        self.queue = queue.Queue()
+        self.names = set()
+        self.thread = None
+
+    def open(self, name, max_bytes=0, compression='gzip'):
+        """创建一个任务日志，name 一般为 工具-命令"""
+        if compression not in COMPRESSIONS:
+            raise ValueError(f'不支持的压缩方式: {compression}')
+        os.makedirs(self.directory, exist_ok=True)
+        stem = f"{safe_name(name)}-{time.strftime('%Y%m%d-%H%M%S')}"
+        base = stem
+        n = 1
+        while base in self.names:
+            n += 1
+            base = f'{stem}-{n}'
+        self.names.add(base)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='job-log-writer', daemon=True)
+            self.thread.start()
+        return JobLog(self, os.path.join(self.directory, base), max_bytes, compression)
+
+    def close(self, timeout=5):
+        """写完队列中的数据并关闭所有日志"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run(self):
+        dirty = set()
+        open_logs = set()
+        while True:
+            try:
+                item = self.queue.get(timeout=IDLE_FLUSH if dirty else None)
+            except queue.Empty:
+                for log in dirty:
+                    self.guard(log, log.flush)
+                dirty.clear()
+                continue
+            if item is None:
+                break
+            log, data = item
+            if data is None:
+                self.close_log(log)
+                dirty.discard(log)
+                open_logs.discard(log)
+                continue
+            if not log.failed:
+                self.guard(log, log.write_data, data)
+                dirty.add(log)
+                open_logs.add(log)
+        for log in open_logs:
+            self.close_log(log)
+
+    def close_log(self, log):
+        try:
+            log.close_file()
+        except OSError as e:
+            if not log.failed:
+                log.failed = True
+                self.report(log, e)
+
+    def guard(self, log, func, *args):
+        if log.failed:
+            return
+        try:
+            func(*args)
+        except OSError as e:
+            # 出错后不再写这个日志，只报告一次
+            log.failed = True
+            self.report(log, e)
+
+    def report(self, log, error):
+        if self.on_error is not None:
+            self.on_error(f'{log.base}: {error}')
@@ -0,0 +1,179 @@
+"""输出与日志搜索
+
+未压缩的日志通过 mmap 直接交给正则扫描，不整体读入内存；按行窗口分段扫描，
+每段之间检查取消标志。每个文件有一个稀疏的行偏移索引（每 LINE_STEP 行记录一次
+行首位置），第一次搜索时在后台线程中建立并缓存，文件增长后增量扩展，用于把匹配
+位置换算成行号以及按行号读取上下文。压缩日志（.gz/.xz）只能顺序解压，按块扫描。
+本模块不依赖 Qt。
+"""
+import os
+import re
+import gzip
+import lzma
+import mmap
+from array import array
+from bisect import bisect_right
+from itertools import islice
+
+LINE_STEP = 1024
+# 一次匹配 LINE_STEP 行，建立索引时逐行计数由正则引擎完成
+BLOCK_RE = re.compile(rb'(?:[^\n]*\n){%d}' % LINE_STEP)
+# 每段扫描的字节数，段与段之间检查是否取消
+WINDOW = 8 * 1024 * 1024
+# 压缩日志每次解压的字节数
+CHUNK = 4 * 1024 * 1024
+# 结果中单行最多保留的字节数
+MAX_LINE = 2000
+OPENERS = {'.gz': gzip.open, '.xz': lzma.open}
+
+
+def compile_pattern(text, regex=False, case=False):
+    """编译字节串正则，regex 为 False 时按普通文本查找；表达式错误时抛出 re.error"""
+    pattern = text.encode('utf-8')
+    if not regex:
+        pattern = re.escape(pattern)
+    flags = re.MULTILINE | (0 if case else re.IGNORECASE)
+    return re.compile(pattern, flags)
+
+
+class LineIndex:
+    """稀疏行索引：marks[i] 为第 i * LINE_STEP 行的行首偏移"""
+    def __init__(self):
+        self.marks = array('q', [0])
+
+    def update(self, buf, cancel=None):
+        """从上次的位置继续建立索引，取消时返回 False"""
+        if self.marks[-1] > len(buf):
+            # 文件被截断或替换
+            self.marks = array('q', [0])
+        pos = self.marks[-1]
+        while True:
+            match = BLOCK_RE.match(buf, pos)
+            if match is None:
+                return True
+            pos = match.end()
+            self.marks.append(pos)
+            if cancel is not None and len(self.marks) % 256 == 0 and cancel.is_set():
+                return False
+
+    def line_at(self, buf, offset):
+        i = bisect_right(self.marks, offset) - 1
+        return i * LINE_STEP + buf[self.marks[i]:offset].count(b'\n')
+
+    def offset_of(self, buf, line):
+        i = min(line // LINE_STEP, len(self.marks) - 1)
+        pos = self.marks[i]
+        for _ in range(line - i * LINE_STEP):
+            pos = buf.find(b'\n', pos) + 1
+            if pos == 0:
+                return len(buf)
+        return pos
+
+
+# 路径 -> LineIndex
+line_indexes = {}
+
+
+def line_index(path):
+    index = line_indexes.get(path)
+    if index is None:
+        index = line_indexes[path] = LineIndex()
+    return index
+
+
+def is_compressed(path):
+    return os.path.splitext(path)[1] in OPENERS
+
+
+def search_buffer(buf, pattern, cancel=None, index=None):
+    """在 buf 中逐行查找，生成 (行号, 行首偏移, 行文本)，每行只报告一次"""
+    end = len(buf)
+    pos = 0
+    # 上一个结果的 (偏移, 行号)，相距不远时直接数换行符
+    last_offset = last_line = 0
+    while pos < end:
+        if cancel is not None and cancel.is_set():
+            return
+        window_end = buf.find(b'\n', min(end, pos + WINDOW))
+        window_end = end if window_end < 0 else window_end + 1
+        match = pattern.search(buf, pos, window_end)
+        if match is None:
+            pos = window_end
+            continue
+        start = buf.rfind(b'\n', 0, match.start()) + 1
+        stop = buf.find(b'\n', match.end())
+        if stop < 0:
+            stop = end
+        if index is not None and start - last_offset > WINDOW:
+            line = index.line_at(buf, start)
+        else:
+            line = last_line + buf[last_offset:start].count(b'\n')
+        last_offset, last_line = start, line
+        text = bytes(buf[start:min(stop, start + MAX_LINE)]).decode('utf-8', errors='replace')
+        yield line, start, text.rstrip('\r')
+        pos = max(stop + 1, match.end())
+
+
+def search_file(path, pattern, cancel=None):
+    """在日志文件中查找，生成 (行号, 行首偏移, 行文本)；压缩日志的偏移为 None"""
+    if is_compressed(path):
+        yield from search_compressed(path, pattern, cancel)
+        return
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        index = line_index(path)
+        if not index.update(buf, cancel):
+            return
+        yield from search_buffer(buf, pattern, cancel, index)
+    finally:
+        buf.close()
+
+
+def search_compressed(path, pattern, cancel=None):
+    line_base = 0
+    carry = b''
+    with OPENERS[os.path.splitext(path)[1]](path, 'rb') as f:
+        while True:
+            if cancel is not None and cancel.is_set():
+                return
+            chunk = f.read(CHUNK)
+            data = carry + chunk
+            if chunk:
+                cut = data.rfind(b'\n') + 1
+                carry = data[cut:]
+                data = data[:cut]
+            if data:
+                for line, _, text in search_buffer(data, pattern, cancel):
+                    yield line_base + line, None, text
+                line_base += data.count(b'\n')
+            if not chunk:
+                return
+
+
+def read_lines(path, first, count):
+    """读取从第 first 行（从 0 开始）起的 count 行"""
+    if is_compressed(path):
+        with OPENERS[os.path.splitext(path)[1]](path, 'rb') as f:
+            lines = list(islice(f, first, first + count))
+        return [line.decode('utf-8', errors='replace').rstrip('\r\n') for line in lines]
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        index = line_index(path)
+        index.update(buf)
+        start = index.offset_of(buf, first)
+        stop = start
+        for _ in range(count):
+            if stop >= len(buf):
+                break
+            nl = buf.find(b'\n', stop)
+            stop = len(buf) if nl < 0 else nl + 1
+        text = buf[start:stop].decode('utf-8', errors='replace')
+    finally:
+        buf.close()
+    return text.splitlines()
@@ -1,28 +1,429 @@
+import time
+# 启动计时起点，尽量早于其余导入
+STARTUP_BEGIN = time.perf_counter()
+
 import sys
 import os
+
+# 命令行模式不需要图形界面，在导入 PyQt5 之前分流
+if __name__ == '__main__' and sys.argv[1:2] == ['cli']:
+    from cli import main as cli_main
+    sys.exit(cli_main(sys.argv[2:]))
+
+import re
+import csv
 import json
+import codecs
+import mmap
 import platform
-import requests
+import heapq
+import threading
+from collections import deque
 from functools import partial
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QWidget, QTreeWidget, QTreeWidgetItem,
+    QApplication, QMainWindow, QWidget, QTreeView,
     QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog,
     QLineEdit, QLabel, QFormLayout, QMenuBar, QAction, QInputDialog,
-    QDialog, QMessageBox, QPlainTextEdit, QSplitter, QStatusBar, QMenu
+    QDialog, QMessageBox, QPlainTextEdit, QSplitter, QStatusBar, QMenu,
+    QTabWidget, QCheckBox, QSpinBox, QProgressBar, QTableWidget, QTableWidgetItem,
+    QHeaderView, QProgressDialog, QListWidget, QListWidgetItem, QComboBox, QShortcut,
+    QTextEdit, QTableView
+)
+from PyQt5.QtCore import (
+    Qt, QProcess, QTimer, QObject, QThread, pyqtSignal, QAbstractItemModel, QModelIndex,
+    QAbstractTableModel, QSortFilterProxyModel
+)
+from PyQt5.QtGui import QFont, QTextCursor, QKeySequence, QColor, QTextCharFormat
+
+from remote import (
+    CatalogFetcher, FetchCancelled, MERGE_POLICIES, catalog_categories, merge_catalog
+)
+from searchindex import SearchIndex, catalog_entries
+from configstore import ConfigStore, ConfigCorrupted
+from joblog import JobLogWriter, COMPRESSIONS, JOB_LOG_DIR, safe_name
+from procstats import proc_available, sample_trees, children_rusage
+from ansi import AnsiParser, palette_rgb, strip_ansi
+from logsearch import compile_pattern, search_buffer, search_file, read_lines
+from extract import Extractor, compile_rules, parse_rules_text, format_rules_text
+from history import History
+from targets import TargetCache, PreprocessCancelled
+from resultcache import ResultCache, run_key, diff_outputs, diff_findings
+from templating import (
+    compile_template, template_params, load_batch_values, expand_batch, job_shell_command
 )
-from PyQt5.QtCore import Qt, QProcess, QTimer
-from PyQt5.QtGui import QFont, QTextCursor
-import time
 
 CONFIG_FILE = 'commands.json'
+LOG_DIR = 'logs'
+# 需要传给下游任务的输出保存在这里
+PIPELINE_DIR = os.path.join(LOG_DIR, 'pipeline')
+# 启动后第一次同步订阅源的延迟(毫秒)
+SYNC_STARTUP_DELAY = 5000
+
+# 除分类外的可配置项及其默认值
+DEFAULT_SETTINGS = {
+    'use_internal_terminal': True,
+    'output_flush_interval': 50,        # 终端输出刷新间隔(ms)，50ms 即最多每秒渲染 20 次
+    'output_max_batch': 256 * 1024,     # 单次刷新最多解析的字节数，插入超过半帧时分到下一次
+    'scrollback_lines': 5000,           # 终端内存中保留的最大行数，更早的输出只保存在会话日志中
+    'max_parallel_jobs': os.cpu_count() or 4,  # 同时运行的任务数上限
+    'remote_url': '',                   # 上次使用的远程配置地址
+    'remote_timeout': 15,               # 远程配置请求超时(秒)
+    'catalog_sources': [],              # 订阅的命令目录来源（URL 或本地文件），合并到本地目录
+    'catalog_merge_policy': 'local',    # 与本地同名命令冲突时: 'local' / 'remote' / 'both'
+    'catalog_refresh_minutes': 60,      # 后台同步订阅源的间隔(分钟)，0 表示只手动同步
+    'catalog_fetch_workers': 4,         # 并发获取订阅源的线程数
+    'target_expand_limit': 65536,       # 预处理目标列表时单个网段最多展开的地址数
+    'result_cache_enabled': True,       # 保存任务输出，用于复用和与上次运行对比
+    'result_cache_max_mb': 512,         # 结果缓存总大小上限(MB)，超过后删除最久没用的结果
+    'result_reuse_minutes': 0,          # 默认复用多少分钟内的相同运行结果，0 表示默认不复用
+    'quote_params': True,               # 按 shell 规则给 {参数} 的值加引号，{{参数}} 始终原样插入
+    'job_log_enabled': True,            # 每个任务的原始输出另存到 logs/jobs
+    'job_log_compression': 'gzip',      # 任务日志压缩方式: '' / 'gzip' / 'xz'
+    'job_log_max_mb': 100,              # 任务日志单个分卷的大小上限(MB，按未压缩计)，0 表示不分卷
+}
+
+
+def default_config():
+    return {'categories': [], **DEFAULT_SETTINGS}
+
+
+def normalize_config(data):
+    """合并读取到的配置和默认配置，data 可以是分类列表或完整配置"""
+    if isinstance(data, list):
+        return {'categories': data, **DEFAULT_SETTINGS}
+    return {'categories': data.get('categories', []),
+            **{k: data.get(k, v) for k, v in DEFAULT_SETTINGS.items()}}
+
+
+def format_size(num):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if num < 1024 or unit == 'GB':
+            return f'{num:.0f} {unit}' if unit == 'B' else f'{num:.1f} {unit}'
+        num /= 1024
+
+
+class StartupProfile:
+    """记录启动各阶段耗时，--startup-profile 启动时在界面首次显示后输出"""
+    def __init__(self, begin, enabled=False):
+        self.enabled = enabled
+        self.last = begin
+        self.begin = begin
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self, stream=None):
+        if not self.enabled:
+            return
+        stream = stream or sys.stderr
+        print('启动耗时：', file=stream)
+        for phase, seconds in self.phases:
+            print(f'  {phase:<16}{seconds * 1000:9.1f} ms', file=stream)
+        print(f'  {"合计":<16}{(self.last - self.begin) * 1000:9.1f} ms', file=stream)
+        stream.flush()
+
+
+startup = StartupProfile(STARTUP_BEGIN, '--startup-profile' in sys.argv)
+startup.mark('导入模块')
+
+
+class RateMeter:
+    """按滑动时间窗口统计字节速率"""
+    def __init__(self, window=1.0):
+        self.window = window
+        self.samples = deque()
+        self.total = 0
+
+    def add(self, count):
+        self.samples.append((time.monotonic(), count))
+        self.total += count
+
+    def rate(self):
+        now = time.monotonic()
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        return sum(n for _, n in self.samples) / self.window
+
+
+class SessionLog:
+    """会话日志：完整输出追加写入磁盘，回看时通过 mmap 按页读取"""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'ab', buffering=64 * 1024)
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def size(self):
+        self.file.flush()
+        return os.path.getsize(self.path)
+
+    def _map(self):
+        self.file.flush()
+        f = open(self.path, 'rb')
+        if os.fstat(f.fileno()).st_size == 0:
+            f.close()
+            return None, None
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_before(self, end, max_lines):
+        """读取 end 偏移之前的最多 max_lines 行，返回 (起始偏移, 文本)"""
+        f, mm = self._map()
+        if mm is None:
+            return 0, ''
+        with f, mm:
+            end = min(end, len(mm))
+            start = end
+            for _ in range(max_lines):
+                pos = mm.rfind(b'\n', 0, max(start - 1, 0))
+                if pos < 0:
+                    start = 0
+                    break
+                start = pos + 1
+            return start, mm[start:end].decode('utf-8', errors='replace')
+
+    def read_after(self, start, max_lines):
+        """读取 start 偏移之后的最多 max_lines 行，返回 (结束偏移, 文本)"""
+        f, mm = self._map()
+        if mm is None:
+            return 0, ''
+        with f, mm:
+            start = min(start, len(mm))
+            end = start
+            for _ in range(max_lines):
+                pos = mm.find(b'\n', end)
+                if pos < 0:
+                    end = len(mm)
+                    break
+                end = pos + 1
+            return end, mm[start:end].decode('utf-8', errors='replace')
+
+
+# ANSI 样式 -> QTextCharFormat，所有输出页共用
+text_formats = {}
+
+
+def text_format(style):
+    fmt = text_formats.get(style)
+    if fmt is None:
+        fg, bg, bold, italic, underline, inverse = style
+        if inverse:
+            fg, bg = (bg if bg is not None else 15), (fg if fg is not None else 0)
+        fmt = QTextCharFormat()
+        if fg is not None:
+            fmt.setForeground(QColor(*(palette_rgb(fg) if isinstance(fg, int) else fg)))
+        if bg is not None:
+            fmt.setBackground(QColor(*(palette_rgb(bg) if isinstance(bg, int) else bg)))
+        if bold:
+            fmt.setFontWeight(QFont.Bold)
+        fmt.setFontItalic(italic)
+        fmt.setFontUnderline(underline)
+        text_formats[style] = fmt
+    return fmt
+
+
+class OutputPipeline(QObject):
+    """终端输出管线：readyRead 只把数据追加到缓冲区，由定时器按帧合并渲染
+
+    每次刷新最多解析 max_batch 字节，且只做一次批量编辑，避免高频小块输出触发大量
+    重新布局导致界面卡死；插入超过半帧时剩下的片段留到下一次刷新。缓冲区为空时
+    定时器停止，不产生空闲唤醒。ANSI 颜色序列在这里流式解析并按样式插入。
+    积压中后面还有超过保留行数的输出的部分，显示出来也会马上被移除，按大块只解码
+    并更新颜色状态，不绘制；积压超过 MAX_BACKLOG 时最早的部分直接这样处理，
+    完整的输出始终保存在会话日志中。
+    """
+    stats_changed = pyqtSignal(float, float, int)  # 输入速率, 渲染速率, 积压字节数
+
+    # 不绘制的积压每次处理的字节数
+    SKIP_SLICE = 2 * 1024 * 1024
+    MAX_BACKLOG = 64 * 1024 * 1024
+    # 每次解析的字节数，解析和插入都能在超时的时候停下
+    PARSE_SIZE = 16 * 1024
+
+    def __init__(self, widget, flush_interval=50, max_batch=256 * 1024, log=None, parent=None):
+        super().__init__(parent)
+        self.widget = widget
+        self.max_batch = max_batch
+        self.log = log
+        self.buffer = bytearray()
+        # 已解析、还没插入的 (样式, 文本) 片段
+        self.segments = deque()
+        # 结束编辑时每插入一行的耗时（移除超出保留行数的旧行、重新布局），随实际耗时更新
+        self.line_cost = 0.00002
+        # 增量解码，避免多字节字符被拆分到两次刷新之间
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.ansi = AnsiParser()
+        self.ingested = RateMeter()
+        self.rendered = RateMeter()
+        self.last_output_time = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(flush_interval)
+        self.timer.timeout.connect(self.flush)
+
+    def configure(self, flush_interval, max_batch):
+        self.timer.setInterval(flush_interval)
+        self.max_batch = max_batch
+
+    def feed(self, data):
+        if not data:
+            return
+        # 距离上次输出超过1秒时插入时间戳
+        current_time = time.time()
+        if current_time - self.last_output_time > 1:
+            timestamp = time.strftime("%H:%M:%S", time.localtime())
+            self.record(f"\n\n[{timestamp}]".encode())
+        self.last_output_time = current_time
+
+        self.ingested.add(len(data))
+        self.write(data)
+
+    def write(self, data):
+        """写入一段待渲染的输出并确保刷新定时器在运行"""
+        self.record(data)
+        if len(self.buffer) > self.MAX_BACKLOG:
+            self.skip(len(self.buffer) - self.MAX_BACKLOG)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def record(self, data):
+        """写入渲染缓冲，同时完整追加到会话日志"""
+        self.buffer += data
+        if self.log is not None:
+            self.log.write(data)
+
+    def skip(self, size):
+        """丢弃积压开头的 size 字节，只解码并更新颜色状态"""
+        chunk = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.ansi.skip(self.decoder.decode(chunk))
+        self.rendered.add(len(chunk))
+
+    def hidden_length(self):
+        """积压开头不用绘制的字节数：其后的输出已经超过保留行数"""
+        max_blocks = self.widget.maximumBlockCount()
+        if max_blocks <= 0 or len(self.buffer) <= self.max_batch:
+            return 0
+        pos = len(self.buffer)
+        for _ in range(max_blocks):
+            pos = self.buffer.rfind(b'\n', 0, pos)
+            if pos < 0:
+                return 0
+        return pos + 1
+
+    def flush(self):
+        if not self.buffer and not self.segments:
+            self.timer.stop()
+            if self.log is not None:
+                self.log.flush()
+            self.stats_changed.emit(self.ingested.rate(), self.rendered.rate(), 0)
+            return
+
+        deadline = time.perf_counter() + self.timer.interval() / 2000
+        hidden = self.hidden_length()
+        if hidden:
+            # 还没插入的片段在要跳过的输出之前，同样不用绘制
+            self.segments.clear()
+            while hidden and time.perf_counter() < deadline:
+                size = min(hidden, self.SKIP_SLICE)
+                self.skip(size)
+                hidden -= size
+        else:
+            self.render(deadline)
+        self.stats_changed.emit(self.ingested.rate(), self.rendered.rate(), len(self.buffer))
+
+    def render(self, deadline):
+        cursor = QTextCursor(self.widget.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.beginEditBlock()
+        # 按小块解析、逐段插入，超过本帧的时间就停下，剩下的片段下一次再插入；
+        # 颜色多的输出片段多、插入慢，每次刷新处理的字节数随之变少
+        parsed = 0
+        lines = 0
+        while True:
+            if not self.segments:
+                if not self.buffer or parsed >= self.max_batch:
+                    break
+                size = min(self.PARSE_SIZE, self.max_batch - parsed)
+                chunk = bytes(self.buffer[:size])
+                del self.buffer[:size]
+                parsed += len(chunk)
+                self.segments.extend(self.ansi.feed(self.decoder.decode(chunk)))
+                self.rendered.add(len(chunk))
+                continue
+            style, text = self.segments.popleft()
+            cursor.insertText(text, text_format(style))
+            lines += text.count('\n')
+            # 超出保留行数的旧行在结束编辑时才移除，按行数给它留出时间
+            if time.perf_counter() + lines * self.line_cost > deadline:
+                break
+        inserted = time.perf_counter()
+        cursor.endEditBlock()
+        self.widget.moveCursor(QTextCursor.End)
+        if lines:
+            self.line_cost = (self.line_cost + (time.perf_counter() - inserted) / lines) / 2
+
+
+class TargetScanThread(QThread):
+    """在后台统计目标文件的行数，或按 options 预处理"""
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    progress = pyqtSignal(int)
+
+    def __init__(self, cache, path, options=None, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self.path = path
+        self.options = options
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            if self.options is None:
+                result = self.cache.inspect(self.path, self.cancel_event)
+            else:
+                result = self.cache.preprocess(
+                    self.path, self.options, self.cancel_event,
+                    lambda done, total: self.progress.emit(done * 100 // max(total, 1))
+                )
+        except PreprocessCancelled:
+            return
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(result)
+
 
 class ParamInputDialog(QDialog):
-    def __init__(self, template, param_types, parent=None):
+    def __init__(self, template, param_types, parent=None, workers=4, jobs=None, values=None, batch=(),
+                 targets=None, preprocess_options=None, reuse_minutes=None):
         super().__init__(parent)
         self.setWindowTitle('运行命令')
         self.template = template
         self.param_types = param_types
         self.values = {}
+        self.batch_checks = {}
+        self.pasted = {}
+        # 勾选批量前的输入提示，取消勾选时恢复
+        self.placeholders = {}
+        # 参数值为文件时显示行数预览，可以预处理；targets 为 None 时不显示
+        self.targets = targets
+        self.preprocess_options = preprocess_options or {}
+        self.previews = {}
+        self.processed = {}
+        self.scan_threads = {}
         
         # 设置对话框样式
         self.setStyleSheet("""
@@ -79,8 +480,7 @@ class ParamInputDialog(QDialog):
         form.setContentsMargins(0, 0, 0, 0)
         
         self.inputs = {}
-        import re
-        self.params = re.findall(r"\{(.*?)\}", template)
+        self.params = list(template_params(template))
         
         for p in self.params:
             ptype = param_types.get(p, '字符串')
@@ -132,45 +532,2183 @@ class ParamInputDialog(QDialog):
                 hbox.addWidget(line, 1)
                 hbox.addWidget(btn)
             else:
-                line.setPlaceholderText(f'示例: 文本_{p}')
-                hbox.addWidget(line)
-                
-            # 美化参数标签
-            param_label = QLabel(f'参数 {p} （类型：{ptype}）：')
-            param_label.setStyleSheet("color: #555;")
-            form.addRow(param_label, hbox)
-            self.inputs[p] = line
-        
-        # 添加运行按钮
-        run_btn = QPushButton('运行命令')
-        run_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #2196F3;
-                font-weight: bold;
-                padding: 10px;
-                font-size: 14px;
-            }
-            QPushButton:hover {
-                background-color: #0b7dda;
-            }
-        """)
-        run_btn.setToolTip('点击开始在内置终端中运行命令')
-        run_btn.clicked.connect(self.accept)
-        
+                line.setPlaceholderText(f'示例: 文本_{p}')
+                hbox.addWidget(line)
+                
+            # 美化参数标签
+            param_label = QLabel(f'参数 {p} （类型：{ptype}）：')
+            param_label.setStyleSheet("color: #555;")
+            form.addRow(param_label, hbox)
+            self.inputs[p] = line
+
+            # 批量模式：参数绑定到目标列表文件或粘贴的多行列表
+            batch_btns = []
+            if ptype == '字符串':
+                list_btn = QPushButton('浏览')
+                list_btn.clicked.connect(partial(self.browse_file, line))
+                batch_btns.append(list_btn)
+            paste_btn = QPushButton('粘贴')
+            paste_btn.setToolTip('粘贴多行目标，每行一个值')
+            paste_btn.clicked.connect(partial(self.paste_list, p))
+            batch_btns.append(paste_btn)
+            for b in batch_btns:
+                b.setStyleSheet("""
+                    QPushButton {
+                        background-color: #ff9800;
+                        padding: 6px 12px;
+                    }
+                    QPushButton:hover {
+                        background-color: #f57c00;
+                    }
+                """)
+                b.setVisible(False)
+                hbox.addWidget(b)
+            batch_check = QCheckBox('批量')
+            batch_check.setToolTip('将该参数绑定到目标列表（文件或粘贴），每行展开运行一次')
+            batch_check.toggled.connect(partial(self.toggle_batch, p, batch_btns))
+            hbox.addWidget(batch_check)
+            self.batch_checks[p] = batch_check
+
+            if targets is not None:
+                preview = QHBoxLayout()
+                preview.setContentsMargins(0, 0, 0, 0)
+                preview_label = QLabel()
+                preview_label.setStyleSheet("color: #666; font-weight: normal;")
+                preprocess_check = QCheckBox('预处理')
+                preprocess_check.setToolTip('去重、规范化并展开 CIDR 网段和端口范围，结果按文件内容缓存')
+                preprocess_check.toggled.connect(partial(self.scan_target, p))
+                preview.addWidget(preview_label, 1)
+                preview.addWidget(preprocess_check)
+                preview_row = QWidget()
+                preview_row.setLayout(preview)
+                preview_row.setVisible(False)
+                form.addRow('', preview_row)
+                self.previews[p] = (preview_row, preview_label, preprocess_check)
+                line.textChanged.connect(partial(self.scan_target, p))
+        
+        # 添加运行按钮
+        run_btn = QPushButton('运行命令')
+        run_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #2196F3;
+                font-weight: bold;
+                padding: 10px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #0b7dda;
+            }
+        """)
+        run_btn.setToolTip('点击开始在内置终端中运行命令')
+        run_btn.clicked.connect(self.accept)
+        
+        # 批量运行选项
+        batch_opts = QHBoxLayout()
+        batch_opts.addWidget(QLabel('批量并发数'))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 256)
+        self.workers_spin.setValue(workers)
+        batch_opts.addWidget(self.workers_spin)
+        batch_opts.addWidget(QLabel('失败重试次数'))
+        self.retries_spin = QSpinBox()
+        self.retries_spin.setRange(0, 10)
+        batch_opts.addWidget(self.retries_spin)
+        batch_opts.addStretch(1)
+        self.batch_opts = QWidget()
+        self.batch_opts.setLayout(batch_opts)
+        self.batch_opts.setEnabled(False)
+
+        # 任务队列选项，jobs 为可作为上游的任务，为 None 时不显示
+        self.bind_combos = {}
+        self.upstream_jobs = list(jobs or [])
+        self.upstream_list = None
+        queue_opts = QFormLayout()
+        self.priority_spin = QSpinBox()
+        self.priority_spin.setRange(-100, 100)
+        self.priority_spin.setToolTip('排队时优先级高的任务先运行')
+        queue_opts.addRow('优先级', self.priority_spin)
+        self.save_output_check = QCheckBox('保存输出，供后续任务的参数绑定')
+        queue_opts.addRow('', self.save_output_check)
+        # 相同命令和输入文件在有效期内运行过时直接显示上次的结果，reuse_minutes 为 None 时不显示
+        self.reuse_check = QCheckBox('复用相同运行的结果，有效期')
+        self.reuse_check.setToolTip('命令和输入文件内容都相同、且在有效期内成功运行过时，不再重新运行')
+        self.reuse_check.setChecked(bool(reuse_minutes))
+        self.reuse_spin = QSpinBox()
+        self.reuse_spin.setRange(1, 30 * 24 * 60)
+        self.reuse_spin.setSuffix(' 分钟')
+        self.reuse_spin.setValue(reuse_minutes or 24 * 60)
+        reuse_box = QHBoxLayout()
+        reuse_box.setContentsMargins(0, 0, 0, 0)
+        reuse_box.addWidget(self.reuse_check)
+        reuse_box.addWidget(self.reuse_spin)
+        reuse_box.addStretch(1)
+        reuse_row = QWidget()
+        reuse_row.setLayout(reuse_box)
+        reuse_row.setVisible(reuse_minutes is not None)
+        queue_opts.addRow('', reuse_row)
+        if self.upstream_jobs:
+            self.upstream_list = QListWidget()
+            self.upstream_list.setMaximumHeight(100)
+            for job in self.upstream_jobs:
+                item = QListWidgetItem(f'#{job.id} {job.name} [{job.state}]')
+                item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+                item.setCheckState(Qt.Unchecked)
+                self.upstream_list.addItem(item)
+            queue_opts.addRow('在这些任务成功后运行', self.upstream_list)
+            for p in self.params:
+                combo = QComboBox()
+                combo.addItem('手动填写', None)
+                for job in self.upstream_jobs:
+                    if job.output_path is not None:
+                        combo.addItem(f'#{job.id} {job.name} 的输出文件', (job, None))
+                    for name, value in job.values.items():
+                        value = '启动时确定' if name in job.bindings else value
+                        combo.addItem(f'#{job.id} {job.name} 的参数 {name}（{value}）', (job, name))
+                if combo.count() > 1:
+                    combo.currentIndexChanged.connect(partial(self.on_bind_changed, p))
+                    queue_opts.addRow(f'参数 {p} 取自', combo)
+                    self.bind_combos[p] = combo
+        self.queue_opts = QWidget()
+        self.queue_opts.setLayout(queue_opts)
+        self.queue_opts.setVisible(jobs is not None)
+
+        # 从历史重新运行时填入当时的参数值，批量参数先勾选再填入
+        for p, value in (values or {}).items():
+            if p in self.inputs:
+                if p in batch:
+                    self.batch_checks[p].setChecked(True)
+                self.inputs[p].setText(value)
+
+        layout.addLayout(form)
+        layout.addWidget(self.batch_opts)
+        layout.addWidget(self.queue_opts)
+        layout.addWidget(run_btn)
+        self.setLayout(layout)
+        self.resize(600, 400)
+
+    def scan_target(self, param, *args):
+        """参数值是文件时在后台统计行数，勾选预处理时生成预处理结果"""
+        row, label, check = self.previews[param]
+        old = self.scan_threads.pop(param, None)
+        if old is not None:
+            old.cancel()
+        self.processed.pop(param, None)
+        path = self.inputs[param].text()
+        if not path or not os.path.isfile(path):
+            row.setVisible(False)
+            return
+        row.setVisible(True)
+        options = self.preprocess_options if check.isChecked() else None
+        label.setText('正在预处理...' if options is not None else '正在统计行数...')
+        thread = TargetScanThread(self.targets, path, options, self)
+        thread.done.connect(partial(self.on_target_scanned, param, thread))
+        thread.failed.connect(partial(self.on_target_failed, param, thread))
+        thread.progress.connect(partial(self.on_target_progress, param, thread))
+        thread.finished.connect(thread.deleteLater)
+        self.scan_threads[param] = thread
+        thread.start()
+
+    def on_target_progress(self, param, thread, percent):
+        if self.scan_threads.get(param) is thread:
+            self.previews[param][1].setText(f'正在预处理... {percent}%')
+
+    def on_target_failed(self, param, thread, error):
+        if self.scan_threads.get(param) is thread:
+            del self.scan_threads[param]
+            self.previews[param][1].setText(f'读取失败: {error}')
+
+    def on_target_scanned(self, param, thread, result):
+        if self.scan_threads.get(param) is not thread:
+            return
+        del self.scan_threads[param]
+        label = self.previews[param][1]
+        if thread.options is None:
+            label.setText(f"{result['lines']:,} 行，{format_size(result['size'])}")
+            return
+        out_path, stats = result
+        self.processed[param] = (thread.path, out_path)
+        text = (f"{stats['source_lines']:,} 行 → {stats['lines']:,} 行（去掉重复 {stats['duplicates']:,}，"
+                f"展开 {stats['expanded']:,}）")
+        if stats['too_large']:
+            text += f"，{stats['too_large']} 个网段过大未展开"
+        label.setText(text)
+        label.setToolTip(out_path)
+
+    def value_of(self, param):
+        """参数的取值，预处理过的文件换成预处理结果"""
+        text = self.inputs[param].text()
+        source, out_path = self.processed.get(param, (None, None))
+        return out_path if source == text else text
+
+    def done(self, result):
+        # 关闭前停止后台统计，线程随对话框一起销毁；
+        # 包括改了路径后已取消但还没退出的旧线程
+        self.scan_threads.clear()
+        threads = self.findChildren(TargetScanThread)
+        for thread in threads:
+            thread.cancel()
+        for thread in threads:
+            thread.wait()
+        super().done(result)
+
+    def browse_file(self, line_edit):
+        path, _ = QFileDialog.getOpenFileName(self, '选择文件')
+        if path:
+            line_edit.setText(path)
+
+    def toggle_batch(self, param, buttons, checked):
+        line = self.inputs[param]
+        for b in buttons:
+            b.setVisible(checked)
+        if checked:
+            self.placeholders.setdefault(param, line.placeholderText())
+            line.setPlaceholderText('目标列表文件路径（每行一个值），或点击“粘贴”')
+        else:
+            self.pasted.pop(param, None)
+            line.clear()
+            line.setPlaceholderText(self.placeholders.get(param, ''))
+        batch = any(c.isChecked() for c in self.batch_checks.values())
+        self.batch_opts.setEnabled(batch)
+        # 队列选项只用于单次运行
+        self.queue_opts.setEnabled(not batch)
+
+    def on_bind_changed(self, param, index):
+        binding = self.bind_combos[param].itemData(index)
+        self.inputs[param].setEnabled(binding is None)
+        self.batch_checks[param].setEnabled(binding is None)
+        if binding is not None:
+            # 绑定的上游自动成为依赖
+            row = index_identical(self.upstream_jobs, binding[0])
+            self.upstream_list.item(row).setCheckState(Qt.Checked)
+
+    def paste_list(self, param):
+        dialog = QDialog(self)
+        dialog.setWindowTitle(f'参数 {param} 的目标列表')
+        dialog.resize(500, 400)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel('每行一个值，空行和 # 开头的行将被忽略：'))
+        edit = QPlainTextEdit('\n'.join(self.pasted.get(param, [])))
+        layout.addWidget(edit)
+        ok_btn = QPushButton('确定')
+        ok_btn.clicked.connect(dialog.accept)
+        layout.addWidget(ok_btn)
+        if dialog.exec_() == QDialog.Accepted:
+            lines = edit.toPlainText().splitlines()
+            self.pasted[param] = lines
+            self.inputs[param].setText(f'<已粘贴 {len(lines)} 行>')
+
+    def accept(self):
+        if any(t.options is not None for t in self.scan_threads.values()):
+            QMessageBox.warning(self, '提示', '正在预处理目标文件，请稍候')
+            return
+        skip = set(p for p, c in self.batch_checks.items() if c.isChecked())
+        if self.queue_opts.isEnabled():
+            skip.update(self.get_queue_options()['bindings'])
+        missing = [p for p in compile_template(self.template).missing(self.get_values()) if p not in skip]
+        if missing:
+            reply = QMessageBox.question(
+                self, '参数未填写', f"参数 {', '.join(missing)} 未填写，仍要运行吗？",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        super().accept()
+
+    def get_values(self):
+        return {p: self.value_of(p) for p in self.params}
+
+    def get_queue_options(self):
+        """返回 JobManager.submit 的队列选项：优先级、上游任务、参数绑定和是否保存输出"""
+        after = []
+        if self.upstream_list is not None:
+            after = [job for row, job in enumerate(self.upstream_jobs)
+                     if self.upstream_list.item(row).checkState() == Qt.Checked]
+        bindings = {}
+        for p, combo in self.bind_combos.items():
+            if combo.currentData() is not None:
+                bindings[p] = combo.currentData()
+        return {
+            'priority': self.priority_spin.value(),
+            'after': after,
+            'bindings': bindings,
+            'save_output': self.save_output_check.isChecked(),
+        }
+
+    def get_reuse_minutes(self):
+        """复用结果的有效期（分钟），不复用时返回 0"""
+        if not self.queue_opts.isEnabled() or not self.reuse_check.isChecked():
+            return 0
+        return self.reuse_spin.value()
+
+    def get_batch(self):
+        """返回批量参数的数据来源 {参数: ('file', 路径) 或 ('list', 行列表)}"""
+        batch = {}
+        for p, check in self.batch_checks.items():
+            if not check.isChecked():
+                continue
+            text = self.inputs[p].text()
+            if p in self.pasted and text == f'<已粘贴 {len(self.pasted[p])} 行>':
+                batch[p] = ('list', self.pasted[p])
+            else:
+                batch[p] = ('file', self.value_of(p))
+        return batch
+
+# 节点类型 -> 子节点所在的键和子节点类型
+CHILD_KEYS = {'root': 'categories', 'category': 'tools', 'tool': 'commands'}
+CHILD_KINDS = {'root': 'category', 'category': 'tool', 'tool': 'command'}
+
+
+def index_identical(items, obj):
+    """按对象身份（而不是相等）查找下标"""
+    for i, item in enumerate(items):
+        if item is obj:
+            return i
+    raise ValueError('对象不在列表中')
+
+
+class CatalogNode:
+    __slots__ = ('id', 'kind', 'data', 'parent', 'row', 'children', 'built', 'fetched')
+
+    def __init__(self, node_id, kind, data, parent, row):
+        self.id = node_id
+        self.kind = kind
+        self.data = data
+        self.parent = parent
+        # 在父节点中的行号，与父节点数据列表中的下标一致
+        self.row = row
+        self.children = []
+        # built: 子节点对象已创建；fetched: 子节点已加入视图
+        self.built = False
+        self.fetched = False
+
+    def path(self):
+        """从分类到当前节点的名称路径"""
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.data['name'])
+            node = node.parent
+        return tuple(reversed(names))
+
+    def rows(self):
+        """从分类到当前节点的行号路径，也是节点在搜索索引中的键"""
+        rows = []
+        node = self
+        while node.parent is not None:
+            rows.append(node.row)
+            node = node.parent
+        return tuple(reversed(rows))
+
+    def config_path(self):
+        """节点在配置文档中的路径，例如 ['categories', 0, 'tools', 2]"""
+        path = []
+        node = self
+        while node.parent is not None:
+            path[:0] = [CHILD_KEYS[node.parent.kind], node.row]
+            node = node.parent
+        return path
+
+
+class CatalogModel(QAbstractItemModel):
+    """命令目录模型
+
+    子节点对象在父节点展开（或定位到其中的节点）时才创建并加入视图，
+    显示文本和提示在视图请求时才生成。搜索索引不使用节点，直接从配置数据
+    生成，以行号路径为键，选中搜索结果时才用 find_rows 创建沿途的节点。
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.next_id = 1
+        self.root = self.make_node('root', {'categories': []}, None, 0)
+
+    def make_node(self, kind, data, parent, row):
+        node = CatalogNode(self.next_id, kind, data, parent, row)
+        self.next_id += 1
+        return node
+
+    def child_data(self, node):
+        key = CHILD_KEYS.get(node.kind)
+        return node.data.get(key, []) if key else []
+
+    def build_children(self, node):
+        """创建子节点对象（不加入视图），返回子节点列表"""
+        if not node.built:
+            kind = CHILD_KINDS.get(node.kind)
+            node.children = [self.make_node(kind, data, node, row)
+                             for row, data in enumerate(self.child_data(node))]
+            node.built = True
+        return node.children
+
+    def populate(self, node):
+        self.build_children(node)
+        node.fetched = True
+
+    def set_catalog(self, config):
+        self.beginResetModel()
+        self.root = self.make_node('root', config, None, 0)
+        self.populate(self.root)
+        self.endResetModel()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index_for(self, node):
+        if node.parent is None:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def ensure_fetched(self, node):
+        index = self.index_for(node)
+        if self.canFetchMore(index):
+            self.fetchMore(index)
+
+    def find_rows(self, rows):
+        """按行号路径找到节点，沿途的节点加入视图；路径已不存在时返回 None"""
+        node = self.root
+        for row in rows:
+            self.ensure_fetched(node)
+            if not 0 <= row < len(node.children):
+                return None
+            node = node.children[row]
+        return node
+
+    def data_path(self, rows):
+        """行号路径上各级的配置数据（分类、工具、命令），不创建节点"""
+        data, kind = self.root.data, self.root.kind
+        items = []
+        for row in rows:
+            data = data[CHILD_KEYS[kind]][row]
+            kind = CHILD_KINDS[kind]
+            items.append(data)
+        return items
+
+    def find_path(self, names):
+        node = self.root
+        for name in names:
+            self.ensure_fetched(node)
+            node = next((child for child in node.children if child.data['name'] == name), None)
+            if node is None:
+                return None
+        return node
+
+    def append_child(self, parent, data):
+        """data 已追加到父节点的数据列表后调用，返回新节点"""
+        if not parent.built:
+            # 创建子节点时已经包括新追加的数据
+            node = self.build_children(parent)[-1]
+        else:
+            node = self.make_node(CHILD_KINDS[parent.kind], data, parent, len(parent.children))
+            if parent.fetched:
+                self.beginInsertRows(self.index_for(parent), node.row, node.row)
+                parent.children.append(node)
+                self.endInsertRows()
+                return node
+            parent.children.append(node)
+        # 未展开的节点只需刷新展开箭头
+        index = self.index_for(parent)
+        if index.isValid():
+            self.dataChanged.emit(index, index)
+        return node
+
+    def remove_node(self, node):
+        """node 已从父节点的数据列表中删除后调用"""
+        parent = node.parent
+        row = node.row
+        if parent.fetched:
+            self.beginRemoveRows(self.index_for(parent), row, row)
+        parent.children.pop(row)
+        for sibling in parent.children[row:]:
+            sibling.row -= 1
+        if parent.fetched:
+            self.endRemoveRows()
+
+    def node_changed(self, node):
+        index = self.index_for(node)
+        self.dataChanged.emit(index, index)
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node(parent)
+        if column != 0 or not node.fetched or not 0 <= row < len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_for(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self.node(parent)
+        return len(node.children) if node.fetched else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node(parent)
+        if node.fetched:
+            return bool(node.children)
+        return bool(self.child_data(node))
+
+    def canFetchMore(self, parent):
+        node = self.node(parent)
+        return not node.fetched and bool(self.child_data(node))
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        count = len(self.child_data(node))
+        if node.fetched or not count:
+            return
+        self.beginInsertRows(parent, 0, count - 1)
+        self.populate(node)
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        data = node.data
+        if role == Qt.DisplayRole:
+            if node.kind == 'category':
+                return f"📁 {data['name']}"
+            if node.kind == 'tool':
+                return f"🛠️ {data['name']}"
+            return f"▶ {data['name']}"
+        if role == Qt.ToolTipRole:
+            if node.kind == 'category':
+                return f"分类: {data['name']}"
+            if node.kind == 'tool':
+                return f"工具: {data['name']}\n描述: {data.get('description', '无描述')}"
+            return f"命令: {data['name']}\n模板: {data['template']}"
+        if role == Qt.UserRole:
+            return node.kind, node.id
+        return None
+
+
+# 任务状态
+JOB_WAITING = '等待上游'
+JOB_QUEUED = '排队中'
+JOB_RUNNING = '运行中'
+JOB_FINISHED = '已完成'
+JOB_FAILED = '失败'
+JOB_STOPPED = '已停止'
+JOB_SKIPPED = '已跳过'
+JOB_DONE_STATES = (JOB_FINISHED, JOB_FAILED, JOB_STOPPED, JOB_SKIPPED)
+
+
+class Job(QObject):
+    """一次命令运行，独占一个 QProcess"""
+    output = pyqtSignal(bytes)
+    state_changed = pyqtSignal(object)
+
+    # 发出 terminate 后等待多久再强制 kill(ms)
+    KILL_TIMEOUT = 3000
+
+    def __init__(self, job_id, name, command, parent=None, monitor=None):
+        super().__init__(parent)
+        self.id = job_id
+        self.name = name
+        self.command = command
+        self.state = JOB_QUEUED
+        self.exit_code = None
+        self.start_time = None
+        self.end_time = None
+        self.process = None
+        self.stop_requested = False
+        # 资源占用，由 JobMonitor 采样填写
+        self.monitor = monitor
+        self.pid = None
+        self.cpu_user = None
+        self.cpu_sys = None
+        self.peak_rss = None
+        # 队列和流水线：优先级、上游任务、参数值及绑定到上游的参数
+        self.priority = 0
+        self.depends = []
+        self.template = None
+        self.values = {}
+        self.bindings = {}
+        self.quote = True
+        # 设置后输出同时写入该文件，供下游任务作为参数使用
+        self.output_path = None
+        self.output_file = None
+        # 命令配置中的结果提取规则
+        self.extract_rules = None
+
+    @property
+    def is_done(self):
+        return self.state in JOB_DONE_STATES
+
+    def start(self):
+        if self.output_path is not None:
+            try:
+                os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
+                self.output_file = open(self.output_path, 'wb')
+            except OSError as e:
+                self.output.emit(f"无法保存输出到 {self.output_path}: {e}\n".encode('utf-8'))
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
+        self.process.readyRead.connect(self.on_ready_read)
+        self.process.started.connect(self.on_started)
+        self.process.finished.connect(self.on_finished)
+        self.process.errorOccurred.connect(self.on_error)
+        self.start_time = time.time()
+        self.set_state(JOB_RUNNING)
+        program, args = job_shell_command(self.command)
+        self.process.start(program, args)
+
+    def stop(self):
+        """停止任务，排队中的直接取消，运行中的先 terminate，超时后 kill"""
+        if self.state in (JOB_QUEUED, JOB_WAITING):
+            self.end_time = time.time()
+            self.set_state(JOB_STOPPED)
+        elif self.state == JOB_RUNNING:
+            self.stop_requested = True
+            self.process.terminate()
+            QTimer.singleShot(self.KILL_TIMEOUT, self.kill_if_running)
+
+    def kill_if_running(self):
+        if self.process is not None and self.process.state() != QProcess.NotRunning:
+            self.process.kill()
+
+    def wait(self):
+        """等待已停止的进程退出，超时后 kill，退出前剩余的输出仍会发出"""
+        if self.process is None or self.process.state() == QProcess.NotRunning:
+            return
+        if not self.process.waitForFinished(self.KILL_TIMEOUT):
+            self.process.kill()
+            self.process.waitForFinished()
+
+    def on_started(self):
+        self.pid = self.process.processId()
+        if self.monitor is not None:
+            self.monitor.watch(self)
+
+    def on_ready_read(self):
+        data = bytes(self.process.readAll())
+        if self.output_file is not None and data:
+            try:
+                self.output_file.write(data)
+            except OSError as e:
+                self.close_output_file()
+                self.output.emit(f"\n写入输出文件失败: {e}\n".encode('utf-8'))
+        self.output.emit(data)
+
+    def close_output_file(self):
+        if self.output_file is not None:
+            try:
+                self.output_file.close()
+            except OSError:
+                pass
+            self.output_file = None
+
+    def on_finished(self, exit_code, exit_status):
+        self.on_ready_read()
+        self.exit_code = exit_code
+        self.end_time = time.time()
+        if self.stop_requested:
+            self.set_state(JOB_STOPPED)
+        elif exit_status == QProcess.NormalExit and exit_code == 0:
+            self.set_state(JOB_FINISHED)
+        else:
+            self.set_state(JOB_FAILED)
+
+    def on_error(self, error):
+        # 启动失败时不会再收到 finished 信号
+        if error == QProcess.FailedToStart and not self.is_done:
+            self.output.emit(f"无法启动进程: {self.process.errorString()}\n".encode('utf-8'))
+            self.end_time = time.time()
+            self.set_state(JOB_FAILED)
+
+    def set_state(self, state):
+        self.state = state
+        if self.is_done:
+            # 下游任务在 state_changed 中启动，输出文件要先关闭
+            self.close_output_file()
+            if self.monitor is not None:
+                self.monitor.finish(self)
+        self.state_changed.emit(self)
+
+
+class JobMonitor(QObject):
+    """采样运行中任务的 CPU 时间和内存峰值，任务结束后记入历史
+
+    任务运行期间没有其他任务并行时，CPU 时间取 getrusage(RUSAGE_CHILDREN)
+    在任务前后的差值，包含最后一次采样之后的部分；有并行任务时使用 /proc 采样值。
+    """
+    recorded = pyqtSignal(dict)
+
+    SAMPLE_INTERVAL = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.running = {}  # 任务 -> [开始时的 rusage, 是否与其他任务重叠]
+        self.history = []
+        self.next_seq = 1
+        self.use_proc = proc_available()
+        self.timer = QTimer(self)
+        self.timer.setInterval(self.SAMPLE_INTERVAL)
+        self.timer.timeout.connect(self.sample)
+
+    def watch(self, job):
+        if self.running:
+            for state in self.running.values():
+                state[1] = True
+        self.running[job] = [children_rusage(), bool(self.running)]
+        if self.use_proc and not self.timer.isActive():
+            self.timer.start()
+        self.sample()
+
+    def sample(self):
+        if not self.use_proc:
+            return
+        by_pid = {job.pid: job for job in self.running if job.pid}
+        for pid, (user, system, rss, peak) in sample_trees(by_pid).items():
+            job = by_pid[pid]
+            job.cpu_user, job.cpu_sys = user, system
+            job.peak_rss = max(job.peak_rss or 0, rss, peak)
+
+    def finish(self, job):
+        state = self.running.pop(job, None)
+        if not self.running:
+            self.timer.stop()
+        if state is not None:
+            before, overlapped = state
+            after = children_rusage()
+            if before is not None and after is not None and not overlapped:
+                job.cpu_user = after[0] - before[0]
+                job.cpu_sys = after[1] - before[1]
+                # 最大 RSS 是所有子进程的历史最大值，只有本任务刷新了它时才可信
+                if after[2] > before[2]:
+                    job.peak_rss = max(job.peak_rss or 0, after[2])
+        record = {
+            'seq': self.next_seq,
+            'name': job.name,
+            'command': job.command,
+            'state': job.state,
+            'exit_code': job.exit_code,
+            'start': job.start_time,
+            'end': job.end_time,
+            'duration': (job.end_time - job.start_time
+                         if job.start_time is not None and job.end_time is not None else None),
+            'cpu_user': job.cpu_user,
+            'cpu_sys': job.cpu_sys,
+            'peak_rss': job.peak_rss,
+        }
+        self.next_seq += 1
+        self.history.append(record)
+        self.recorded.emit(record)
+
+
+class JobManager(QObject):
+    """任务调度：按优先级排队（同优先级先提交先运行），同时运行的任务数不超过 max_parallel
+
+    任务可以依赖其他任务，所有上游成功完成后才进入队列，任一上游失败或停止则跳过；
+    互不依赖的分支在并发上限内同时运行。
+    """
+    job_added = pyqtSignal(object)
+    job_changed = pyqtSignal(object)
+
+    def __init__(self, max_parallel, parent=None, monitor=None):
+        super().__init__(parent)
+        self.max_parallel = max_parallel
+        self.monitor = monitor
+        self.jobs = {}
+        # (-优先级, 任务号, 任务)
+        self.queue = []
+        # 上游任务 -> 依赖它的任务
+        self.dependents = {}
+        self.next_id = 1
+
+    def submit(self, name, command, priority=0, after=(), template=None, values=None,
+               bindings=None, quote=True, save_output=False, extract_rules=None):
+        """提交任务
+
+        after 为上游任务列表；bindings 为 {参数: (上游任务, 来源)}，来源为 None 时取上游
+        保存的输出文件路径，否则取上游同名参数的值，任务启动时才按 template 渲染命令。
+        """
+        bindings = bindings or {}
+        for upstream, source in bindings.values():
+            if source is None and upstream.output_path is None:
+                raise ValueError(f'任务 #{upstream.id} 没有保存输出，无法绑定')
+        job = Job(self.next_id, name, command, self, self.monitor)
+        self.next_id += 1
+        job.priority = priority
+        job.template = template
+        job.values = dict(values or {})
+        job.bindings = bindings
+        job.quote = quote
+        job.extract_rules = extract_rules
+        # 绑定的上游自动成为依赖
+        job.depends = list(after)
+        for upstream, _ in bindings.values():
+            if upstream not in job.depends:
+                job.depends.append(upstream)
+        if save_output:
+            job.output_path = os.path.abspath(os.path.join(
+                PIPELINE_DIR, f"{safe_name(name)}-{job.id}-{time.strftime('%Y%m%d-%H%M%S')}.txt"
+            ))
+        job.state_changed.connect(self.on_job_state)
+        self.jobs[job.id] = job
+
+        waiting = [u for u in job.depends if u.state != JOB_FINISHED]
+        if any(u.is_done for u in waiting):
+            # 上游已经失败或停止
+            self.job_added.emit(job)
+            job.set_state(JOB_SKIPPED)
+            return job
+        if waiting:
+            job.state = JOB_WAITING
+            for upstream in waiting:
+                self.dependents.setdefault(upstream, []).append(job)
+            self.job_added.emit(job)
+            return job
+        heapq.heappush(self.queue, (-priority, job.id, job))
+        self.job_added.emit(job)
+        self.schedule()
+        return job
+
+    def running_count(self):
+        return sum(1 for job in self.jobs.values() if job.state == JOB_RUNNING)
+
+    def queued_count(self):
+        return sum(1 for job in self.jobs.values() if job.state in (JOB_QUEUED, JOB_WAITING))
+
+    def set_max_parallel(self, max_parallel):
+        self.max_parallel = max_parallel
+        self.schedule()
+
+    def schedule(self):
+        running = self.running_count()
+        while self.queue and running < self.max_parallel:
+            job = heapq.heappop(self.queue)[2]
+            if job.state != JOB_QUEUED:
+                continue
+            self.launch(job)
+            running += 1
+
+    def launch(self, job):
+        if job.bindings:
+            values = dict(job.values)
+            for param, (upstream, source) in job.bindings.items():
+                values[param] = upstream.output_path if source is None else upstream.values.get(source, '')
+            job.values = values
+            job.command = compile_template(job.template).render(values, job.quote)
+        job.start()
+
+    def stop_all(self):
+        for job in list(self.jobs.values()):
+            job.stop()
+
+    def on_job_state(self, job):
+        self.job_changed.emit(job)
+        if job.is_done:
+            self.release(job)
+            self.schedule()
+
+    def release(self, upstream):
+        """上游结束后，依赖全部满足的任务进入队列，上游未成功的任务跳过"""
+        for job in self.dependents.pop(upstream, ()):
+            if job.state != JOB_WAITING:
+                continue
+            if upstream.state != JOB_FINISHED:
+                job.set_state(JOB_SKIPPED)
+            elif all(u.state == JOB_FINISHED for u in job.depends):
+                job.state = JOB_QUEUED
+                heapq.heappush(self.queue, (-job.priority, job.id, job))
+                self.job_changed.emit(job)
+
+
+class JobView(QWidget):
+    """单个任务的输出页：独立的输出缓冲、状态显示和停止按钮"""
+    def __init__(self, job, config, parent=None):
+        super().__init__(parent)
+        self.job = job
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 5, 0, 0)
+
+        header = QHBoxLayout()
+        self.state_label = QLabel()
+        header.addWidget(self.state_label, 1)
+        self.stop_btn = QPushButton('停止')
+        self.stop_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #f44336;
+                padding: 4px 12px;
+            }
+            QPushButton:hover {
+                background-color: #d32f2f;
+            }
+        """)
+        self.stop_btn.clicked.connect(job.stop)
+        header.addWidget(self.stop_btn)
+        # 结果缓存中有上一次运行时显示
+        self.diff_btn = QPushButton('与上次对比')
+        self.diff_btn.setVisible(False)
+        header.addWidget(self.diff_btn)
+        layout.addLayout(header)
+
+        self.output_view = QPlainTextEdit()
+        self.output_view.setReadOnly(True)
+        self.output_view.setFont(QFont("Consolas", 12))
+        self.output_view.setMaximumBlockCount(
+            config.get('scrollback_lines', DEFAULT_SETTINGS['scrollback_lines'])
+        )
+        self.output_view.setPlainText(f"$ {job.command}\n")
+        self.results = None
+        if job.extract_rules:
+            self.results = ResultsView(job.extract_rules, job.name)
+            job.output.connect(self.results.feed)
+            splitter = QSplitter(Qt.Vertical)
+            splitter.addWidget(self.output_view)
+            splitter.addWidget(self.results)
+            layout.addWidget(splitter)
+        else:
+            layout.addWidget(self.output_view)
+
+        self.output = OutputPipeline(
+            self.output_view,
+            config.get('output_flush_interval', DEFAULT_SETTINGS['output_flush_interval']),
+            config.get('output_max_batch', DEFAULT_SETTINGS['output_max_batch']),
+            parent=self
+        )
+        job.output.connect(self.output.feed)
+        job.state_changed.connect(self.update_state)
+        self.update_state(job)
+
+    def tab_title(self):
+        return f"#{self.job.id} {self.job.name} [{self.job.state}]"
+
+    def update_state(self, job):
+        text = f"状态: {job.state}"
+        if job.priority:
+            text += f"  优先级: {job.priority}"
+        if job.depends:
+            text += f"  上游: {', '.join(f'#{u.id}' for u in job.depends)}"
+        if job.state == JOB_RUNNING and job.bindings:
+            # 绑定上游的参数在启动时才确定
+            self.output.write(f"$ {job.command}\n".encode('utf-8'))
+        if job.is_done:
+            if job.exit_code is not None:
+                text += f"  退出码: {job.exit_code}"
+            if job.start_time is not None:
+                text += f"  用时: {job.end_time - job.start_time:.1f}s"
+            self.output.write(f"\n[{text}]\n".encode('utf-8'))
+            if self.results is not None:
+                self.results.finish()
+        self.state_label.setText(text)
+        self.stop_btn.setEnabled(not job.is_done)
+
+    def enable_diff(self, callback):
+        self.diff_btn.clicked.connect(callback)
+        self.diff_btn.setVisible(True)
+
+
+class CachedRunView(QWidget):
+    """直接复用的缓存结果：显示保存的输出，可以重新运行或与上一次对比"""
+    # 只显示输出的最后这么多字节，更早的部分在缓存文件中
+    MAX_SHOWN = 8 * 1024 * 1024
+
+    def __init__(self, name, command, run, path, config, extract_rules=None, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.path = path
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 5, 0, 0)
+
+        header = QHBoxLayout()
+        finished = time.strftime('%Y-%m-%d %H:%M', time.localtime(run['time']))
+        header.addWidget(QLabel(f"复用 {finished} 的运行结果（退出码 {run['exit_code']}）"), 1)
+        self.rerun_btn = QPushButton('重新运行')
+        header.addWidget(self.rerun_btn)
+        self.diff_btn = QPushButton('与上次对比')
+        self.diff_btn.setVisible(False)
+        header.addWidget(self.diff_btn)
+        layout.addLayout(header)
+
+        self.output_view = QPlainTextEdit()
+        self.output_view.setReadOnly(True)
+        self.output_view.setFont(QFont("Consolas", 12))
+        self.output_view.setMaximumBlockCount(
+            config.get('scrollback_lines', DEFAULT_SETTINGS['scrollback_lines'])
+        )
+        self.output_view.setPlainText(f"$ {command}\n")
+        self.rules = extract_rules
+        self.results = ResultsView(extract_rules, name) if extract_rules else None
+        if self.results is not None:
+            splitter = QSplitter(Qt.Vertical)
+            splitter.addWidget(self.output_view)
+            splitter.addWidget(self.results)
+            layout.addWidget(splitter)
+        else:
+            layout.addWidget(self.output_view)
+        self.output = OutputPipeline(
+            self.output_view,
+            config.get('output_flush_interval', DEFAULT_SETTINGS['output_flush_interval']),
+            config.get('output_max_batch', DEFAULT_SETTINGS['output_max_batch']),
+            parent=self
+        )
+        self.load()
+
+    def tab_title(self):
+        return f"{self.name} [缓存]"
+
+    def load(self):
+        """在后台线程中读取缓存的输出，输出页只显示最后 MAX_SHOWN 字节"""
+        self.loader = CachedRunLoader(self.path, self.MAX_SHOWN, self.rules, self)
+        self.loader.chunk.connect(self.output.feed)
+        self.loader.failed.connect(
+            lambda error: self.output.write(f"\n读取缓存的输出失败: {error}\n".encode('utf-8'))
+        )
+        self.loader.done.connect(self.on_loaded)
+        self.loader.start()
+
+    def on_loaded(self, extractor):
+        if self.results is not None and extractor is not None:
+            self.results.load(extractor)
+
+    def cancel(self):
+        self.loader.cancel()
+        self.loader.wait()
+
+    def enable_diff(self, callback):
+        self.diff_btn.clicked.connect(callback)
+        self.diff_btn.setVisible(True)
+
+
+class CachedRunLoader(QThread):
+    """按块读取缓存的输出：最后 max_shown 字节分块发回界面，有提取规则时处理完整输出"""
+    chunk = pyqtSignal(bytes)
+    # 处理完成的 Extractor，没有提取规则时为 None
+    done = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path, max_shown, rules=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.max_shown = max_shown
+        self.rules = rules
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        extractor = Extractor(self.rules) if self.rules else None
+        try:
+            size = os.path.getsize(self.path)
+            with open(self.path, 'rb') as f:
+                skip = max(0, size - self.max_shown)
+                if skip:
+                    self.chunk.emit(f"[只显示最后 {format_size(self.max_shown)}，完整输出: {self.path}]\n".encode('utf-8'))
+                done = 0
+                while not self.cancel_event.is_set():
+                    data = f.read(self.CHUNK_SIZE)
+                    if not data:
+                        break
+                    if extractor is not None:
+                        extractor.feed(data)
+                    if done + len(data) > skip:
+                        self.chunk.emit(data[max(0, skip - done):])
+                    done += len(data)
+        except OSError as e:
+            self.failed.emit(str(e))
+            return
+        if self.cancel_event.is_set():
+            return
+        if extractor is not None:
+            extractor.finish()
+        self.done.emit(extractor)
+
+
+class ResultDiffThread(QThread):
+    """在后台线程中对比两次运行的输出"""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, old_path, new_path, parent=None):
+        super().__init__(parent)
+        self.old_path = old_path
+        self.new_path = new_path
+
+    def run(self):
+        try:
+            diff = diff_outputs(self.old_path, self.new_path)
+        except OSError as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(diff)
+
+
+class RunKeyThread(QThread):
+    """在后台线程中计算输入文件的内容摘要，得到运行结果的缓存键"""
+    done = pyqtSignal(str)
+
+    def __init__(self, targets, command, files, parent=None):
+        super().__init__(parent)
+        self.targets = targets
+        self.command = command
+        # {参数: 文件路径}
+        self.files = files
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        inputs = {}
+        for param, path in self.files.items():
+            try:
+                inputs[param] = self.targets.inspect(path, self.cancel_event)['digest']
+            except PreprocessCancelled:
+                return
+            except OSError:
+                continue
+        self.done.emit(run_key(self.command, inputs))
+
+
+class RunDiffDialog(QDialog):
+    """两次运行之间新增和消失的输出行，有提取规则时还包括提取结果"""
+    def __init__(self, title, diff, findings=None, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.resize(800, 500)
+        layout = QVBoxLayout(self)
+        tabs = QTabWidget()
+        if findings is not None:
+            added, removed = findings
+            tabs.addTab(self.text_view([' | '.join(f) for f in added]), f'新增结果 ({len(added)})')
+            tabs.addTab(self.text_view([' | '.join(f) for f in removed]), f'消失结果 ({len(removed)})')
+        for key, label in (('added', '新增行'), ('removed', '消失行')):
+            lines = diff[key]
+            count = diff[key + '_count']
+            if count > len(lines):
+                lines = lines + [f'... 另有 {count - len(lines)} 行未列出']
+            tabs.addTab(self.text_view(lines), f'{label} ({count})')
+        layout.addWidget(tabs)
+        close_btn = QPushButton('关闭')
+        close_btn.clicked.connect(self.accept)
+        layout.addWidget(close_btn)
+
+    @staticmethod
+    def text_view(lines):
+        view = QPlainTextEdit('\n'.join(lines))
+        view.setReadOnly(True)
+        view.setFont(QFont("Consolas", 11))
+        return view
+
+
+BATCH_RETRY = '等待重试'
+
+
+class BatchRun(QObject):
+    """批量运行：同一模板按目标列表展开，由固定大小的进程池执行"""
+    output = pyqtSignal(bytes)
+    target_changed = pyqtSignal(int)
+    finished = pyqtSignal()
+
+    def __init__(self, name, targets, workers, retries, parent=None, monitor=None):
+        super().__init__(parent)
+        self.name = name
+        self.monitor = monitor
+        self.workers = workers
+        self.retries = retries
+        # 每个目标: 说明、命令、状态、尝试次数、退出码
+        self.targets = [
+            {'label': label, 'command': command, 'state': JOB_QUEUED, 'attempts': 0, 'exit_code': None}
+            for label, command in targets
+        ]
+        self.pending = deque(range(len(self.targets)))
+        self.active = {}
+        self.carry = {}
+        self.done = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.stopped = False
+        self.start_time = None
+        self.end_time = None
+
+    @property
+    def is_done(self):
+        return self.end_time is not None
+
+    def start(self):
+        self.start_time = time.time()
+        self.fill()
+
+    def fill(self):
+        while self.pending and len(self.active) < self.workers and not self.stopped:
+            self.launch(self.pending.popleft())
+        if not self.active and not self.pending and not self.is_done:
+            self.end_time = time.time()
+            self.finished.emit()
+
+    def launch(self, index):
+        target = self.targets[index]
+        target['attempts'] += 1
+        job = Job(index + 1, f"{self.name} [{target['label']}]", target['command'], self, self.monitor)
+        job.output.connect(partial(self.on_job_output, index))
+        job.state_changed.connect(partial(self.on_job_state, index))
+        self.active[index] = job
+        job.start()
+
+    def on_job_output(self, index, data):
+        # 按行加上目标前缀，未结束的行留到下次
+        data = self.carry.pop(index, b'') + data
+        lines = data.split(b'\n')
+        if lines[-1]:
+            self.carry[index] = lines[-1]
+        prefix = f"[{self.targets[index]['label']}] ".encode('utf-8')
+        if len(lines) > 1:
+            self.output.emit(b''.join(prefix + line + b'\n' for line in lines[:-1]))
+
+    def on_job_state(self, index, job):
+        target = self.targets[index]
+        if not job.is_done:
+            target['state'] = job.state
+            self.target_changed.emit(index)
+            return
+
+        rest = self.carry.pop(index, b'')
+        if rest:
+            self.output.emit(f"[{target['label']}] ".encode('utf-8') + rest + b'\n')
+        self.active.pop(index, None)
+        job.deleteLater()
+        target['exit_code'] = job.exit_code
+        if job.state == JOB_FAILED and target['attempts'] <= self.retries and not self.stopped:
+            target['state'] = BATCH_RETRY
+            self.pending.append(index)
+        else:
+            target['state'] = job.state
+            self.done += 1
+            if job.state == JOB_FINISHED:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+        self.target_changed.emit(index)
+        self.fill()
+
+    def stop(self):
+        """取消排队中的目标并停止正在运行的进程"""
+        self.stopped = True
+        while self.pending:
+            index = self.pending.popleft()
+            self.targets[index]['state'] = JOB_STOPPED
+            self.done += 1
+            self.failed += 1
+            self.target_changed.emit(index)
+        for job in list(self.active.values()):
+            job.stop()
+        self.fill()
+
+    def eta(self):
+        """预计剩余秒数，尚无完成目标时返回 None"""
+        if not self.done or self.start_time is None:
+            return None
+        elapsed = time.time() - self.start_time
+        return elapsed / self.done * (len(self.targets) - self.done)
+
+    def throughput(self):
+        """每分钟完成的目标数"""
+        if self.start_time is None:
+            return 0.0
+        elapsed = (self.end_time or time.time()) - self.start_time
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+
+class BatchView(QWidget):
+    """批量运行页：目标状态表、进度和速度统计、合并输出"""
+    def __init__(self, batch, config, parent=None, extract_rules=None):
+        super().__init__(parent)
+        self.batch = batch
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 5, 0, 0)
+
+        header = QHBoxLayout()
+        self.progress = QProgressBar()
+        self.progress.setRange(0, max(len(batch.targets), 1))
+        header.addWidget(self.progress, 1)
+        self.stop_btn = QPushButton('停止')
+        self.stop_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #f44336;
+                padding: 4px 12px;
+            }
+            QPushButton:hover {
+                background-color: #d32f2f;
+            }
+        """)
+        self.stop_btn.clicked.connect(batch.stop)
+        header.addWidget(self.stop_btn)
+        layout.addLayout(header)
+
+        self.stats_label = QLabel()
+        layout.addWidget(self.stats_label)
+
+        splitter = QSplitter(Qt.Vertical)
+        self.table = QTableWidget(len(batch.targets), 4)
+        self.table.setHorizontalHeaderLabels(['目标', '状态', '尝试次数', '退出码'])
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        for row, target in enumerate(batch.targets):
+            item = QTableWidgetItem(target['label'])
+            item.setToolTip(target['command'])
+            self.table.setItem(row, 0, item)
+            for col in range(1, 4):
+                self.table.setItem(row, col, QTableWidgetItem())
+            self.update_row(row)
+        splitter.addWidget(self.table)
+
+        self.output_view = QPlainTextEdit()
+        self.output_view.setReadOnly(True)
+        self.output_view.setFont(QFont("Consolas", 12))
+        self.output_view.setMaximumBlockCount(
+            config.get('scrollback_lines', DEFAULT_SETTINGS['scrollback_lines'])
+        )
+        splitter.addWidget(self.output_view)
+        self.results = None
+        if extract_rules:
+            self.results = ResultsView(extract_rules, batch.name)
+            batch.output.connect(self.results.feed)
+            batch.finished.connect(self.results.finish)
+            splitter.addWidget(self.results)
+        layout.addWidget(splitter)
+
+        self.output = OutputPipeline(
+            self.output_view,
+            config.get('output_flush_interval', DEFAULT_SETTINGS['output_flush_interval']),
+            config.get('output_max_batch', DEFAULT_SETTINGS['output_max_batch']),
+            parent=self
+        )
+        batch.output.connect(self.output.feed)
+        batch.target_changed.connect(self.on_target_changed)
+        batch.finished.connect(self.update_stats)
+        self.update_stats()
+
+    def tab_title(self):
+        return f"批量 {self.batch.name} [{self.batch.done}/{len(self.batch.targets)}]"
+
+    def on_target_changed(self, row):
+        self.update_row(row)
+        self.update_stats()
+
+    def update_row(self, row):
+        target = self.batch.targets[row]
+        self.table.item(row, 1).setText(target['state'])
+        self.table.item(row, 2).setText(str(target['attempts']))
+        self.table.item(row, 3).setText('' if target['exit_code'] is None else str(target['exit_code']))
+
+    def update_stats(self):
+        batch = self.batch
+        self.progress.setValue(batch.done)
+        eta = batch.eta()
+        if batch.is_done:
+            eta_text = f"总用时 {batch.end_time - batch.start_time:.1f}s"
+        elif eta is None:
+            eta_text = "剩余时间 计算中"
+        else:
+            eta_text = f"剩余时间 {int(eta // 60)}分{int(eta % 60)}秒"
+        self.stats_label.setText(
+            f"已完成 {batch.done}/{len(batch.targets)}  成功 {batch.succeeded}  失败 {batch.failed}  "
+            f"运行中 {len(batch.active)}  速度 {batch.throughput():.1f} 目标/分钟  {eta_text}"
+        )
+        self.stop_btn.setEnabled(not batch.is_done)
+
+
+class JobHistoryView(QWidget):
+    """任务历史：每次运行的用时、退出码和资源占用，可排序并导出"""
+    COLUMNS = [
+        ('seq', '序号'), ('name', '名称'), ('state', '状态'), ('exit_code', '退出码'),
+        ('start', '开始时间'), ('duration', '用时(s)'), ('cpu_user', '用户CPU(s)'),
+        ('cpu_sys', '系统CPU(s)'), ('peak_rss', '内存峰值(MB)'), ('command', '命令'),
+    ]
+
+    def __init__(self, monitor, parent=None):
+        super().__init__(parent)
+        self.monitor = monitor
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 5, 0, 0)
+        header = QHBoxLayout()
+        self.summary_label = QLabel()
+        header.addWidget(self.summary_label, 1)
+        csv_btn = QPushButton('导出 CSV')
+        csv_btn.clicked.connect(lambda: self.export('csv'))
+        header.addWidget(csv_btn)
+        json_btn = QPushButton('导出 JSON')
+        json_btn.clicked.connect(lambda: self.export('json'))
+        header.addWidget(json_btn)
+        layout.addLayout(header)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels([title for _, title in self.COLUMNS])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        for record in monitor.history:
+            self.add_record(record)
+        self.table.setSortingEnabled(True)
+        monitor.recorded.connect(self.add_record)
+
+    def add_record(self, record):
+        # 插入时关闭排序，否则新行会在填充过程中被移动
+        sorting = self.table.isSortingEnabled()
+        self.table.setSortingEnabled(False)
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        for col, (key, _) in enumerate(self.COLUMNS):
+            value = record[key]
+            item = QTableWidgetItem()
+            if value is None:
+                item.setText('-')
+            elif key == 'start':
+                item.setText(time.strftime('%m-%d %H:%M:%S', time.localtime(value)))
+            elif key == 'peak_rss':
+                item.setData(Qt.DisplayRole, round(value / 1024 / 1024, 1))
+            elif isinstance(value, float):
+                # 数值列按数值而不是文本排序
+                item.setData(Qt.DisplayRole, round(value, 2))
+            elif isinstance(value, int):
+                item.setData(Qt.DisplayRole, value)
+            else:
+                item.setText(str(value))
+            self.table.setItem(row, col, item)
+        self.table.setSortingEnabled(sorting)
+        self.update_summary()
+
+    def update_summary(self):
+        history = self.monitor.history
+        cpu = sum((r['cpu_user'] or 0) + (r['cpu_sys'] or 0) for r in history)
+        peak = max((r['peak_rss'] or 0 for r in history), default=0)
+        self.summary_label.setText(
+            f'共 {len(history)} 次运行，CPU 合计 {cpu:.1f}s，单任务内存峰值 {format_size(peak)}'
+        )
+
+    def export(self, fmt):
+        path, _ = QFileDialog.getSaveFileName(
+            self, '导出任务历史', f'job-history.{fmt}',
+            'CSV Files (*.csv)' if fmt == 'csv' else 'JSON Files (*.json)'
+        )
+        if not path:
+            return
+        try:
+            if fmt == 'csv':
+                # 带 BOM，Excel 打开中文不乱码
+                with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                    writer = csv.DictWriter(f, [key for key, _ in self.COLUMNS] + ['end'])
+                    writer.writeheader()
+                    writer.writerows(self.monitor.history)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(self.monitor.history, f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'导出失败: {str(e)}')
+
+
+class ResultModel(QAbstractTableModel):
+    """提取结果表，直接读取 Extractor.rows，新增行和次数变化按批通知视图"""
+    def __init__(self, extractor, parent=None):
+        super().__init__(parent)
+        self.extractor = extractor
+        self.headers = ['规则'] + extractor.fields + ['次数', '首次出现行']
+        self.shown = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.shown
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role in (Qt.DisplayRole, Qt.ToolTipRole) and index.isValid():
+            return self.extractor.rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return None
+
+    def refresh(self):
+        first, touched = self.extractor.take_changes()
+        if touched:
+            column = self.extractor.count_column
+            self.dataChanged.emit(self.index(min(touched), column), self.index(max(touched), column))
+        total = len(self.extractor.rows)
+        if total > self.shown:
+            self.beginInsertRows(QModelIndex(), self.shown, total - 1)
+            self.shown = total
+            self.endInsertRows()
+
+    def reset(self, extractor):
+        """换成另一个处理完成的 Extractor"""
+        self.beginResetModel()
+        self.extractor = extractor
+        extractor.take_changes()
+        self.shown = len(extractor.rows)
+        self.endResetModel()
+
+
+class ResultsView(QWidget):
+    """从任务输出中提取的去重结果，可排序并导出"""
+    REFRESH_INTERVAL = 300
+
+    def __init__(self, rules, name, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.extractor = Extractor(rules)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        header = QHBoxLayout()
+        self.summary_label = QLabel()
+        header.addWidget(self.summary_label, 1)
+        csv_btn = QPushButton('导出 CSV')
+        csv_btn.clicked.connect(lambda: self.export('csv'))
+        header.addWidget(csv_btn)
+        json_btn = QPushButton('导出 JSON')
+        json_btn.clicked.connect(lambda: self.export('json'))
+        header.addWidget(json_btn)
+        layout.addLayout(header)
+
+        self.model = ResultModel(self.extractor, self)
+        # 新结果追加在末尾，只在点击表头时排序
+        self.proxy = QSortFilterProxyModel(self)
+        self.proxy.setDynamicSortFilter(False)
+        self.proxy.setSourceModel(self.model)
+        self.table = QTableView()
+        self.table.setModel(self.proxy)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(-1, Qt.AscendingOrder)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.REFRESH_INTERVAL)
+        self.timer.timeout.connect(self.refresh)
+        self.refresh()
+
+    def feed(self, data):
+        self.extractor.feed(data)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def finish(self):
+        self.extractor.finish()
+        self.refresh()
+
+    def load(self, extractor):
+        """显示在后台线程中处理完成的提取结果"""
+        self.timer.stop()
+        self.extractor = extractor
+        self.model.reset(extractor)
+        self.refresh()
+
+    def refresh(self):
+        self.model.refresh()
+        extractor = self.extractor
+        self.summary_label.setText(
+            f'已处理 {extractor.lines} 行，匹配 {extractor.hits} 次，去重后 {len(extractor.rows)} 条'
+        )
+
+    def export(self, fmt):
+        path, _ = QFileDialog.getSaveFileName(
+            self, '导出提取结果', f'{safe_name(self.name)}-results.{fmt}',
+            'CSV Files (*.csv)' if fmt == 'csv' else 'JSON Files (*.json)'
+        )
+        if not path:
+            return
+        try:
+            if fmt == 'csv':
+                with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['rule'] + self.extractor.fields + ['count', 'first_line'])
+                    writer.writerows(self.extractor.rows)
+            else:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(self.extractor.records(), f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'导出失败: {str(e)}')
+
+
+class RemoteFetchThread(QThread):
+    """在后台线程中获取远程配置，避免阻塞界面"""
+    loaded = pyqtSignal(object, bool)
+    failed = pyqtSignal(str)
+
+    def __init__(self, fetcher, url, parent=None):
+        super().__init__(parent)
+        self.fetcher = fetcher
+        self.url = url
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            data, not_modified = self.fetcher.fetch(self.url, self.cancel_event)
+        except FetchCancelled:
+            return
+        except Exception as e:
+            if not self.cancel_event.is_set():
+                self.failed.emit(str(e))
+            return
+        if not self.cancel_event.is_set():
+            self.loaded.emit(data, not_modified)
+
+
+class CatalogSyncThread(QThread):
+    """在后台线程中并发获取所有订阅源，合并在界面线程中进行"""
+    fetched = pyqtSignal(object)
+
+    def __init__(self, fetcher, sources, workers, force=False, parent=None):
+        super().__init__(parent)
+        self.fetcher = fetcher
+        self.sources = sources
+        self.workers = workers
+        self.force = force
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        try:
+            results = self.fetcher.fetch_all(self.sources, self.workers, self.cancel_event, self.force)
+        except FetchCancelled:
+            return
+        if not self.cancel_event.is_set():
+            self.fetched.emit(results)
+
+
+class SourcesDialog(QDialog):
+    """编辑订阅源列表、冲突处理方式和同步间隔"""
+    def __init__(self, sources, policy, minutes, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('订阅源')
+        self.resize(560, 360)
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel('每行一个来源，可以是 http(s) URL 或本地 JSON 文件路径，# 开头的行忽略：'))
+        self.sources_edit = QPlainTextEdit('\n'.join(sources))
+        layout.addWidget(self.sources_edit)
+        browse_btn = QPushButton('添加本地文件...')
+        browse_btn.clicked.connect(self.browse)
+        layout.addWidget(browse_btn)
+
+        form = QFormLayout()
+        self.policy_combo = QComboBox()
+        for key, label in MERGE_POLICIES.items():
+            self.policy_combo.addItem(label, key)
+        self.policy_combo.setCurrentIndex(max(0, self.policy_combo.findData(policy)))
+        form.addRow('与本地命令同名冲突时：', self.policy_combo)
+        self.minutes_spin = QSpinBox()
+        self.minutes_spin.setRange(0, 7 * 24 * 60)
+        self.minutes_spin.setSuffix(' 分钟')
+        self.minutes_spin.setSpecialValueText('只手动同步')
+        self.minutes_spin.setValue(minutes)
+        form.addRow('后台同步间隔：', self.minutes_spin)
         layout.addLayout(form)
-        layout.addWidget(run_btn)
-        self.setLayout(layout)
-        self.resize(600, 400)
 
-    def browse_file(self, line_edit):
-        path, _ = QFileDialog.getOpenFileName(self, '选择文件')
+        btn_box = QHBoxLayout()
+        ok_btn = QPushButton('确定')
+        ok_btn.clicked.connect(self.accept)
+        cancel_btn = QPushButton('取消')
+        cancel_btn.clicked.connect(self.reject)
+        btn_box.addWidget(ok_btn)
+        btn_box.addWidget(cancel_btn)
+        layout.addLayout(btn_box)
+
+    def browse(self):
+        path, _ = QFileDialog.getOpenFileName(self, '选择命令目录文件', '', 'JSON 文件 (*.json);;所有文件 (*)')
         if path:
-            line_edit.setText(path)
+            self.sources_edit.appendPlainText(path)
 
     def get_values(self):
-        return {p: self.inputs[p].text() for p in self.params}
+        """返回 (来源列表, 冲突处理方式, 同步间隔)，重复的来源只保留一个"""
+        sources = []
+        for line in self.sources_edit.toPlainText().splitlines():
+            line = line.strip()
+            if line and not line.startswith('#') and line not in sources:
+                sources.append(line)
+        return sources, self.policy_combo.currentData(), self.minutes_spin.value()
+
+
+class ConfigImportThread(QThread):
+    """在后台线程中读取并解析要导入的配置文件"""
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+
+    def run(self):
+        try:
+            with open(self.path, 'rb') as f:
+                data = json.loads(f.read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(data)
+
+
+class FindThread(QThread):
+    """在后台线程中依次搜索各个来源，结果分批发回界面线程"""
+    found = pyqtSignal(object)
+    done = pyqtSignal(int, bool)
+
+    # 结果太多时界面列表会变慢，超过后停止搜索
+    MAX_RESULTS = 10000
+    # 两次发送结果之间的最短间隔(秒)
+    EMIT_INTERVAL = 0.1
+
+    def __init__(self, sources, pattern, parent=None):
+        super().__init__(parent)
+        # 来源: (显示名, 输出控件或文件路径, 内存中的文本或 None)
+        self.sources = sources
+        self.pattern = pattern
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        batch = []
+        count = 0
+        last_emit = time.monotonic()
+        for label, ref, data in self.sources:
+            try:
+                if data is not None:
+                    hits = search_buffer(data, self.pattern, self.cancel_event)
+                else:
+                    hits = search_file(ref, self.pattern, self.cancel_event)
+                for line, offset, text in hits:
+                    batch.append((label, ref, line, strip_ansi(text)))
+                    count += 1
+                    if count >= self.MAX_RESULTS:
+                        break
+                    if time.monotonic() - last_emit >= self.EMIT_INTERVAL:
+                        self.found.emit(batch)
+                        batch = []
+                        last_emit = time.monotonic()
+            except OSError:
+                # 日志可能在搜索前被删除，跳过即可
+                continue
+            if count >= self.MAX_RESULTS or self.cancel_event.is_set():
+                break
+        if self.cancel_event.is_set():
+            return
+        if batch:
+            self.found.emit(batch)
+        self.done.emit(count, count >= self.MAX_RESULTS)
+
+
+class FindBar(QWidget):
+    """输出查找栏：搜索当前输出页，或会话日志和所有任务日志"""
+    search_requested = pyqtSignal(str, bool, bool, bool)  # 文本, 正则, 区分大小写, 搜索日志
+    result_activated = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        row = QHBoxLayout()
+        self.edit = QLineEdit()
+        self.edit.setPlaceholderText('在输出中查找，回车开始搜索')
+        self.edit.returnPressed.connect(self.request_search)
+        row.addWidget(self.edit, 1)
+        self.regex_check = QCheckBox('正则')
+        row.addWidget(self.regex_check)
+        self.case_check = QCheckBox('区分大小写')
+        row.addWidget(self.case_check)
+        self.scope_combo = QComboBox()
+        self.scope_combo.addItems(['当前输出页', '会话日志和任务日志'])
+        row.addWidget(self.scope_combo)
+        find_btn = QPushButton('查找')
+        find_btn.clicked.connect(self.request_search)
+        row.addWidget(find_btn)
+        close_btn = QPushButton('关闭')
+        close_btn.clicked.connect(self.hide)
+        row.addWidget(close_btn)
+        layout.addLayout(row)
+
+        self.status_label = QLabel()
+        self.status_label.setStyleSheet("color: #666;")
+        layout.addWidget(self.status_label)
+
+        self.results = QListWidget()
+        self.results.setMaximumHeight(200)
+        self.results.setUniformItemSizes(True)
+        self.results.itemActivated.connect(self.on_item_activated)
+        self.results.itemClicked.connect(self.on_item_activated)
+        layout.addWidget(self.results)
+
+    def request_search(self):
+        text = self.edit.text()
+        if text:
+            self.search_requested.emit(
+                text, self.regex_check.isChecked(), self.case_check.isChecked(),
+                self.scope_combo.currentIndex() == 1
+            )
+
+    def clear_results(self, message=''):
+        self.results.clear()
+        self.status_label.setText(message)
+
+    def add_results(self, results):
+        self.results.setUpdatesEnabled(False)
+        for result in results:
+            label, _, line, text = result
+            item = QListWidgetItem(f'{label}:{line + 1}  {text}')
+            item.setData(Qt.UserRole, result)
+            self.results.addItem(item)
+        self.results.setUpdatesEnabled(True)
+
+    def on_item_activated(self, item):
+        self.result_activated.emit(item.data(Qt.UserRole))
+
+
+class LogViewDialog(QDialog):
+    """显示日志文件中某一行附近的内容"""
+    CONTEXT_LINES = 1000
+
+    def __init__(self, path, line, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f'{os.path.basename(path)} 第 {line + 1} 行')
+        layout = QVBoxLayout(self)
+        first = max(0, line - self.CONTEXT_LINES)
+        lines = read_lines(path, first, line - first + self.CONTEXT_LINES + 1)
+        layout.addWidget(QLabel(f'日志: {path}  显示第 {first + 1} - {first + len(lines)} 行'))
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setFont(QFont("Consolas", 12))
+        self.view.setPlainText(strip_ansi('\n'.join(lines)))
+        layout.addWidget(self.view)
+        self.resize(900, 600)
+
+        block = self.view.document().findBlockByNumber(line - first)
+        if block.isValid():
+            cursor = QTextCursor(block)
+            cursor.select(QTextCursor.LineUnderCursor)
+            highlight = QTextEdit.ExtraSelection()
+            highlight.format.setBackground(QColor('#fff59d'))
+            highlight.cursor = cursor
+            self.view.setExtraSelections([highlight])
+            self.view.setTextCursor(QTextCursor(block))
+            self.view.centerCursor()
+
+
+class HistorySearchDialog(QDialog):
+    """反向搜索命令历史 (Ctrl+R)，输入即搜索，结果由新到旧排列"""
+    FILL = 1
+    RERUN = 2
+
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('搜索命令历史')
+        self.history = history
+        self.action = None
+        layout = QVBoxLayout(self)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText('输入命令中的任意部分')
+        self.search_edit.textChanged.connect(self.search)
+        self.search_edit.installEventFilter(self)
+        layout.addWidget(self.search_edit)
+        self.result_list = QListWidget()
+        self.result_list.setFont(QFont("Consolas", 11))
+        self.result_list.itemActivated.connect(lambda item: self.finish(self.FILL))
+        self.result_list.currentItemChanged.connect(self.update_buttons)
+        layout.addWidget(self.result_list)
+
+        buttons = QHBoxLayout()
+        self.count_label = QLabel()
+        buttons.addWidget(self.count_label, 1)
+        fill_btn = QPushButton('填入终端')
+        fill_btn.clicked.connect(lambda: self.finish(self.FILL))
+        buttons.addWidget(fill_btn)
+        self.rerun_btn = QPushButton('按模板重新运行')
+        self.rerun_btn.setToolTip('用当时的参数值打开参数对话框')
+        self.rerun_btn.clicked.connect(lambda: self.finish(self.RERUN))
+        buttons.addWidget(self.rerun_btn)
+        layout.addLayout(buttons)
+        self.resize(800, 450)
+        self.search('')
+
+    def search(self, text):
+        self.result_list.clear()
+        for entry in self.history.search(text, limit=200):
+            label = entry['command']
+            if entry.get('path'):
+                label += f"    [{'/'.join(entry['path'])}]"
+            item = QListWidgetItem(label)
+            item.setData(Qt.UserRole, entry)
+            item.setToolTip(time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time'])))
+            self.result_list.addItem(item)
+        self.count_label.setText(f'共 {len(self.history)} 条历史')
+        if self.result_list.count():
+            self.result_list.setCurrentRow(0)
+        self.update_buttons()
+
+    def update_buttons(self, *args):
+        entry = self.selected_entry()
+        self.rerun_btn.setEnabled(entry is not None and bool(entry.get('path')))
+
+    def eventFilter(self, obj, event):
+        # 焦点在搜索框时用上下键选择结果
+        if obj is self.search_edit and event.type() == event.KeyPress:
+            if event.key() in (Qt.Key_Up, Qt.Key_Down):
+                step = -1 if event.key() == Qt.Key_Up else 1
+                row = self.result_list.currentRow() + step
+                if 0 <= row < self.result_list.count():
+                    self.result_list.setCurrentRow(row)
+                return True
+            if event.key() in (Qt.Key_Return, Qt.Key_Enter):
+                self.finish(self.FILL)
+                return True
+        return super().eventFilter(obj, event)
+
+    def selected_entry(self):
+        item = self.result_list.currentItem()
+        return None if item is None else item.data(Qt.UserRole)
+
+    def finish(self, action):
+        if self.selected_entry() is None:
+            return
+        self.action = action
+        self.accept()
+
+
+class ScrollbackDialog(QDialog):
+    """分页回看会话日志中已超出终端保留行数的更早输出"""
+    PAGE_LINES = 2000
+
+    def __init__(self, log, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('更早的输出')
+        self.log = log
+        self.start = self.end = log.size()
+
+        layout = QVBoxLayout()
+        self.info = QLabel()
+        layout.addWidget(self.info)
+
+        self.view = QPlainTextEdit()
+        self.view.setReadOnly(True)
+        self.view.setFont(QFont("Consolas", 12))
+        layout.addWidget(self.view)
+
+        btn_box = QHBoxLayout()
+        older_btn = QPushButton('更早')
+        older_btn.clicked.connect(self.load_older)
+        newer_btn = QPushButton('更新')
+        newer_btn.clicked.connect(self.load_newer)
+        latest_btn = QPushButton('最新')
+        latest_btn.clicked.connect(self.load_latest)
+        btn_box.addWidget(older_btn)
+        btn_box.addWidget(newer_btn)
+        btn_box.addWidget(latest_btn)
+        layout.addLayout(btn_box)
+
+        self.setLayout(layout)
+        self.resize(900, 600)
+        self.load_latest()
+
+    def load_latest(self):
+        self.end = self.log.size()
+        self.start, text = self.log.read_before(self.end, self.PAGE_LINES)
+        self.show_page(text)
+        self.view.moveCursor(QTextCursor.End)
+
+    def load_older(self):
+        if self.start <= 0:
+            return
+        self.end = self.start
+        self.start, text = self.log.read_before(self.end, self.PAGE_LINES)
+        self.show_page(text)
+        self.view.moveCursor(QTextCursor.End)
+
+    def load_newer(self):
+        size = self.log.size()
+        if self.end >= size:
+            return
+        self.start = self.end
+        self.end, text = self.log.read_after(self.start, self.PAGE_LINES)
+        self.show_page(text)
+        self.view.moveCursor(QTextCursor.Start)
+
+    def show_page(self, text):
+        self.view.setPlainText(strip_ansi(text))
+        self.info.setText(
+            f'日志: {self.log.path}  当前位置: {format_size(self.start)} - {format_size(self.end)} '
+            f'/ {format_size(self.log.size())}'
+        )
+
+
+class ShellSupervisor(QObject):
+    """内置终端的 shell 进程，完全由 QProcess 的信号驱动，界面线程从不等待子进程
+
+    shell 在第一次运行命令时才启动，启动完成前写入的命令先排队。shell 意外退出后
+    按指数退避重启（连续运行超过 STABLE_TIME 后退避时间复位），连续启动失败
+    MAX_FAILURES 次后不再自动重试，等到下一次运行命令时再启动。空闲时没有任何定时器。
+    """
+    output = pyqtSignal(bytes)
+    status = pyqtSignal(str)
+
+    RESTART_MIN = 500
+    RESTART_MAX = 30000
+    STABLE_TIME = 10
+    MAX_FAILURES = 5
+    # 发出 terminate 后等待多久再强制 kill(ms)
+    KILL_TIMEOUT = 1000
+
+    def __init__(self, command, parent=None):
+        super().__init__(parent)
+        # 返回 (程序, 参数) 的函数
+        self.command = command
+        self.process = None
+        self.pending = []
+        self.started_at = None
+        self.failures = 0
+        self.restart_delay = self.RESTART_MIN
+        self.stopping = False
+        self.closed = False
+        self.restart_timer = QTimer(self)
+        self.restart_timer.setSingleShot(True)
+        self.restart_timer.timeout.connect(self.start)
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.setInterval(self.KILL_TIMEOUT)
+        self.kill_timer.timeout.connect(self.kill)
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.state() == QProcess.Running
+
+    def start(self):
+        if self.closed or self.process is not None:
+            return
+        self.restart_timer.stop()
+        process = QProcess(self)
+        process.setProcessChannelMode(QProcess.MergedChannels)
+        process.readyRead.connect(self.on_ready_read)
+        process.started.connect(self.on_started)
+        process.finished.connect(self.on_finished)
+        process.errorOccurred.connect(self.on_error)
+        self.process = process
+        program, args = self.command()
+        process.start(program, args)
+
+    def run(self, command):
+        """写入一条命令，shell 未启动时先启动，启动完成后再写入"""
+        data = (command + '\n').encode('utf-8')
+        if self.running:
+            self.process.write(data)
+            return
+        self.pending.append(data)
+        if self.process is None:
+            self.failures = 0
+            self.start()
+
+    def stop(self):
+        """停止当前命令：结束整个 shell，退出后立即重新启动"""
+        if not self.running:
+            return False
+        self.stopping = True
+        self.process.terminate()
+        self.kill_timer.start()
+        return True
+
+    def shutdown(self):
+        """程序退出时调用，不再重启"""
+        self.closed = True
+        self.restart_timer.stop()
+        self.pending.clear()
+        if self.running:
+            self.process.kill()
+
+    def kill(self):
+        if self.running:
+            self.process.kill()
+
+    def on_ready_read(self):
+        self.output.emit(bytes(self.process.readAll()))
+
+    def on_started(self):
+        self.started_at = time.monotonic()
+        self.failures = 0
+        for data in self.pending:
+            self.process.write(data)
+        self.pending.clear()
+
+    def on_finished(self, exit_code, exit_status):
+        self.on_ready_read()
+        self.kill_timer.stop()
+        stable = self.started_at is not None and time.monotonic() - self.started_at > self.STABLE_TIME
+        self.discard()
+        if self.closed:
+            return
+        if self.stopping or stable:
+            # 主动停止或运行了足够久，不算频繁崩溃
+            self.stopping = False
+            self.restart_delay = self.RESTART_MIN
+            self.status.emit('终端已重新启动' if stable else '已强制停止当前命令，终端重新启动')
+            self.start()
+            return
+        self.schedule_restart(f'终端已退出(退出码 {exit_code})')
+
+    def on_error(self, error):
+        # 启动失败时不会再收到 finished 信号
+        if error != QProcess.FailedToStart or self.process is None:
+            return
+        message = self.process.errorString()
+        self.discard()
+        self.failures += 1
+        if self.failures >= self.MAX_FAILURES:
+            self.pending.clear()
+            self.status.emit(f'终端无法启动: {message}，将在下次运行命令时重试')
+            self.output.emit(f"终端无法启动: {message}\n".encode('utf-8'))
+            return
+        self.schedule_restart(f'终端启动失败: {message}')
+
+    def schedule_restart(self, reason):
+        if self.closed:
+            return
+        delay = self.restart_delay
+        self.restart_delay = min(self.restart_delay * 2, self.RESTART_MAX)
+        self.status.emit(f'{reason}，{delay / 1000:g} 秒后重启')
+        self.restart_timer.start(delay)
+
+    def discard(self):
+        process, self.process = self.process, None
+        self.started_at = None
+        if process is not None:
+            process.deleteLater()
+
 
 class ToolRunner(QMainWindow):
+    # 配置写入在后台线程进行，失败时通过信号回到界面线程提示
+    config_save_failed = pyqtSignal(str)
+    job_log_failed = pyqtSignal(str)
+    # 任务, 缓存键, 运行记录, 错误；由结果缓存的写入线程发出
+    result_saved = pyqtSignal(object, str, object, object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle('CommandToGUI工具箱 By  公众号:知攻善防实验室 ChinaRan404')
@@ -205,19 +2743,63 @@ class ToolRunner(QMainWindow):
         self.resize(int(screen.width() * 0.6), int(screen.height() * 0.8))
         
         # 初始化配置
-        self.config = {'categories': [], 'use_internal_terminal': True}
+        self.config = default_config()
+        self.store = ConfigStore(CONFIG_FILE, on_error=self.config_save_failed.emit)
+        self.config_save_failed.connect(self.on_config_save_failed)
         self.load_config()
+        startup.mark('加载配置')
         
-        # 终端相关初始化
-        self.command_history = []
-        self.history_index = -1
+        # 终端相关初始化，命令历史在第一次使用时才读取
+        self.history = History()
+        # 目标文件的行数预览和预处理结果缓存
+        self.targets = TargetCache()
+        # 任务输出缓存，用于复用和与上次运行对比
+        self.result_cache = ResultCache(
+            max_bytes=self.config.get('result_cache_max_mb', DEFAULT_SETTINGS['result_cache_max_mb']) * 1024 * 1024
+        )
+        self.diff_thread = None
+        self.history_pos = None
         self.current_input = ""
         self.prompt = "> "
         self.is_input_mode = False
+
+        # 任务引擎：每次运行命令使用独立进程，资源占用记入任务历史
+        self.monitor = JobMonitor(self)
+        self.history_view = None
+        self.jobs = JobManager(
+            self.config.get('max_parallel_jobs', DEFAULT_SETTINGS['max_parallel_jobs']), self, self.monitor
+        )
+        self.jobs.job_added.connect(self.on_job_added)
+        self.jobs.job_changed.connect(self.on_job_changed)
+        self.job_views = {}
+        # 任务输出日志，所有任务共用一个写入线程
+        self.job_logs = JobLogWriter(on_error=self.job_log_failed.emit)
+        self.job_log_failed.connect(self.on_job_log_failed)
+        self.result_saved.connect(self.on_result_saved)
+
+        # 远程配置获取器，复用同一个 Session
+        self.fetcher = CatalogFetcher(
+            timeout=self.config.get('remote_timeout', DEFAULT_SETTINGS['remote_timeout'])
+        )
+        self.remote_thread = None
+        self.import_thread = None
+        # 订阅源定时同步，只在有订阅源且设置了间隔时启动
+        self.sync_thread = None
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.timeout.connect(self.sync_sources)
+
+        # 命令搜索索引，随目录增量更新
+        self.search_index = SearchIndex()
         
         self.init_ui()
-        self.start_shell()
-        self.refresh_tree()
+        startup.mark('创建界面')
+        # 终端在第一次运行命令时才启动，命令树在窗口显示后再填充
+        self.shell = ShellSupervisor(self.get_shell_command, self)
+        # 只入队，渲染由 OutputPipeline 的定时器合并完成
+        self.shell.output.connect(self.output.feed)
+        self.shell.status.connect(lambda text: self.statusBar().showMessage(text, 3000))
+        self.startup_done = False
         
         # 状态栏
         self.statusBar().showMessage('就绪')
@@ -227,6 +2809,25 @@ class ToolRunner(QMainWindow):
         
         # 应用默认主题
         self.apply_theme()
+        startup.mark('应用主题')
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.startup_done:
+            self.startup_done = True
+            startup.mark('显示窗口')
+            # 回到事件循环，先完成首次绘制再填充命令树
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        startup.mark('进入事件循环')
+        self.refresh_tree()
+        startup.mark('填充命令树')
+        startup.report()
+        # 窗口显示后在后台读取命令历史
+        self.history.load_async()
+        # 启动后先做一次条件请求，订阅源没有变化时不会重建命令树
+        self.schedule_sync(SYNC_STARTUP_DELAY)
 
     def apply_theme(self):
         theme = self.themes[self.current_theme]
@@ -255,20 +2856,20 @@ class ToolRunner(QMainWindow):
                 background-color: {theme['primary']};
                 color: white;
             }}
-            QTreeWidget {{
+            QTreeView {{
                 border: 1px solid {theme['border']};
                 border-radius: 4px;
                 background-color: {theme['background']};
                 color: {theme['text']};
             }}
-            QTreeWidget::item {{
+            QTreeView::item {{
                 padding: 5px;
                 border-radius: 3px;
             }}
-            QTreeWidget::item:hover {{
+            QTreeView::item:hover {{
                 background-color: {theme['highlight']};
             }}
-            QTreeWidget::item:selected {{
+            QTreeView::item:selected {{
                 background-color: {theme['primary']};
                 color: white;
             }}
@@ -350,28 +2951,45 @@ class ToolRunner(QMainWindow):
             }
         """)
         left_layout.addWidget(tree_title)
+
+        # 搜索框和搜索结果
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText('搜索分类、工具、命令或模板...')
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.on_search)
+        self.search_box.returnPressed.connect(self.open_first_search_result)
+        left_layout.addWidget(self.search_box)
+
+        self.search_results = QListWidget()
+        self.search_results.setVisible(False)
+        self.search_results.itemClicked.connect(self.locate_search_result)
+        self.search_results.itemDoubleClicked.connect(self.run_search_result)
+        left_layout.addWidget(self.search_results)
         
         # 树状结构
-        self.tree = QTreeWidget()
+        self.tree = QTreeView()
         self.tree.setHeaderHidden(True)
-        self.tree.itemDoubleClicked.connect(self.on_item_double)
+        self.tree.setUniformRowHeights(True)
+        self.catalog = CatalogModel(self)
+        self.tree.setModel(self.catalog)
+        self.tree.doubleClicked.connect(self.on_item_double)
         self.tree.setContextMenuPolicy(Qt.CustomContextMenu)
         self.tree.customContextMenuRequested.connect(self.show_context_menu)
         self.tree.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 border: 1px solid #ddd;
                 border-radius: 4px;
                 background-color: white;
                 padding: 5px;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 padding: 5px;
                 border-radius: 3px;
             }
-            QTreeWidget::item:hover {
+            QTreeView::item:hover {
                 background-color: #f0f0f0;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #e3f2fd;
                 color: #2196F3;
             }
@@ -396,7 +3014,31 @@ class ToolRunner(QMainWindow):
                 border-bottom: 2px solid #2196F3;
             }
         """)
-        right_layout.addWidget(terminal_title)
+        terminal_header = QHBoxLayout()
+        terminal_header.addWidget(terminal_title, 1)
+        older_btn = QPushButton('查看更早输出')
+        older_btn.setToolTip('终端只保留最近的输出，完整记录保存在会话日志中')
+        older_btn.clicked.connect(self.show_scrollback)
+        terminal_header.addWidget(older_btn)
+        find_btn = QPushButton('查找')
+        find_btn.setToolTip('在输出和日志中查找 (Ctrl+F)')
+        find_btn.clicked.connect(self.show_find_bar)
+        terminal_header.addWidget(find_btn)
+        history_btn = QPushButton('任务历史')
+        history_btn.setToolTip('每次运行的用时、退出码、CPU 时间和内存峰值')
+        history_btn.clicked.connect(self.show_job_history)
+        terminal_header.addWidget(history_btn)
+        right_layout.addLayout(terminal_header)
+
+        # 输出查找栏，Ctrl+F 打开
+        self.find_bar = FindBar()
+        self.find_bar.search_requested.connect(self.start_find)
+        self.find_bar.result_activated.connect(self.jump_to_find_result)
+        self.find_bar.hide()
+        right_layout.addWidget(self.find_bar)
+        QShortcut(QKeySequence.Find, self, self.show_find_bar)
+        QShortcut(QKeySequence('Ctrl+R'), self, self.show_history_search)
+        self.find_thread = None
         
         # 终端输出
         self.terminal = QPlainTextEdit()
@@ -416,11 +3058,26 @@ class ToolRunner(QMainWindow):
         # 设置终端字体
         font = QFont("Consolas", 12)
         self.terminal.setFont(font)
+
+        # 限制内存中保留的行数，完整输出写入会话日志
+        self.terminal.setMaximumBlockCount(
+            self.config.get('scrollback_lines', DEFAULT_SETTINGS['scrollback_lines'])
+        )
+        self.session_log = SessionLog(
+            os.path.join(LOG_DIR, f"session-{time.strftime('%Y%m%d-%H%M%S')}.log")
+        )
         
         # 安装事件过滤器以处理键盘事件
         self.terminal.installEventFilter(self)
         
-        right_layout.addWidget(self.terminal)
+        # 终端和各任务输出以标签页展示
+        self.output_tabs = QTabWidget()
+        self.output_tabs.setTabsClosable(True)
+        self.output_tabs.tabCloseRequested.connect(self.close_job_tab)
+        self.output_tabs.addTab(self.terminal, '终端')
+        # 终端页不可关闭
+        self.output_tabs.tabBar().setTabButton(0, self.output_tabs.tabBar().RightSide, None)
+        right_layout.addWidget(self.output_tabs)
         
         # 添加面板到分割器
         splitter.addWidget(left_panel)
@@ -443,6 +3100,24 @@ class ToolRunner(QMainWindow):
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("就绪")
 
+        # 终端输出缓冲管线及吞吐统计
+        self.output = OutputPipeline(
+            self.terminal,
+            self.config.get('output_flush_interval', DEFAULT_SETTINGS['output_flush_interval']),
+            self.config.get('output_max_batch', DEFAULT_SETTINGS['output_max_batch']),
+            self.session_log,
+            self
+        )
+        self.output.stats_changed.connect(self.on_output_stats)
+        self.output_stats_label = QLabel()
+        self.output_stats_label.setStyleSheet("color: #666; padding: 0 8px;")
+        self.status_bar.addPermanentWidget(self.output_stats_label)
+
+        self.job_stats_label = QLabel()
+        self.job_stats_label.setStyleSheet("color: #666; padding: 0 8px;")
+        self.status_bar.addPermanentWidget(self.job_stats_label)
+        self.update_job_stats()
+
         # 添加停止按钮
         stop_btn = QPushButton('强制停止')
         stop_btn.setStyleSheet("""
@@ -461,6 +3136,23 @@ class ToolRunner(QMainWindow):
         stop_btn.clicked.connect(self.stop_shell)
         left_layout.addWidget(stop_btn)
 
+        stop_jobs_btn = QPushButton('停止全部任务')
+        stop_jobs_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #ff9800;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                border-radius: 4px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #f57c00;
+            }
+        """)
+        stop_jobs_btn.clicked.connect(self.stop_all_jobs)
+        left_layout.addWidget(stop_jobs_btn)
+
     def create_menus(self):
         menubar = self.menuBar()
         menubar.setStyleSheet("""
@@ -534,6 +3226,16 @@ class ToolRunner(QMainWindow):
         load_remote.triggered.connect(self.load_remote_config)
         config_menu.addAction(load_remote)
         
+        sources_action = QAction('订阅源...', self)
+        sources_action.setStatusTip('管理订阅的命令目录，合并到本地目录并定时同步')
+        sources_action.triggered.connect(self.edit_sources)
+        config_menu.addAction(sources_action)
+
+        sync_action = QAction('立即同步订阅源', self)
+        sync_action.setStatusTip('完整获取所有订阅源并合并到本地目录')
+        sync_action.triggered.connect(lambda: self.sync_sources(manual=True))
+        config_menu.addAction(sync_action)
+        
         export_config = QAction('导出配置', self)
         export_config.setStatusTip('将当前配置导出到文件')
         export_config.triggered.connect(self.export_config)
@@ -552,51 +3254,554 @@ class ToolRunner(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
 
-        # 外置终端
-        toggle_terminal_action = QAction('使用外置终端', self, checkable=True)
-        toggle_terminal_action.setChecked(not self.config.get('use_internal_terminal', True))
-        toggle_terminal_action.triggered.connect(self.toggle_terminal)
-        config_menu.addAction(toggle_terminal_action)
+        # 外置终端
+        toggle_terminal_action = QAction('使用外置终端', self, checkable=True)
+        toggle_terminal_action.setChecked(not self.config.get('use_internal_terminal', True))
+        toggle_terminal_action.triggered.connect(self.toggle_terminal)
+        config_menu.addAction(toggle_terminal_action)
+
+        quote_action = QAction('参数值自动加引号', self, checkable=True)
+        quote_action.setToolTip('{参数} 的值按 shell 规则加引号，{{参数}} 始终原样插入')
+        quote_action.setChecked(self.config.get('quote_params', DEFAULT_SETTINGS['quote_params']))
+        quote_action.triggered.connect(self.toggle_quote_params)
+        config_menu.addAction(quote_action)
+
+        output_settings = QAction('终端输出设置', self)
+        output_settings.setStatusTip('设置终端输出的刷新间隔、单次最大渲染量和保留行数')
+        output_settings.triggered.connect(self.edit_output_settings)
+        config_menu.addAction(output_settings)
+
+        parallel_settings = QAction('并发任务数', self)
+        parallel_settings.setStatusTip('设置同时运行的任务数上限，超出的任务将排队等待')
+        parallel_settings.triggered.connect(self.edit_max_parallel)
+        config_menu.addAction(parallel_settings)
+
+        job_log_settings = QAction('任务日志设置', self)
+        job_log_settings.setStatusTip('设置任务输出日志的压缩方式和分卷大小')
+        job_log_settings.triggered.connect(self.edit_job_log_settings)
+        config_menu.addAction(job_log_settings)
+
+        result_cache_settings = QAction('结果缓存设置', self)
+        result_cache_settings.setStatusTip('设置是否保存任务输出用于复用和对比，以及缓存大小上限')
+        result_cache_settings.triggered.connect(self.edit_result_cache_settings)
+        config_menu.addAction(result_cache_settings)
+
+        clear_result_cache = QAction('清空结果缓存', self)
+        clear_result_cache.setStatusTip('删除所有保存的任务输出')
+        clear_result_cache.triggered.connect(self.clear_result_cache)
+        config_menu.addAction(clear_result_cache)
+
+        # 文件菜单
+        file_menu = menubar.addMenu('文件')
+        
+        # 主题切换
+        theme_menu = file_menu.addMenu('切换主题')
+        light_action = QAction('浅色主题', self, checkable=True)
+        light_action.setChecked(self.current_theme == 'light')
+        light_action.triggered.connect(lambda: self.switch_theme('light'))
+        theme_menu.addAction(light_action)
+        
+        dark_action = QAction('深色主题', self, checkable=True)
+        dark_action.setChecked(self.current_theme == 'dark')
+        dark_action.triggered.connect(lambda: self.switch_theme('dark'))
+        theme_menu.addAction(dark_action)
+
+    def toggle_terminal(self, checked):
+        """切换终端类型"""
+        self.config['use_internal_terminal'] = not checked
+        self.store.set(['use_internal_terminal'], not checked)
+        mode = '外置' if checked else '内置'
+        self.statusBar().showMessage(f'已切换为{mode}终端模式', 3000)
+
+    def toggle_quote_params(self, checked):
+        self.config['quote_params'] = checked
+        self.store.set(['quote_params'], checked)
+        mode = '自动加引号' if checked else '原样插入'
+        self.statusBar().showMessage(f'参数值{mode}', 3000)
+
+    def edit_output_settings(self):
+        """设置终端输出刷新参数"""
+        interval, ok = QInputDialog.getInt(
+            self, '终端输出设置', '刷新间隔（毫秒，越大越省资源）：',
+            self.config.get('output_flush_interval', DEFAULT_SETTINGS['output_flush_interval']),
+            10, 1000
+        )
+        if not ok:
+            return
+        max_batch, ok = QInputDialog.getInt(
+            self, '终端输出设置', '单次最大渲染量（KB）：',
+            self.config.get('output_max_batch', DEFAULT_SETTINGS['output_max_batch']) // 1024,
+            4, 16384
+        )
+        if not ok:
+            return
+        scrollback, ok = QInputDialog.getInt(
+            self, '终端输出设置', '终端保留行数（更早的输出可在会话日志中回看）：',
+            self.config.get('scrollback_lines', DEFAULT_SETTINGS['scrollback_lines']),
+            100, 1000000
+        )
+        if not ok:
+            return
+        self.config['output_flush_interval'] = interval
+        self.config['output_max_batch'] = max_batch * 1024
+        self.config['scrollback_lines'] = scrollback
+        self.output.configure(interval, max_batch * 1024)
+        self.terminal.setMaximumBlockCount(scrollback)
+        for key in ('output_flush_interval', 'output_max_batch', 'scrollback_lines'):
+            self.store.set([key], self.config[key])
+        self.statusBar().showMessage(f'终端输出：每 {interval} ms 最多渲染 {max_batch} KB，保留 {scrollback} 行', 3000)
+
+    def edit_job_log_settings(self):
+        """设置任务输出日志"""
+        choices = ['不保存', '不压缩', 'gzip', 'xz']
+        if not self.config.get('job_log_enabled', DEFAULT_SETTINGS['job_log_enabled']):
+            current = 0
+        else:
+            compression = self.config.get('job_log_compression', DEFAULT_SETTINGS['job_log_compression'])
+            current = choices.index(compression) if compression in COMPRESSIONS and compression else 1
+        choice, ok = QInputDialog.getItem(
+            self, '任务日志设置', '任务输出保存到 logs/jobs，压缩方式：', choices, current, False
+        )
+        if not ok:
+            return
+        max_mb, ok = QInputDialog.getInt(
+            self, '任务日志设置', '单个日志文件大小上限（MB，超过后切换到新文件，0 表示不限制）：',
+            self.config.get('job_log_max_mb', DEFAULT_SETTINGS['job_log_max_mb']), 0, 1024 * 1024
+        )
+        if not ok:
+            return
+        enabled = choice != '不保存'
+        compression = choice if choice in ('gzip', 'xz') else ''
+        for key, value in (('job_log_enabled', enabled), ('job_log_compression', compression),
+                           ('job_log_max_mb', max_mb)):
+            self.config[key] = value
+            self.store.set([key], value)
+        self.statusBar().showMessage(f'任务日志: {choice}，分卷 {max_mb} MB', 3000)
+
+    def edit_result_cache_settings(self):
+        """设置任务结果缓存"""
+        choices = ['保存', '不保存']
+        enabled = self.config.get('result_cache_enabled', DEFAULT_SETTINGS['result_cache_enabled'])
+        choice, ok = QInputDialog.getItem(
+            self, '结果缓存设置', '保存任务输出，用于复用相同运行的结果和与上次运行对比：',
+            choices, 0 if enabled else 1, False
+        )
+        if not ok:
+            return
+        max_mb, ok = QInputDialog.getInt(
+            self, '结果缓存设置', '缓存总大小上限（MB，超过后删除最久没用的结果）：',
+            self.config.get('result_cache_max_mb', DEFAULT_SETTINGS['result_cache_max_mb']), 1, 1024 * 1024
+        )
+        if not ok:
+            return
+        reuse, ok = QInputDialog.getInt(
+            self, '结果缓存设置', '运行对话框中默认复用多少分钟内的结果（0 表示默认不复用）：',
+            self.config.get('result_reuse_minutes', DEFAULT_SETTINGS['result_reuse_minutes']), 0, 30 * 24 * 60
+        )
+        if not ok:
+            return
+        for key, value in (('result_cache_enabled', choice == '保存'), ('result_cache_max_mb', max_mb),
+                           ('result_reuse_minutes', reuse)):
+            self.config[key] = value
+            self.store.set([key], value)
+        self.result_cache.max_bytes = max_mb * 1024 * 1024
+        self.statusBar().showMessage(f'结果缓存: {choice}，上限 {max_mb} MB', 3000)
+
+    def clear_result_cache(self):
+        try:
+            self.result_cache.clear()
+        except OSError as e:
+            QMessageBox.warning(self, '错误', f'清空结果缓存失败: {e}')
+            return
+        self.statusBar().showMessage('已清空结果缓存', 3000)
+
+    def run_memo_job(self, name, command, log_name=None, reuse_minutes=0, **options):
+        """运行任务并保存输出；reuse_minutes 内相同的运行成功过时直接显示缓存的结果
+
+        缓存键包括作为参数的输入文件的内容摘要，在后台线程中计算（参数对话框预览过的
+        文件直接使用记录），算好后再复用结果或启动任务。绑定上游参数的任务启动时命令
+        才确定，不使用结果缓存。
+        """
+        if (not self.config.get('result_cache_enabled', DEFAULT_SETTINGS['result_cache_enabled'])
+                or options.get('bindings')):
+            self.run_job(name, command, log_name, **options)
+            return
+        files = {p: v for p, v in options.get('values', {}).items() if v and os.path.isfile(v)}
+        start = partial(self.start_memo_job, name, command, log_name, reuse_minutes, options)
+        if not files:
+            start(run_key(command))
+            return
+        self.statusBar().showMessage(f'正在计算输入文件的摘要: {name}', 3000)
+        thread = RunKeyThread(self.targets, command, files, self)
+        thread.done.connect(start)
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
 
-        # 文件菜单
-        file_menu = menubar.addMenu('文件')
-        
-        # 主题切换
-        theme_menu = file_menu.addMenu('切换主题')
-        light_action = QAction('浅色主题', self, checkable=True)
-        light_action.setChecked(self.current_theme == 'light')
-        light_action.triggered.connect(lambda: self.switch_theme('light'))
-        theme_menu.addAction(light_action)
-        
-        dark_action = QAction('深色主题', self, checkable=True)
-        dark_action.setChecked(self.current_theme == 'dark')
-        dark_action.triggered.connect(lambda: self.switch_theme('dark'))
-        theme_menu.addAction(dark_action)
+    def start_memo_job(self, name, command, log_name, reuse_minutes, options, key):
+        if reuse_minutes:
+            run = self.result_cache.lookup(key, reuse_minutes * 60)
+            if run is not None:
+                rerun = partial(self.run_memo_job, name, command, log_name, 0, **options)
+                self.show_cached_run(name, command, key, run, options.get('extract_rules'), rerun)
+                return
+        job = self.run_job(name, command, log_name, **options)
+        if job is not None:
+            # 创建临时文件和写入都在写入线程中进行，失败时在 on_result_saved 提示
+            writer = self.result_cache.open(key, command)
+            job.output.connect(writer.write)
+            job.state_changed.connect(partial(self.on_memo_job_state, writer))
 
-    def toggle_terminal(self, checked):
-        """切换终端类型"""
-        self.config['use_internal_terminal'] = not checked
-        self.save_config()
-        mode = '外置' if checked else '内置'
-        self.statusBar().showMessage(f'已切换为{mode}终端模式', 3000)
+    def on_memo_job_state(self, writer, job):
+        # 提交或丢弃后不再处理之后的状态变化
+        if not job.is_done or writer.closed:
+            return
+        job.output.disconnect(writer.write)
+        if job.state not in (JOB_FINISHED, JOB_FAILED):
+            # 被停止或跳过的运行不完整，不保存
+            writer.discard()
+            return
+        view = self.job_views.get(job.id)
+        findings = None
+        if view is not None and view.results is not None:
+            findings = [row[:-2] for row in view.results.extractor.rows]
+        # 在写入线程中保存，完成后通过信号回到界面线程
+        writer.commit(job.exit_code, findings, partial(self.result_saved.emit, job, writer.key))
+
+    def on_result_saved(self, job, key, run, error):
+        if run is None:
+            self.statusBar().showMessage(f'保存运行结果失败: {error}', 5000)
+            return
+        view = self.job_views.get(job.id)
+        if view is not None and self.result_cache.previous(key, run['id']) is not None:
+            view.enable_diff(partial(self.show_result_diff, job.name, key, run))
+
+    def show_cached_run(self, name, command, key, run, extract_rules, rerun):
+        view = CachedRunView(name, command, run, self.result_cache.run_path(run), self.config, extract_rules)
+        view.rerun_btn.clicked.connect(rerun)
+        if self.result_cache.previous(key, run['id']) is not None:
+            view.enable_diff(partial(self.show_result_diff, name, key, run))
+        self.output_tabs.addTab(view, view.tab_title())
+        self.output_tabs.setCurrentWidget(view)
+        self.statusBar().showMessage(f'{name}: 已复用缓存的运行结果', 3000)
+
+    def show_result_diff(self, name, key, run):
+        """在后台对比这次和上一次运行的输出，完成后显示对比结果"""
+        if self.diff_thread is not None:
+            QMessageBox.warning(self, '提示', '正在对比运行结果，请稍候')
+            return
+        previous = self.result_cache.previous(key, run['id'])
+        if previous is None:
+            QMessageBox.information(self, '提示', '上一次的运行结果已被清理')
+            return
+        self.statusBar().showMessage('正在对比运行结果...')
+        self.diff_thread = ResultDiffThread(
+            self.result_cache.run_path(previous), self.result_cache.run_path(run), self
+        )
+        self.diff_thread.loaded.connect(partial(self.on_diff_loaded, name, previous, run))
+        self.diff_thread.failed.connect(self.on_diff_failed)
+        self.diff_thread.finished.connect(self.on_diff_finished)
+        self.diff_thread.start()
+
+    def on_diff_finished(self):
+        thread, self.diff_thread = self.diff_thread, None
+        thread.deleteLater()
+
+    def on_diff_loaded(self, name, previous, run, diff):
+        findings = None
+        if run.get('findings') is not None and previous.get('findings') is not None:
+            findings = diff_findings(previous['findings'], run['findings'])
+        since = time.strftime('%Y-%m-%d %H:%M', time.localtime(previous['time']))
+        self.statusBar().showMessage(
+            f"与 {since} 相比新增 {diff['added_count']} 行，消失 {diff['removed_count']} 行", 5000
+        )
+        RunDiffDialog(f'{name}: 与 {since} 的运行对比', diff, findings, self).exec_()
+
+    def on_diff_failed(self, error):
+        self.statusBar().showMessage('对比运行结果失败', 3000)
+        QMessageBox.warning(self, '错误', f'对比运行结果失败：{error}')
+
+    def open_job_log(self, name, command=None):
+        """为一次运行创建日志，未开启时返回 None；command 为 None 时不写命令行"""
+        if not self.config.get('job_log_enabled', DEFAULT_SETTINGS['job_log_enabled']):
+            return None
+        compression = self.config.get('job_log_compression', DEFAULT_SETTINGS['job_log_compression'])
+        max_mb = self.config.get('job_log_max_mb', DEFAULT_SETTINGS['job_log_max_mb'])
+        try:
+            log = self.job_logs.open(name, max_mb * 1024 * 1024, compression)
+        except (OSError, ValueError) as e:
+            self.on_job_log_failed(str(e))
+            return None
+        if command is not None:
+            log.write(f"$ {command}\n".encode('utf-8'))
+        return log
+
+    def on_job_log_failed(self, error):
+        self.statusBar().showMessage(f'写入任务日志失败: {error}', 5000)
+
+    def edit_max_parallel(self):
+        """设置并发任务数上限"""
+        value, ok = QInputDialog.getInt(
+            self, '并发任务数', f'同时运行的任务数上限（本机 {os.cpu_count() or 1} 核）：',
+            self.jobs.max_parallel, 1, 256
+        )
+        if ok:
+            self.config['max_parallel_jobs'] = value
+            self.jobs.set_max_parallel(value)
+            self.store.set(['max_parallel_jobs'], value)
+            self.update_job_stats()
+            self.statusBar().showMessage(f'并发任务数上限: {value}', 3000)
+
+    def run_job(self, name, command, log_name=None, **options):
+        """以独立进程运行命令，输出显示在单独的标签页，同时另存到任务日志
+
+        options 为优先级、上游任务和参数绑定等队列选项，见 JobManager.submit
+        """
+        try:
+            job = self.jobs.submit(name, command, **options)
+        except ValueError as e:
+            QMessageBox.warning(self, '错误', str(e))
+            return None
+        # 任务在事件循环中才会产生输出，提交后再连接日志不会漏掉数据；
+        # 绑定上游的任务启动时命令才确定，到时再写命令行
+        log = self.open_job_log(log_name or name, None if job.bindings else command)
+        if log is not None:
+            job.output.connect(log.write)
+            job.state_changed.connect(partial(self.on_logged_job_state, log))
+            if job.is_done:
+                self.on_logged_job_state(log, job)
+        if job.state == JOB_WAITING:
+            self.statusBar().showMessage(f'已提交任务 #{job.id}: {name}，等待上游任务完成', 3000)
+        else:
+            self.statusBar().showMessage(f'已提交任务 #{job.id}: {name}', 3000)
+        return job
+
+    def on_logged_job_state(self, log, job):
+        if job.state == JOB_RUNNING and job.bindings:
+            log.write(f"$ {job.command}\n".encode('utf-8'))
+        if job.is_done:
+            log.write(f"\n[{job.state} 退出码: {job.exit_code}]\n".encode('utf-8'))
+            log.close()
+
+    def run_batch(self, name, template, values, batch, workers, retries, log_name=None, extract_rules=None):
+        """按目标列表展开模板，并发批量运行"""
+        try:
+            batch_values = {p: load_batch_values(source) for p, source in batch.items()}
+        except OSError as e:
+            QMessageBox.critical(self, '错误', f'读取目标列表失败：{e}')
+            return
+        empty = [p for p, v in batch_values.items() if not v]
+        if empty:
+            QMessageBox.warning(self, '提示', f"批量参数 {', '.join(empty)} 没有可用的值")
+            return
+
+        quote = self.config.get('quote_params', DEFAULT_SETTINGS['quote_params'])
+        run = BatchRun(
+            name, expand_batch(template, values, batch_values, quote), workers, retries, self, self.monitor
+        )
+        view = BatchView(run, self.config, extract_rules=extract_rules)
+        log = self.open_job_log(log_name or name, f'{template}  ({len(run.targets)} 个目标)')
+        if log is not None:
+            run.output.connect(log.write)
+            run.finished.connect(log.close)
+        run.target_changed.connect(partial(self.on_batch_changed, view))
+        run.finished.connect(partial(self.on_batch_changed, view))
+        self.output_tabs.addTab(view, view.tab_title())
+        self.output_tabs.setCurrentWidget(view)
+        run.start()
+        self.statusBar().showMessage(f'已开始批量运行 {name}: {len(run.targets)} 个目标', 3000)
+
+    def on_batch_changed(self, view, *args):
+        index = self.output_tabs.indexOf(view)
+        if index >= 0:
+            self.output_tabs.setTabText(index, view.tab_title())
+
+    def on_job_added(self, job):
+        view = JobView(job, self.config)
+        self.job_views[job.id] = view
+        self.output_tabs.addTab(view, view.tab_title())
+        self.output_tabs.setCurrentWidget(view)
+        self.update_job_stats()
+
+    def on_job_changed(self, job):
+        view = self.job_views.get(job.id)
+        if view is not None:
+            index = self.output_tabs.indexOf(view)
+            if index >= 0:
+                self.output_tabs.setTabText(index, view.tab_title())
+        self.update_job_stats()
+
+    def update_job_stats(self):
+        self.job_stats_label.setText(
+            f'任务 运行 {self.jobs.running_count()} / 排队 {self.jobs.queued_count()} '
+            f'/ 上限 {self.jobs.max_parallel}'
+        )
+
+    def show_job_history(self):
+        if self.history_view is None:
+            self.history_view = JobHistoryView(self.monitor)
+        if self.output_tabs.indexOf(self.history_view) < 0:
+            self.output_tabs.addTab(self.history_view, '任务历史')
+        self.output_tabs.setCurrentWidget(self.history_view)
+
+    def close_job_tab(self, index):
+        view = self.output_tabs.widget(index)
+        if view is self.history_view:
+            # 只移除标签页，再次打开时保留排序等状态
+            self.output_tabs.removeTab(index)
+            return
+        if isinstance(view, BatchView):
+            if not view.batch.is_done:
+                reply = QMessageBox.question(
+                    self, '确认关闭', '批量任务仍在运行，关闭将停止所有目标，是否继续?',
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+                )
+                if reply != QMessageBox.Yes:
+                    return
+                view.batch.stop()
+            self.output_tabs.removeTab(index)
+            view.deleteLater()
+            return
+        if isinstance(view, CachedRunView):
+            view.cancel()
+            self.output_tabs.removeTab(index)
+            view.deleteLater()
+            return
+        if not isinstance(view, JobView):
+            return
+        if not view.job.is_done:
+            reply = QMessageBox.question(
+                self, '确认关闭',
+                f"任务 #{view.job.id} 仍在{view.job.state}，关闭将停止该任务，是否继续?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+            view.job.stop()
+        self.output_tabs.removeTab(index)
+        self.job_views.pop(view.job.id, None)
+        view.deleteLater()
+
+    def stop_all_jobs(self):
+        """停止所有运行中和排队中的任务"""
+        self.jobs.stop_all()
+        self.statusBar().showMessage('已停止全部任务', 3000)
+
+    def show_scrollback(self):
+        """分页查看会话日志中的更早输出"""
+        ScrollbackDialog(self.session_log, self).exec_()
+
+    def show_find_bar(self):
+        self.find_bar.show()
+        self.find_bar.edit.setFocus()
+        self.find_bar.edit.selectAll()
+
+    def output_view_of(self, widget):
+        """标签页中显示输出的文本控件"""
+        if widget is self.terminal:
+            return self.terminal
+        return getattr(widget, 'output_view', None)
+
+    def find_sources(self, search_logs):
+        if not search_logs:
+            tab = self.output_tabs.currentWidget()
+            view = self.output_view_of(tab)
+            if view is None:
+                return []
+            label = self.output_tabs.tabText(self.output_tabs.currentIndex())
+            return [(label, view, view.toPlainText().encode('utf-8'))]
+        self.session_log.flush()
+        sources = [('会话日志', self.session_log.path, None)]
+        try:
+            names = os.listdir(JOB_LOG_DIR)
+        except OSError:
+            names = []
+        paths = [os.path.join(JOB_LOG_DIR, n) for n in names]
+        # 最近的任务日志优先
+        paths.sort(key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0, reverse=True)
+        sources += [(os.path.basename(p), p, None) for p in paths]
+        return sources
+
+    def start_find(self, text, regex, case, search_logs):
+        try:
+            pattern = compile_pattern(text, regex, case)
+        except re.error as e:
+            self.find_bar.clear_results(f'正则表达式错误: {e}')
+            return
+        self.cancel_find()
+        sources = self.find_sources(search_logs)
+        self.find_bar.clear_results('正在搜索...')
+        thread = self.find_thread = FindThread(sources, pattern, self)
+        thread.found.connect(partial(self.on_find_results, thread))
+        thread.done.connect(partial(self.on_find_done, thread))
+        thread.finished.connect(thread.deleteLater)
+        thread.start()
+
+    def cancel_find(self):
+        if self.find_thread is not None:
+            self.find_thread.cancel()
+            self.find_thread = None
+
+    def on_find_results(self, thread, results):
+        # 旧的搜索可能还有结果在事件队列中，不再显示
+        if thread is self.find_thread:
+            self.find_bar.add_results(results)
+
+    def on_find_done(self, thread, count, truncated):
+        if thread is not self.find_thread:
+            return
+        self.find_thread = None
+        message = f'找到 {count} 行'
+        if truncated:
+            message += '，结果过多已停止搜索，请缩小范围'
+        self.find_bar.status_label.setText(message)
+
+    def jump_to_find_result(self, result):
+        label, ref, line, text = result
+        if isinstance(ref, str):
+            try:
+                LogViewDialog(ref, line, self).exec_()
+            except OSError as e:
+                QMessageBox.warning(self, '提示', f'无法打开日志: {e}')
+            return
+        try:
+            doc = ref.document()
+        except RuntimeError:
+            self.find_bar.status_label.setText('该输出页已关闭')
+            return
+        block = doc.findBlockByNumber(line)
+        if block.isValid() and block.text() == text:
+            cursor = QTextCursor(block)
+        else:
+            # 超出保留行数的旧行被移除后行号会变化，按内容重新定位
+            cursor = doc.find(text)
+            if cursor.isNull():
+                self.find_bar.status_label.setText('该行已不在当前输出中，可在日志中查找')
+                return
+        for i in range(self.output_tabs.count()):
+            if self.output_view_of(self.output_tabs.widget(i)) is ref:
+                self.output_tabs.setCurrentIndex(i)
+                break
+        cursor.movePosition(QTextCursor.StartOfBlock)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        ref.setTextCursor(cursor)
+        ref.centerCursor()
 
     def stop_shell(self):
-        """强制停止当前命令"""
-        if self.shell.state() == QProcess.Running:
-            self.shell.terminate()
-            if not self.shell.waitForFinished(1000):
-                self.shell.kill()
-            self.statusBar().showMessage('已强制停止当前命令', 3000)
+        """强制停止当前命令，shell 退出后自动重新启动"""
+        if self.shell.stop():
+            self.statusBar().showMessage('正在停止当前命令...', 3000)
         else:
             self.statusBar().showMessage('没有正在运行的进程', 3000)
 
     def show_context_menu(self, position):
-        item = self.tree.itemAt(position)
-        if not item:
+        index = self.tree.indexAt(position)
+        if not index.isValid():
             return
+        self.tree.setCurrentIndex(index)
+        node = self.catalog.node(index)
         
         menu = QMenu()
-        typ, data = item.data(0, Qt.UserRole)
+        typ = node.kind
         
         if typ == 'category':
             edit_action = QAction('修改分类', self)
@@ -626,60 +3831,171 @@ class ToolRunner(QMainWindow):
             
         elif typ == 'command':
             run_action = QAction('运行命令', self)
-            run_action.triggered.connect(lambda: self.on_item_double(item, 0))
+            run_action.triggered.connect(lambda: self.on_item_double(index))
             menu.addAction(run_action)
             
             edit_action = QAction('修改命令', self)
-            edit_action.triggered.connect(lambda: self.edit_command(item))
+            edit_action.triggered.connect(lambda: self.edit_command(node))
             menu.addAction(edit_action)
             
             del_action = QAction('删除命令', self)
-            del_action.triggered.connect(lambda: self.delete_command(item))
+            del_action.triggered.connect(lambda: self.delete_command(node))
             menu.addAction(del_action)
             
         menu.exec_(self.tree.viewport().mapToGlobal(position))
 
     def load_remote_config(self):
-        url, ok = QInputDialog.getText(self, '远程配置 URL', '请输入 commands.json 的 URL：')
+        if self.remote_thread is not None:
+            QMessageBox.warning(self, '提示', '正在加载远程配置，请稍候')
+            return
+        url, ok = QInputDialog.getText(
+            self, '远程配置 URL', '请输入 commands.json 的 URL：',
+            text=self.config.get('remote_url', '')
+        )
         if not ok or not url:
             return
+
+        self.statusBar().showMessage('正在从远程加载配置...')
+        self.fetcher.timeout = self.config.get('remote_timeout', DEFAULT_SETTINGS['remote_timeout'])
+        self.remote_thread = RemoteFetchThread(self.fetcher, url, self)
+        self.remote_thread.loaded.connect(partial(self.on_remote_loaded, url))
+        self.remote_thread.failed.connect(self.on_remote_failed)
+        self.remote_thread.finished.connect(self.on_remote_finished)
+
+        self.remote_progress = QProgressDialog('正在从远程加载配置...', '取消', 0, 0, self)
+        self.remote_progress.setWindowTitle('远程配置')
+        self.remote_progress.setMinimumDuration(0)
+        self.remote_progress.canceled.connect(self.cancel_remote_config)
+        self.remote_progress.show()
+        self.remote_thread.start()
+
+    def cancel_remote_config(self):
+        if self.remote_thread is not None:
+            self.remote_thread.cancel()
+            self.statusBar().showMessage('已取消加载远程配置', 3000)
+
+    def on_remote_finished(self):
+        thread, self.remote_thread = self.remote_thread, None
+        thread.deleteLater()
+        self.remote_progress.canceled.disconnect(self.cancel_remote_config)
+        self.remote_progress.close()
+
+    def on_remote_loaded(self, url, data, not_modified):
+        # 只用远程的命令目录覆盖本地，界面和运行设置始终保留本地的
         try:
-            self.statusBar().showMessage('正在从远程加载配置...')
-            QApplication.processEvents()  # 更新UI
-            
-            resp = requests.get(url)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            # 覆盖本地配置
-            self.config = {'categories': data} if isinstance(data, list) else data
+            categories = catalog_categories(data)
+        except ValueError as e:
+            self.on_remote_failed(str(e))
+            return
+        settings = {k: self.config.get(k, v) for k, v in DEFAULT_SETTINGS.items()}
+        self.config = {**settings, 'categories': categories}
+        self.config['remote_url'] = url
+        self.save_config()
+        self.refresh_tree()
+
+        message = '远程配置未变化，已使用本地缓存' if not_modified else '已从远程加载并更新配置'
+        self.statusBar().showMessage(message, 3000)
+        QMessageBox.information(self, '成功', message)
+
+    def on_remote_failed(self, error):
+        self.statusBar().showMessage('加载远程配置失败', 3000)
+        QMessageBox.critical(self, '错误', f'加载远程配置失败：{error}')
+
+    def edit_sources(self):
+        old_sources = self.config.get('catalog_sources', DEFAULT_SETTINGS['catalog_sources'])
+        dialog = SourcesDialog(
+            old_sources,
+            self.config.get('catalog_merge_policy', DEFAULT_SETTINGS['catalog_merge_policy']),
+            self.config.get('catalog_refresh_minutes', DEFAULT_SETTINGS['catalog_refresh_minutes']),
+            self
+        )
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        sources, policy, minutes = dialog.get_values()
+        for key, value in (('catalog_sources', sources), ('catalog_merge_policy', policy),
+                           ('catalog_refresh_minutes', minutes)):
+            self.config[key] = value
+            self.store.set([key], value)
+
+        removed = [s for s in old_sources if s not in sources]
+        if removed and QMessageBox.question(
+            self, '订阅源', f'是否从目录中删除已取消订阅的 {len(removed)} 个来源加入的命令？（修改过的命令会保留）'
+        ) == QMessageBox.Yes:
+            count = sum(merge_catalog(self.config['categories'], [], source)['removed'] for source in removed)
+            if count:
+                self.save_config()
+                self.refresh_tree()
+            self.statusBar().showMessage(f'已删除 {count} 条订阅命令', 3000)
+        if [s for s in sources if s not in old_sources]:
+            self.sync_sources(manual=True)
+        else:
+            self.schedule_sync()
+
+    def schedule_sync(self, delay=None):
+        """安排下一次后台同步，delay 为毫秒，默认按设置的间隔"""
+        self.sync_timer.stop()
+        minutes = self.config.get('catalog_refresh_minutes', DEFAULT_SETTINGS['catalog_refresh_minutes'])
+        if not self.config.get('catalog_sources') or minutes <= 0:
+            return
+        self.sync_timer.start(minutes * 60000 if delay is None else delay)
+
+    def sync_sources(self, manual=False):
+        """获取所有订阅源并合并；手动同步忽略缓存完整获取一次，后台同步只发条件请求"""
+        sources = self.config.get('catalog_sources', DEFAULT_SETTINGS['catalog_sources'])
+        if self.sync_thread is not None:
+            if manual:
+                QMessageBox.warning(self, '提示', '正在同步订阅源，请稍候')
+            return
+        if not sources:
+            if manual:
+                QMessageBox.information(self, '提示', '还没有订阅源，请先在 配置 > 订阅源 中添加')
+            return
+        if manual:
+            self.statusBar().showMessage('正在同步订阅源...')
+        self.sync_timer.stop()
+        self.fetcher.timeout = self.config.get('remote_timeout', DEFAULT_SETTINGS['remote_timeout'])
+        workers = self.config.get('catalog_fetch_workers', DEFAULT_SETTINGS['catalog_fetch_workers'])
+        self.sync_thread = CatalogSyncThread(self.fetcher, list(sources), workers, manual, self)
+        self.sync_thread.fetched.connect(partial(self.on_sources_fetched, manual))
+        self.sync_thread.finished.connect(self.on_sync_finished)
+        self.sync_thread.start()
+
+    def on_sync_finished(self):
+        thread, self.sync_thread = self.sync_thread, None
+        thread.deleteLater()
+        self.schedule_sync()
+
+    def on_sources_fetched(self, manual, results):
+        policy = self.config.get('catalog_merge_policy', DEFAULT_SETTINGS['catalog_merge_policy'])
+        total = {'added': 0, 'updated': 0, 'removed': 0, 'conflicts': 0}
+        errors = []
+        for source, data, not_modified, error in results:
+            # 获取失败的来源不参与合并，已加入的命令原样保留
+            if error is None and not not_modified:
+                try:
+                    stats = merge_catalog(self.config['categories'], catalog_categories(data), source, policy)
+                except ValueError as e:
+                    error = str(e)
+                else:
+                    for key, value in stats.items():
+                        total[key] += value
+            if error is not None:
+                errors.append(f'{source}: {error}')
+
+        changed = total['added'] or total['updated'] or total['removed']
+        if changed:
             self.save_config()
             self.refresh_tree()
-            
-            self.statusBar().showMessage('已从远程加载并更新配置', 3000)
-            QMessageBox.information(self, '成功', '已从远程加载并更新配置')
-        except Exception as e:
-            self.statusBar().showMessage('加载远程配置失败', 3000)
-            QMessageBox.critical(self, '错误', f'加载远程配置失败：{e}')
-
-    def start_shell(self):
-        self.shell = QProcess(self)
-        self.shell.setProcessChannelMode(QProcess.MergedChannels)
-        self.shell.readyRead.connect(self.on_shell_output)
-        shell_cmd, shell_args = self.get_shell_command()
-        self.shell.start(shell_cmd, shell_args)
-        
-        # 定时检查shell状态
-        self.shell_timer = QTimer(self)
-        self.shell_timer.timeout.connect(self.check_shell_status)
-        self.shell_timer.start(1000)
-
-    def check_shell_status(self):
-        if self.shell.state() == QProcess.NotRunning:
-            self.statusBar().showMessage('终端未运行', 2000)
-            self.shell_timer.stop()
-            # 尝试重新启动
-            QTimer.singleShot(2000, self.start_shell)
+        summary = (f"订阅源同步完成：新增 {total['added']}，更新 {total['updated']}，"
+                   f"删除 {total['removed']}，冲突 {total['conflicts']}")
+        if not changed and not total['conflicts']:
+            summary = '订阅源没有变化'
+        if errors:
+            self.statusBar().showMessage(f'{summary}，{len(errors)} 个来源失败', 5000)
+            if manual:
+                QMessageBox.warning(self, '订阅源', '以下来源同步失败：\n' + '\n'.join(errors))
+        elif manual or changed:
+            self.statusBar().showMessage(summary, 5000)
 
     def get_shell_command(self):
         system = platform.system()
@@ -689,72 +4005,209 @@ class ToolRunner(QMainWindow):
             return '/bin/bash', ['-i']
 
     def load_config(self):
-        if os.path.exists(CONFIG_FILE):
-            try:
-                with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                # 合并加载的配置和默认配置
-                if isinstance(data, list):
-                    self.config = {'categories': data, 'use_internal_terminal': True}
-                else:
-                    self.config = {'categories': data.get('categories', []), 
-                                 'use_internal_terminal': data.get('use_internal_terminal', True)}
-                self.statusBar().showMessage('配置已加载', 2000)
-            except Exception as e:
-                self.statusBar().showMessage('加载配置失败，使用默认配置', 3000)
-                self.config = {'categories': [], 'use_internal_terminal': True}
-                self.save_config()
-        else:
-            self.config = {'categories': [], 'use_internal_terminal': True}
+        try:
+            data = self.store.load()
+        except ConfigCorrupted as e:
+            # 损坏的文件已改名备份，不会被默认配置覆盖
+            QMessageBox.warning(self, '配置文件损坏', f'{e}\n\n将使用默认配置启动，可从备份中手动恢复。')
+            data = None
+        except Exception as e:
+            # 不是内容损坏（例如没有读取权限），原文件没有备份，不能用默认配置覆盖
+            QMessageBox.critical(
+                self, '错误', f'读取配置失败: {str(e)}\n\n将以只读方式使用默认配置启动，本次的修改不会保存。'
+            )
+            self.config = default_config()
+            self.store.read_only = True
+            self.setWindowTitle(self.windowTitle() + '（配置只读）')
+            return
+
+        if data is None:
+            self.config = default_config()
+            self.store.start(self.config)
             self.save_config()
             self.statusBar().showMessage('创建了新的配置文件', 2000)
+            return
+        self.config = normalize_config(data)
+        self.store.start(self.config)
+        if self.config != data:
+            self.save_config()
+        self.statusBar().showMessage('配置已加载', 2000)
 
     def save_config(self):
-        try:
-            with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-            self.statusBar().showMessage('配置已保存', 2000)
-        except Exception as e:
-            self.statusBar().showMessage(f'保存配置失败: {str(e)}', 3000)
+        """整体替换配置，只用于导入、加载远程配置等场景，日常修改记录单条变更"""
+        self.store.replace(self.config)
+
+    def on_config_save_failed(self, error):
+        self.statusBar().showMessage(f'保存配置失败: {error}', 5000)
 
     def refresh_tree(self):
-        self.tree.clear()
-        for cat in self.config['categories']:
-            cat_item = QTreeWidgetItem([f"📁 {cat['name']}"])
-            cat_item.setData(0, Qt.UserRole, ('category', cat))
-            cat_item.setToolTip(0, f"分类: {cat['name']}")
-            self.tree.addTopLevelItem(cat_item)
-            
-            for tool in cat.get('tools', []):
-                tool_item = QTreeWidgetItem([f"🛠️ {tool['name']}"])
-                tool_item.setData(0, Qt.UserRole, ('tool', tool))
-                tool_item.setToolTip(0, f"工具: {tool['name']}\n描述: {tool.get('description', '无描述')}")
-                cat_item.addChild(tool_item)
-                
-                for cmd in tool.get('commands', []):
-                    cmd_item = QTreeWidgetItem([f"▶ {cmd['name']}"])
-                    cmd_item.setData(0, Qt.UserRole, ('command', cmd))
-                    cmd_item.setToolTip(0, f"命令: {cmd['name']}\n模板: {cmd['template']}")
-                    tool_item.addChild(cmd_item)
-        
-        self.tree.expandAll()
+        """完整重建命令树，仅在导入或加载远程配置等整体替换时使用
+
+        重建前后保留节点的展开和选中状态。首次构建时小目录全部展开，
+        大目录只展开分类，命令节点在展开工具时才加入视图。
+        """
+        first_build = not self.catalog.root.children
+        expanded = [node.path() for node in self.iter_fetched_nodes()
+                    if self.tree.isExpanded(self.catalog.index_for(node))]
+        current = self.current_node()
+        selected = current.path() if current is not None else None
+        scroll = self.tree.verticalScrollBar().value()
+
+        self.tree.setUpdatesEnabled(False)
+        self.catalog.set_catalog(self.config)
+        if first_build:
+            command_count = sum(
+                len(tool.get('commands', []))
+                for cat in self.config['categories'] for tool in cat.get('tools', [])
+            )
+            if command_count <= 1000:
+                self.tree.expandAll()
+            else:
+                for node in self.catalog.root.children:
+                    self.tree.expand(self.catalog.index_for(node))
+        else:
+            for path in sorted(expanded, key=len):
+                node = self.catalog.find_path(path)
+                if node is not None:
+                    self.tree.expand(self.catalog.index_for(node))
+            node = self.catalog.find_path(selected) if selected else None
+            if node is not None:
+                self.tree.setCurrentIndex(self.catalog.index_for(node))
+        self.tree.setUpdatesEnabled(True)
+        self.tree.verticalScrollBar().setValue(scroll)
+        self.rebuild_search_index()
         self.statusBar().showMessage('命令树已刷新', 2000)
 
+    def rebuild_search_index(self):
+        """分批重建搜索索引，每批之间让出事件循环"""
+        self.search_index.start_build(catalog_entries(self.catalog.root.data))
+        QTimer.singleShot(0, self.build_search_index_step)
+
+    def build_search_index_step(self):
+        if self.search_index.build_step():
+            QTimer.singleShot(0, self.build_search_index_step)
+        elif self.search_box.text():
+            self.on_search(self.search_box.text())
+
+    def index_node(self, node):
+        """将节点及其子节点加入（或更新到）搜索索引"""
+        owners = node.path()[-2::-1]
+        for entry in catalog_entries(node.data, node.kind, node.rows(), owners):
+            self.search_index.add(*entry)
+
+    def unindex_node(self, node):
+        """节点的数据已从配置中删除、节点还没有从模型中删除时调用
+
+        索引以行号路径为键，后面的兄弟节点行号减一，要换成新的键重新加入。
+        """
+        if not self.search_index.ready:
+            # 分批构建中的条目按旧的行号生成，直接重新构建
+            self.rebuild_search_index()
+            return
+        prefix = node.parent.rows()
+        owners = node.path()[-2::-1]
+        for key, _, _ in catalog_entries(node.data, node.kind, prefix + (node.row,)):
+            self.search_index.remove(key)
+        shifted = self.catalog.child_data(node.parent)[node.row:]
+        for row, data in enumerate(shifted, node.row):
+            for key, _, _ in catalog_entries(data, node.kind, prefix + (row + 1,)):
+                self.search_index.remove(key)
+            for entry in catalog_entries(data, node.kind, prefix + (row,), owners):
+                self.search_index.add(*entry)
+
+    def on_search(self, text):
+        keys = self.search_index.search(text) if text.strip() else []
+        searching = bool(text.strip())
+        self.search_results.setVisible(searching)
+        self.tree.setVisible(not searching)
+        if not searching:
+            return
+
+        self.search_results.setUpdatesEnabled(False)
+        self.search_results.clear()
+        for key in keys:
+            items = self.catalog.data_path(key)
+            data = items[-1]
+            if len(items) == 3:
+                label = f"▶ {data['name']}    {items[0]['name']} / {items[1]['name']}"
+                tip = f"模板: {data['template']}"
+            elif len(items) == 2:
+                label = f"🛠️ {data['name']}    {items[0]['name']}"
+                tip = f"描述: {data.get('description', '无描述')}"
+            else:
+                label = f"📁 {data['name']}"
+                tip = f"分类: {data['name']}"
+            item = QListWidgetItem(label)
+            item.setToolTip(tip)
+            item.setData(Qt.UserRole, key)
+            self.search_results.addItem(item)
+        self.search_results.setUpdatesEnabled(True)
+
+        message = f'找到 {len(keys)} 个结果'
+        if not self.search_index.ready:
+            message += '（索引构建中，结果可能不完整）'
+        self.statusBar().showMessage(message, 2000)
+
+    def search_result_node(self, item):
+        """搜索结果对应的节点，只创建到它为止的节点；节点已被删除时返回 None"""
+        return self.catalog.find_rows(item.data(Qt.UserRole))
+
+    def locate_search_result(self, item):
+        """清空搜索并在命令树中选中结果"""
+        node = self.search_result_node(item)
+        self.search_box.clear()
+        if node is not None:
+            self.select_node(node)
+            self.tree.setFocus()
+
+    def run_search_result(self, item):
+        node = self.search_result_node(item)
+        if node is not None and node.kind == 'command':
+            self.on_item_double(self.catalog.index_for(node))
+        else:
+            self.locate_search_result(item)
+
+    def open_first_search_result(self):
+        if self.search_results.count():
+            self.run_search_result(self.search_results.item(0))
+
+    def iter_fetched_nodes(self):
+        stack = list(self.catalog.root.children)
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.fetched:
+                stack.extend(node.children)
+
+    def current_node(self):
+        index = self.tree.currentIndex()
+        return self.catalog.node(index) if index.isValid() else None
+
+    def select_node(self, node):
+        """展开父节点并选中指定节点"""
+        index = self.catalog.index_for(node)
+        self.tree.expand(index.parent())
+        self.tree.setCurrentIndex(index)
+        self.tree.scrollTo(index)
+
     def add_category(self):
         name, ok = QInputDialog.getText(self, '新建分类', '请输入分类名称（例如：文档处理）：')
         if ok and name:
-            self.config['categories'].append({'name': name, 'tools': []})
-            self.save_config()
-            self.refresh_tree()
+            cat = {'name': name, 'tools': []}
+            self.config['categories'].append(cat)
+            self.store.append(['categories'], cat)
+            node = self.catalog.append_child(self.catalog.root, cat)
+            self.index_node(node)
+            self.select_node(node)
             self.statusBar().showMessage(f'已添加分类: {name}', 3000)
 
     def edit_category(self):
-        item = self.tree.currentItem()
-        if not item:
+        node = self.current_node()
+        if not node:
             QMessageBox.warning(self, '提示', '请先选择一个分类')
             return
             
-        typ, cat = item.data(0, Qt.UserRole)
+        typ, cat = node.kind, node.data
         if typ != 'category':
             QMessageBox.warning(self, '提示', '只能修改分类节点')
             return
@@ -762,17 +4215,18 @@ class ToolRunner(QMainWindow):
         new_name, ok = QInputDialog.getText(self, '修改分类', '请输入新的分类名称：', text=cat['name'])
         if ok and new_name:
             cat['name'] = new_name
-            self.save_config()
-            self.refresh_tree()
+            self.store.set(node.config_path() + ['name'], new_name)
+            self.catalog.node_changed(node)
+            self.index_node(node)
             self.statusBar().showMessage(f'已更新分类: {new_name}', 3000)
 
     def delete_category(self):
-        item = self.tree.currentItem()
-        if not item:
+        node = self.current_node()
+        if not node:
             QMessageBox.warning(self, '提示', '请先选择一个分类')
             return
             
-        typ, cat = item.data(0, Qt.UserRole)
+        typ, cat = node.kind, node.data
         if typ != 'category':
             QMessageBox.warning(self, '提示', '只能删除分类节点')
             return
@@ -784,17 +4238,12 @@ class ToolRunner(QMainWindow):
         )
         
         if reply == QMessageBox.Yes:
-            self.config['categories'].remove(cat)
-            self.save_config()
-            self.refresh_tree()
+            path = node.config_path()
+            del self.config['categories'][node.row]
+            self.store.delete(path)
+            self.unindex_node(node)
+            self.catalog.remove_node(node)
             self.statusBar().showMessage(f'已删除分类: {cat["name"]}', 3000)
-        try:
-            self.config['categories'].remove(cat)
-        except ValueError:
-            QMessageBox.warning(self, '错误', '删除分类失败，请重试')
-            return
-        self.save_config()
-        self.refresh_tree()
 
     def add_tool(self):
         cats = [c['name'] for c in self.config['categories']]
@@ -803,12 +4252,11 @@ class ToolRunner(QMainWindow):
             return
             
         # 如果当前选中了分类，默认使用该分类
-        current_item = self.tree.currentItem()
+        current = self.current_node()
         default_cat = 0
-        if current_item:
-            typ, data = current_item.data(0, Qt.UserRole)
-            if typ == 'category':
-                default_cat = cats.index(data['name'])
+        if current:
+            if current.kind == 'category':
+                default_cat = cats.index(current.data['name'])
                 
         cat_name, ok = QInputDialog.getItem(
             self, '选择分类', '请选择工具所属分类：', 
@@ -817,7 +4265,8 @@ class ToolRunner(QMainWindow):
         if not ok:
             return
             
-        cat = next(c for c in self.config['categories'] if c['name'] == cat_name)
+        row = cats.index(cat_name)
+        cat = self.config['categories'][row]
         
         tool_name, ok = QInputDialog.getText(self, '新建工具', '请输入工具名称：')
         if not ok or not tool_name:
@@ -835,8 +4284,7 @@ class ToolRunner(QMainWindow):
         if not ok or not template:
             return
             
-        import re
-        params = re.findall(r"\{(.*?)\}", template)
+        params = template_params(template)
         param_types = {}
         for p in params:
             ptype, ok = QInputDialog.getItem(
@@ -858,17 +4306,23 @@ class ToolRunner(QMainWindow):
         }
         
         cat.setdefault('tools', []).append(tool)
-        self.save_config()
-        self.refresh_tree()
+        self.store.append(['categories', row, 'tools'], tool)
+        cat_node = self.catalog.root.children[row]
+        # 分类还没有展开时先加入视图，才能选中新工具
+        self.catalog.ensure_fetched(cat_node)
+        tool_node = self.catalog.append_child(cat_node, tool)
+        self.index_node(tool_node)
+        self.select_node(tool_node)
+        self.tree.expand(self.catalog.index_for(tool_node))
         self.statusBar().showMessage(f'已添加工具: {tool_name}', 3000)
 
     def edit_tool(self):
-        item = self.tree.currentItem()
-        if not item:
+        node = self.current_node()
+        if not node:
             QMessageBox.warning(self, '提示', '请先选择一个工具')
             return
             
-        typ, tool = item.data(0, Qt.UserRole)
+        typ, tool = node.kind, node.data
         if typ != 'tool':
             QMessageBox.warning(self, '提示', '只能修改工具节点')
             return
@@ -917,40 +4371,38 @@ class ToolRunner(QMainWindow):
         if dialog.exec_() == QDialog.Accepted:
             tool['name'] = name_edit.text()
             tool['description'] = desc_edit.text()
-            self.save_config()
-            self.refresh_tree()
+            path = node.config_path()
+            self.store.set(path + ['name'], tool['name'])
+            self.store.set(path + ['description'], tool['description'])
+            self.catalog.node_changed(node)
+            self.index_node(node)
             self.statusBar().showMessage(f'已更新工具: {tool["name"]}', 3000)
 
     def delete_tool(self):
-        item = self.tree.currentItem()
-        if not item:
+        node = self.current_node()
+        if not node:
             QMessageBox.warning(self, '提示', '请先选择一个工具')
             return
             
-        typ, tool = item.data(0, Qt.UserRole)
+        typ, tool = node.kind, node.data
         if typ != 'tool':
             QMessageBox.warning(self, '提示', '只能删除工具节点')
             return
             
-        # 找到所属分类
-        for cat in self.config['categories']:
-            if tool in cat.get('tools', []):
-                try:
-                    cat['tools'].remove(tool)
-                except ValueError:
-                    QMessageBox.warning(self, '错误', '删除工具失败，请重试')
-                    return
-                self.save_config()
-                self.refresh_tree()
-                break
+        # 从所属分类中删除
+        path = node.config_path()
+        del node.parent.data['tools'][node.row]
+        self.store.delete(path)
+        self.unindex_node(node)
+        self.catalog.remove_node(node)
 
     def add_command(self):
-        item = self.tree.currentItem()
-        if not item:
+        node = self.current_node()
+        if not node:
             QMessageBox.warning(self, '提示', '请先选择一个工具')
             return
             
-        typ, tool = item.data(0, Qt.UserRole)
+        typ, tool = node.kind, node.data
         if typ != 'tool':
             QMessageBox.warning(self, '提示', '只能在工具节点下添加命令')
             return
@@ -967,8 +4419,7 @@ class ToolRunner(QMainWindow):
         if not ok or not template:
             return
             
-        import re
-        params = re.findall(r"\{(.*?)\}", template)
+        params = template_params(template)
         param_types = {}
         for p in params:
             ptype, ok = QInputDialog.getItem(
@@ -985,12 +4436,14 @@ class ToolRunner(QMainWindow):
             'param_types': param_types
         })
         
-        self.save_config()
-        self.refresh_tree()
+        self.store.append(node.config_path() + ['commands'], tool['commands'][-1])
+        cmd_node = self.catalog.append_child(node, tool['commands'][-1])
+        self.index_node(cmd_node)
+        self.select_node(cmd_node)
         self.statusBar().showMessage(f'已添加命令: {cmd_name}', 3000)
 
-    def edit_command(self, item):
-        typ, cmd = item.data(0, Qt.UserRole)
+    def edit_command(self, node):
+        typ, cmd = node.kind, node.data
         if typ != 'command':
             QMessageBox.warning(self, '提示', '只能修改命令节点')
             return
@@ -1022,11 +4475,26 @@ class ToolRunner(QMainWindow):
         param_text = '\n'.join([f"{k}: {v}" for k, v in cmd.get('param_types', {}).items()])
         param_table.setPlainText(param_text)
         layout.addWidget(param_table)
-        
+
+        # 结果提取规则
+        layout.addWidget(QLabel('结果提取规则（每行一条 名称=正则，用命名分组标出字段）:'))
+        rules_edit = QPlainTextEdit(format_rules_text(cmd.get('extract_rules', [])))
+        rules_edit.setPlaceholderText(r'端口=(?P<host>\d+(?:\.\d+){3}):(?P<port>\d+)')
+        layout.addWidget(rules_edit)
+        rules = []
+
+        def check_and_accept():
+            try:
+                rules[:] = parse_rules_text(rules_edit.toPlainText())
+            except ValueError as e:
+                QMessageBox.warning(dialog, '提取规则有误', str(e))
+                return
+            dialog.accept()
+
         # 按钮
         btn_box = QHBoxLayout()
         save_btn = QPushButton('保存')
-        save_btn.clicked.connect(dialog.accept)
+        save_btn.clicked.connect(check_and_accept)
         cancel_btn = QPushButton('取消')
         cancel_btn.clicked.connect(dialog.reject)
         
@@ -1039,54 +4507,115 @@ class ToolRunner(QMainWindow):
         if dialog.exec_() == QDialog.Accepted:
             cmd['name'] = name_edit.text()
             cmd['template'] = template_edit.toPlainText()
-            self.save_config()
-            self.refresh_tree()
+            path = node.config_path()
+            self.store.set(path + ['name'], cmd['name'])
+            self.store.set(path + ['template'], cmd['template'])
+            if rules:
+                cmd['extract_rules'] = rules
+                self.store.set(path + ['extract_rules'], rules)
+            elif cmd.pop('extract_rules', None) is not None:
+                self.store.delete(path + ['extract_rules'])
+            # 修改过的订阅命令转为本地命令，之后不会被订阅源覆盖或删除
+            if cmd.pop('source', None) is not None:
+                self.store.delete(path + ['source'])
+            if cmd.pop('local_original', None) is not None:
+                self.store.delete(path + ['local_original'])
+            self.catalog.node_changed(node)
+            self.index_node(node)
             self.statusBar().showMessage(f'已更新命令: {cmd["name"]}', 3000)
 
-    def delete_command(self, item):
-        typ, cmd = item.data(0, Qt.UserRole)
+    def delete_command(self, node):
+        typ, cmd = node.kind, node.data
         if typ != 'command':
             QMessageBox.warning(self, '提示', '只能删除命令节点')
             return
             
-        # 找到所属工具
-        for cat in self.config['categories']:
-            for tool in cat.get('tools', []):
-                if cmd in tool.get('commands', []):
-                    try:
-                        tool['commands'].remove(cmd)
-                    except ValueError:
-                        QMessageBox.warning(self, '错误', '删除命令失败，请重试')
-                        return
-                    self.save_config()
-                    self.refresh_tree()
-                    return
+        # 从所属工具中删除
+        path = node.config_path()
+        del node.parent.data['commands'][node.row]
+        self.store.delete(path)
+        self.unindex_node(node)
+        self.catalog.remove_node(node)
 
-    def on_item_double(self, item, _):
-        typ, data = item.data(0, Qt.UserRole)
-        if typ == 'command':
-            cmd = data
-            dlg = ParamInputDialog(cmd['template'], cmd.get('param_types', {}), self)
-            if dlg.exec_() == QDialog.Accepted:  # 确保只执行一次
-                vals = dlg.get_values()
-                # 改进的替换逻辑 - 处理各种大括号情况
-                tpl = cmd['template']
-                for k, v in vals.items():
-                    # 处理 {param} 和 {{param}} 两种情况
-                    tpl = tpl.replace(f'{{{k}}}', v).replace(f'{{{{{k}}}}}', v)
-                
-                # 添加调试输出
-                print(f"Final command: {tpl}")  # 调试用
-                
-                # 确保shell准备好
-                if self.shell.state() != QProcess.Running:
-                    shell_cmd, shell_args = self.get_shell_command()
-                    self.shell.start(shell_cmd, shell_args)
-                    self.shell.waitForStarted()  # 等待shell启动
-                
-                # 只发送一次命令
+    def on_item_double(self, index):
+        node = self.catalog.node(index)
+        if node.kind == 'command':
+            self.run_command_node(node)
+
+    def run_command_node(self, node, values=None, batch=()):
+        """弹出参数对话框并运行命令，values 和 batch 为从历史重新运行时预填的参数"""
+        cmd = node.data
+        internal = self.config.get('use_internal_terminal', True)
+        preprocess = {'dedupe': True, 'normalize': True, 'expand': True,
+                      'limit': self.config.get('target_expand_limit', DEFAULT_SETTINGS['target_expand_limit'])}
+        reuse = None
+        if self.config.get('result_cache_enabled', DEFAULT_SETTINGS['result_cache_enabled']):
+            reuse = self.config.get('result_reuse_minutes', DEFAULT_SETTINGS['result_reuse_minutes'])
+        dlg = ParamInputDialog(
+            cmd['template'], cmd.get('param_types', {}), self, workers=self.jobs.max_parallel,
+            jobs=self.upstream_candidates() if internal else None, values=values, batch=batch,
+            targets=self.targets, preprocess_options=preprocess, reuse_minutes=reuse
+        )
+        if dlg.exec_() == QDialog.Accepted:  # 确保只执行一次
+            vals = dlg.get_values()
+            batch = dlg.get_batch()
+            # 日志文件按 工具-命令 命名
+            log_name = f"{node.parent.data['name']}-{cmd['name']}"
+            rules = self.extract_rules_of(cmd)
+            # {param} 按 shell 规则加引号，{{param}} 原样插入
+            quote = self.config.get('quote_params', DEFAULT_SETTINGS['quote_params'])
+            if batch:
+                # 粘贴的目标列表不保存到历史
+                kept = {p: v for p, v in vals.items() if batch.get(p, ('file',))[0] == 'file'}
+                self.record_history(
+                    compile_template(cmd['template']).render(kept, quote), node.path(), kept,
+                    [p for p in batch if p in kept]
+                )
+                self.run_batch(
+                    cmd['name'], cmd['template'], vals, batch,
+                    dlg.workers_spin.value(), dlg.retries_spin.value(), log_name, rules
+                )
+                return
+            tpl = compile_template(cmd['template']).render(vals, quote)
+
+            # 添加调试输出
+            print(f"Final command: {tpl}")  # 调试用
+
+            if internal:
+                # 每次运行使用独立进程，可并行执行
+                options = dlg.get_queue_options()
+                if options['bindings']:
+                    # 绑定上游的参数在任务启动时才有值，先用占位符显示
+                    shown = dict(vals)
+                    for p, (upstream, source) in options['bindings'].items():
+                        shown[p] = f"<#{upstream.id} {'输出文件' if source is None else source}>"
+                    tpl = compile_template(cmd['template']).render(shown, quote)
+                self.record_history(tpl, node.path(), vals)
+                self.run_memo_job(
+                    cmd['name'], tpl, log_name, dlg.get_reuse_minutes(), template=cmd['template'],
+                    values=vals, quote=quote, extract_rules=rules, **options
+                )
+            else:
+                self.record_history(tpl, node.path(), vals)
                 self.run_command(tpl)
 
+    def extract_rules_of(self, cmd):
+        """命令的结果提取规则，规则有误时提示并不提取"""
+        rules = cmd.get('extract_rules')
+        if not rules:
+            return None
+        try:
+            compile_rules(rules)
+        except ValueError as e:
+            self.statusBar().showMessage(f'{e}，本次运行不提取结果', 5000)
+            return None
+        return rules
+
+    def upstream_candidates(self, limit=20):
+        """可作为上游的任务：最近提交且没有失败或停止的任务"""
+        jobs = [job for job in self.jobs.jobs.values() if job.state not in (JOB_FAILED, JOB_STOPPED, JOB_SKIPPED)]
+        return jobs[::-1][:limit]
+
     def eventFilter(self, obj, event):
         if obj == self.terminal and event.type() == event.KeyPress:
             if event.key() == Qt.Key_Return or event.key() == Qt.Key_Enter:
@@ -1114,8 +4643,7 @@ class ToolRunner(QMainWindow):
         if current_line.startswith(self.prompt):
             command = current_line[len(self.prompt):].strip()
             if command:
-                self.command_history.append(command)
-                self.history_index = len(self.command_history)
+                self.record_history(command)
                 self.run_command(command)
         
         # 添加新的提示符
@@ -1123,24 +4651,21 @@ class ToolRunner(QMainWindow):
         self.terminal.moveCursor(QTextCursor.End)
 
     def navigate_history(self, direction):
-        if not self.command_history:
-            return
-            
-        if direction < 0:  # 向上
-            if self.history_index > 0:
-                self.history_index -= 1
-        else:  # 向下
-            if self.history_index < len(self.command_history) - 1:
-                self.history_index += 1
-            else:
-                self.history_index = len(self.command_history)
+        history = self.history
+        history.ensure_loaded()
+        start = len(history.entries) if self.history_pos is None else self.history_pos
+        pos = history.neighbor(start, direction)
+        if pos is None:
+            if direction > 0:
+                # 越过最新一条回到新输入
+                self.history_pos = None
                 self.current_input = ""
-                return
-                
-        # 获取历史命令
-        command = self.command_history[self.history_index]
-        
-        # 更新当前行
+            return
+        self.history_pos = pos
+        self.set_terminal_input(history.entries[pos]['command'])
+
+    def set_terminal_input(self, command):
+        """把终端当前行替换为 command"""
         cursor = self.terminal.textCursor()
         cursor.movePosition(QTextCursor.End)
         cursor.movePosition(QTextCursor.StartOfBlock, QTextCursor.KeepAnchor)
@@ -1148,55 +4673,67 @@ class ToolRunner(QMainWindow):
         cursor.insertText(self.prompt + command)
         self.terminal.setTextCursor(cursor)
 
+    def record_history(self, command, path=None, values=None, batch=None):
+        try:
+            self.history.add(command, path, values, batch)
+        except OSError as e:
+            self.statusBar().showMessage(f'保存命令历史失败: {e}', 5000)
+        self.history_pos = None
+
+    def show_history_search(self):
+        dlg = HistorySearchDialog(self.history, self)
+        if dlg.exec_() != QDialog.Accepted:
+            return
+        entry = dlg.selected_entry()
+        if dlg.action == HistorySearchDialog.RERUN:
+            node = self.catalog.find_path(entry['path'])
+            if node is None or node.kind != 'command':
+                QMessageBox.warning(self, '提示', f"命令 {'/'.join(entry['path'])} 已不存在")
+            else:
+                self.select_node(node)
+                self.run_command_node(node, entry.get('values'), entry.get('batch', ()))
+            return
+        self.set_terminal_input(entry['command'])
+        self.terminal.setFocus()
+
     def run_command(self, cmd):
         """执行命令（根据配置选择终端类型）"""
         if self.config.get('use_internal_terminal', True):
             # 内置终端执行
             self.terminal.appendPlainText(f"\n> {cmd}\n")
+            self.session_log.write(f"\n> {cmd}\n".encode('utf-8'))
             self.terminal.moveCursor(QTextCursor.End)
-            
-            if not self.shell.isOpen():
-                self.start_shell()
-                self.shell.waitForStarted()
-                
-            try:
-                self.shell.write((cmd + '\n').encode('utf-8'))
-                self.statusBar().showMessage(f'正在运行: {cmd.split()[0]}...', 3000)
-            except Exception as e:
-                self.terminal.appendPlainText(f"错误: 无法执行命令 - {str(e)}\n")
-                self.statusBar().showMessage('命令执行失败', 3000)
+
+            # shell 未启动时命令先排队，启动完成后写入，不阻塞界面
+            self.shell.run(cmd)
+            self.statusBar().showMessage(f'正在运行: {cmd.split()[0]}...', 3000)
         else:
-            # 外置终端执行
+            # 外置终端执行，以分离进程启动，不等待终端关闭
             system = platform.system()
             try:
                 if system == 'Windows':
                     os.system(f'start cmd /k "{cmd}"')
+                    started = True
                 elif system == 'Linux':
-                    os.system(f'x-terminal-emulator -e "bash -c \'{cmd}; exec bash\'"')
+                    started = QProcess.startDetached('x-terminal-emulator', ['-e', f"bash -c '{cmd}; exec bash'"])
                 elif system == 'Darwin':
-                    os.system(f'''osascript -e 'tell app "Terminal" to do script "{cmd}"' ''')
+                    started = QProcess.startDetached('osascript', ['-e', f'tell app "Terminal" to do script "{cmd}"'])
+                else:
+                    started = False
+                if not started:
+                    raise OSError('无法启动外置终端程序')
                 self.statusBar().showMessage(f'已在外置终端运行: {cmd}', 3000)
             except Exception as e:
                 QMessageBox.critical(self, '错误', f'启动外置终端失败: {str(e)}')
 
-    def on_shell_output(self):
-        data = self.shell.readAll()
-        text = bytes(data).decode(errors='replace')
-        
-        # 添加时间戳
-        if not hasattr(self, 'last_output_time'):
-            self.last_output_time = 0
-        current_time = time.time()
-        if current_time - self.last_output_time > 1:  # 如果距离上次输出超过1秒
-            timestamp = time.strftime("%H:%M:%S", time.localtime())
-            self.terminal.appendPlainText(f"\n[{timestamp}]")
-            self.last_output_time = current_time
-            
-        self.terminal.insertPlainText(text)
-        self.terminal.moveCursor(QTextCursor.End)
-        
+    def on_output_stats(self, ingest_rate, render_rate, pending):
+        self.output_stats_label.setText(
+            f'输入 {format_size(ingest_rate)}/s | 渲染 {format_size(render_rate)}/s | 积压 {format_size(pending)}'
+        )
         # 更新状态栏
-        if self.shell.state() == QProcess.Running:
+        if self.shell.process is None:
+            return
+        if self.shell.running:
             self.statusBar().showMessage('终端运行中...')
         else:
             self.statusBar().showMessage('终端已停止', 3000)
@@ -1214,20 +4751,41 @@ class ToolRunner(QMainWindow):
                 QMessageBox.critical(self, '错误', f'导出失败: {str(e)}')
 
     def import_config(self):
+        if self.import_thread is not None:
+            QMessageBox.warning(self, '提示', '正在导入配置，请稍候')
+            return
         path, _ = QFileDialog.getOpenFileName(
             self, '导入配置', '', 'JSON Files (*.json)'
         )
         if path:
-            try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                
-                self.config = {'categories': data} if isinstance(data, list) else data
-                self.save_config()
-                self.refresh_tree()
-                self.statusBar().showMessage(f'已从 {path} 导入配置', 3000)
-            except Exception as e:
-                QMessageBox.critical(self, '错误', f'导入失败: {str(e)}')
+            # 大文件解析较慢，放到后台线程
+            self.statusBar().showMessage(f'正在读取 {path}...')
+            self.import_thread = ConfigImportThread(path, self)
+            self.import_thread.loaded.connect(partial(self.on_import_loaded, path))
+            self.import_thread.failed.connect(self.on_import_failed)
+            self.import_thread.finished.connect(self.on_import_finished)
+            self.import_thread.start()
+
+    def on_import_finished(self):
+        thread, self.import_thread = self.import_thread, None
+        thread.deleteLater()
+
+    def on_import_loaded(self, path, data):
+        if not isinstance(data, (dict, list)):
+            self.on_import_failed('文件内容不是配置')
+            return
+        config = normalize_config(data)
+        if not isinstance(config['categories'], list):
+            self.on_import_failed('文件中的 categories 不是分类列表')
+            return
+        self.config = config
+        self.save_config()
+        self.refresh_tree()
+        self.statusBar().showMessage(f'已从 {path} 导入配置', 3000)
+
+    def on_import_failed(self, error):
+        self.statusBar().showMessage('导入配置失败', 3000)
+        QMessageBox.critical(self, '错误', f'导入失败: {error}')
 
     def show_about(self):
         about_text = """
@@ -1245,6 +4803,35 @@ class ToolRunner(QMainWindow):
         """
         QMessageBox.about(self, '关于', about_text)
 
+    def closeEvent(self, event):
+        self.session_log.flush()
+        # 先停止任务并等进程退出，最后的输出写完后再关闭日志和结果缓存
+        for run in self.findChildren(BatchRun):
+            run.stop()
+        self.jobs.stop_all()
+        for job in self.findChildren(Job):
+            job.wait()
+        for cls in (FindThread, RunKeyThread, CachedRunLoader):
+            for thread in self.findChildren(cls):
+                thread.cancel()
+                thread.wait()
+        self.job_logs.close()
+        self.result_cache.close()
+        self.history.close()
+        if self.sync_thread is not None:
+            self.sync_thread.cancel()
+            self.sync_thread.wait()
+        if self.remote_thread is not None:
+            self.remote_thread.cancel()
+            self.remote_thread.wait()
+        if self.import_thread is not None:
+            self.import_thread.wait()
+        if self.diff_thread is not None:
+            self.diff_thread.wait()
+        self.shell.shutdown()
+        self.store.close()
+        super().closeEvent(event)
+
     def switch_theme(self, theme_name):
         self.current_theme = theme_name
         self.apply_theme()
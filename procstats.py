@@ -0,0 +1,95 @@
+"""任务进程的资源占用统计
+
+Linux 上定期读取 /proc，累计每个任务进程树（shell 及其所有子孙进程）的用户态、
+内核态 CPU 时间和内存占用峰值；已经退出并被回收的子进程的 CPU 时间由父进程
+stat 中的 cutime/cstime 计入。没有 /proc 的系统退回到 resource.getrusage
+(RUSAGE_CHILDREN) 在任务前后的差值，只有在任务运行期间没有其他任务并行时才准确。
+本模块不依赖 Qt。
+"""
+import os
+import sys
+
+PROC = '/proc'
+
+
+def proc_available():
+    return os.path.isdir(os.path.join(PROC, 'self'))
+
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+    PAGE_SIZE = 4096
+
+
+def read_stat(pid):
+    """返回 (父进程, 用户态秒, 内核态秒, 已回收子进程用户态秒, 已回收子进程内核态秒, RSS 字节)"""
+    with open(f'{PROC}/{pid}/stat', 'rb') as f:
+        data = f.read()
+    # 进程名可能包含空格和括号，从最后一个 ')' 之后开始解析
+    fields = data[data.rfind(b')') + 2:].split()
+    return (int(fields[1]),
+            int(fields[11]) / CLOCK_TICKS, int(fields[12]) / CLOCK_TICKS,
+            int(fields[13]) / CLOCK_TICKS, int(fields[14]) / CLOCK_TICKS,
+            int(fields[21]) * PAGE_SIZE)
+
+
+def read_peak_rss(pid):
+    """进程自身的内存峰值 VmHWM（字节），读取失败返回 0"""
+    try:
+        with open(f'{PROC}/{pid}/status', 'rb') as f:
+            for line in f:
+                if line.startswith(b'VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def sample_trees(roots):
+    """一次扫描 /proc，返回 {根进程: (用户态秒, 内核态秒, 当前 RSS, 单进程最大峰值)}"""
+    stats = {}
+    children = {}
+    for name in os.listdir(PROC):
+        if not name.isdigit():
+            continue
+        try:
+            stat = read_stat(int(name))
+        except (OSError, ValueError, IndexError):
+            continue
+        stats[int(name)] = stat
+        children.setdefault(stat[0], []).append(int(name))
+
+    result = {}
+    for root in roots:
+        if root not in stats:
+            continue
+        user = system = rss = peak = 0
+        stack = [root]
+        while stack:
+            pid = stack.pop()
+            stat = stats.get(pid)
+            if stat is None:
+                continue
+            _, utime, stime, cutime, cstime, pid_rss = stat
+            user += utime + cutime
+            system += stime + cstime
+            rss += pid_rss
+            peak = max(peak, read_peak_rss(pid))
+            stack.extend(children.get(pid, ()))
+        result[root] = (user, system, rss, peak)
+    return result
+
+
+def children_rusage():
+    """已回收子进程的累计 (用户态秒, 内核态秒, 最大 RSS 字节)，不支持时返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # macOS 的 ru_maxrss 单位为字节，其余为 KB
+    maxrss = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    return usage.ru_utime, usage.ru_stime, maxrss
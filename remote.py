@@ -0,0 +1,307 @@
+"""远程命令配置获取与订阅合并
+
+使用持久的 requests.Session 复用连接，并在本地缓存上一次的响应。再次获取时
+带上 ETag / Last-Modified 发起条件请求，配置未变化时服务器只需返回 304；
+本地文件来源按修改时间和大小判断是否变化。多个订阅源由线程池并发获取，
+共用同一个连接池，再按 分类/工具/命令 名称合并到本地目录。
+本模块不依赖 Qt，可以直接用本地 HTTP 服务测试。
+"""
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+REMOTE_CACHE_DIR = os.path.join('cache', 'remote')
+CHUNK_SIZE = 64 * 1024
+
+
+class FetchCancelled(Exception):
+    """获取过程被用户取消"""
+
+
+# 合并冲突（本地已有同名命令且内容不同）的处理方式
+MERGE_POLICIES = {'local': '保留本地', 'remote': '使用订阅源', 'both': '两者都保留'}
+
+
+def is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+
+class CatalogFetcher:
+    def __init__(self, cache_dir=REMOTE_CACHE_DIR, timeout=15, session=None, pool_size=10):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self._session = session
+
+    @property
+    def session(self):
+        if self._session is None:
+            # requests 导入较慢，只在第一次获取远程配置时导入
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._session = requests.Session()
+            self._session.headers['User-Agent'] = 'CommandToGUI'
+            # 并发获取时每个线程都能拿到连接，不必排队等待
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+        return self._session
+
+    def cache_paths(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.meta.json'
+
+    def load_cache(self, url):
+        """返回缓存的 (元数据, 响应内容)，没有缓存时返回 (None, None)"""
+        meta = self.load_meta(url)
+        if meta is None:
+            return None, None
+        body_path, _ = self.cache_paths(url)
+        try:
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except OSError:
+            return None, None
+        return meta, body
+
+    def load_meta(self, url):
+        _, meta_path = self.cache_paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if isinstance(meta, dict) and meta.get('url') == url else None
+
+    def save_cache(self, url, body, headers):
+        body_path, meta_path = self.cache_paths(url)
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+        }
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # 先写内容再写元数据，中途失败只会导致下次重新完整下载
+        write_atomic(body_path, body)
+        write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def fetch(self, url, cancel_event=None, parse_unchanged=True, force=False):
+        """获取并解析远程配置，返回 (数据, 是否未变化)
+
+        cancel_event 为 threading.Event，置位后在下一个数据块处抛出 FetchCancelled。
+        parse_unchanged 为 False 时未变化的配置不再解析，数据返回 None；
+        force 为 True 时忽略缓存，完整获取一次。url 也可以是本地文件路径。
+        """
+        if not is_url(url):
+            return self.fetch_file(url, parse_unchanged, force)
+        meta, cached = self.load_cache(url)
+        headers = {}
+        # 缓存的内容不在时 304 无法使用，不发送条件请求
+        if meta is not None and cached is not None and not force:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        resp = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+        try:
+            if resp.status_code == 304 and cached is not None:
+                if not parse_unchanged:
+                    return None, True
+                return json.loads(cached.decode('utf-8')), True
+            resp.raise_for_status()
+            chunks = []
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise FetchCancelled()
+                chunks.append(chunk)
+        finally:
+            resp.close()
+
+        body = b''.join(chunks)
+        data = json.loads(body.decode('utf-8'))
+        # 只缓存能正确解析的响应
+        self.save_cache(url, body, resp.headers)
+        return data, False
+
+    def fetch_file(self, path, parse_unchanged=True, force=False):
+        """本地文件来源，修改时间和大小与上次相同时视为未变化"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        meta = self.load_meta(path)
+        unchanged = (not force and meta is not None and
+                     meta.get('mtime_ns') == stat.st_mtime_ns and meta.get('size') == stat.st_size)
+        if unchanged and not parse_unchanged:
+            return None, True
+        with open(path, 'rb') as f:
+            body = f.read()
+        data = json.loads(body.decode('utf-8'))
+        if not unchanged:
+            _, meta_path = self.cache_paths(path)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            meta = {'url': path, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+            write_atomic(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+        return data, unchanged
+
+    def fetch_all(self, sources, workers=4, cancel_event=None, force=False):
+        """并发获取多个来源，按来源顺序返回 [(来源, 数据, 是否未变化, 错误信息)]
+
+        未变化的来源不解析，数据为 None；失败的来源数据为 None，错误信息为字符串。
+        """
+        def fetch_one(source):
+            try:
+                data, unchanged = self.fetch(source, cancel_event, parse_unchanged=False, force=force)
+            except FetchCancelled:
+                raise
+            except Exception as e:
+                return source, None, False, str(e)
+            return source, data, unchanged, None
+
+        if not sources:
+            return []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(sources)))) as pool:
+            return list(pool.map(fetch_one, sources))
+
+
+def write_atomic(path, data):
+    """先写临时文件再替换，避免留下写了一半的文件"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def catalog_categories(data):
+    """订阅源内容可以是分类列表，也可以是带 categories 的完整配置"""
+    if isinstance(data, dict):
+        data = data.get('categories', [])
+    if not isinstance(data, list):
+        raise ValueError('订阅源内容不是命令目录')
+    return [c for c in data if isinstance(c, dict) and c.get('name')]
+
+
+def source_label(source):
+    """冲突时两者都保留，订阅源的副本以此作为名称后缀"""
+    name = source.rstrip('/').rsplit('/', 1)[-1] or source
+    return os.path.splitext(name)[0]
+
+
+def command_content(cmd):
+    """命令本身的内容，不含来源标记和被覆盖的原命令"""
+    return {k: v for k, v in cmd.items() if k not in ('source', 'local_original')}
+
+
+def merge_catalog(categories, remote, source, policy='local'):
+    """把订阅源的分类按 分类/工具/命令 名称合并到 categories（原地修改）
+
+    从订阅源加入的条目带有 source 字段，之后由同一来源更新或删除；本地添加的
+    条目（没有 source）和其他来源的条目不会被删除。同名但内容不同的命令按
+    policy 处理：local 保留现有的，remote 用订阅源覆盖，both 两者都保留，
+    订阅源的副本加上来源名称后缀（后缀名称也被占用时保留现有的）。内容相同的
+    同名命令不算冲突，保持原样。remote 覆盖时被替换的命令保存在 local_original
+    字段中，该来源不再提供这条命令（包括取消订阅）时恢复原来的命令而不是删除。
+    remote 为空列表时删除该来源的全部条目。
+    返回 {'added', 'updated', 'removed', 'conflicts'}，全为 0（冲突除外）表示没有变化。
+    """
+    stats = {'added': 0, 'updated': 0, 'removed': 0, 'conflicts': 0}
+    # 订阅源中出现的 (分类, 工具, 命令)，合并后据此删除该来源已下线的条目
+    seen = set()
+    cat_index = {c['name']: c for c in categories}
+    tool_indexes = {}
+
+    def tool_for(cat_name, rtool):
+        # 分类和工具在第一次加入命令时才创建，空的分类和工具不会留在目录中
+        cat = cat_index.get(cat_name)
+        if cat is None:
+            cat = cat_index[cat_name] = {'name': cat_name, 'tools': [], 'source': source}
+            categories.append(cat)
+        tools = tool_indexes.get(cat_name)
+        if tools is None:
+            tools = tool_indexes[cat_name] = {t['name']: t for t in cat.setdefault('tools', [])}
+        tool = tools.get(rtool['name'])
+        if tool is None:
+            tool = tools[rtool['name']] = {k: v for k, v in rtool.items() if k != 'commands'}
+            tool.update(commands=[], source=source)
+            cat['tools'].append(tool)
+        return tool
+
+    for rcat in remote:
+        for rtool in rcat.get('tools', []):
+            if not isinstance(rtool, dict) or not rtool.get('name'):
+                continue
+            tool = None
+            cmd_index = None
+            for rcmd in rtool.get('commands', []):
+                if not isinstance(rcmd, dict) or not rcmd.get('name') or 'template' not in rcmd:
+                    continue
+                if tool is None:
+                    tool = tool_for(rcat['name'], rtool)
+                    cmd_index = {c['name']: i for i, c in enumerate(tool.setdefault('commands', []))}
+                commands = tool['commands']
+                new = dict(rcmd, source=source)
+                new.pop('local_original', None)
+                name = rcmd['name']
+                i = cmd_index.get(name)
+                if i is not None and commands[i].get('source') != source:
+                    if command_content(commands[i]) == command_content(new):
+                        # 内容相同，沿用现有的命令，不算冲突，也不归该来源管理
+                        continue
+                    stats['conflicts'] += 1
+                    if policy == 'local':
+                        continue
+                    if policy == 'both':
+                        name = new['name'] = f"{name} ({source_label(source)})"
+                        i = cmd_index.get(name)
+                        if i is not None and commands[i].get('source') != source:
+                            # 带后缀的名称已被其他命令占用，保留该命令
+                            continue
+                    else:
+                        new['local_original'] = commands[i]
+                if i is not None and 'local_original' in commands[i] and commands[i].get('source') == source:
+                    new['local_original'] = commands[i]['local_original']
+                seen.add((rcat['name'], rtool['name'], name))
+                if i is None:
+                    cmd_index[name] = len(commands)
+                    commands.append(new)
+                    stats['added'] += 1
+                elif commands[i] != new:
+                    commands[i] = new
+                    stats['updated'] += 1
+            # 工具说明等字段只更新由该来源创建的工具
+            if tool is not None and tool.get('source') == source:
+                fields = {k: v for k, v in rtool.items() if k != 'commands'}
+                if any(tool.get(k) != v for k, v in fields.items()):
+                    tool.update(fields)
+                    stats['updated'] += 1
+
+    # 删除该来源不再提供的命令（覆盖过的恢复原来的命令），以及由它创建且已经空了的工具和分类
+    for cat in list(categories):
+        tools = cat.get('tools', [])
+        for tool in list(tools):
+            commands = tool.get('commands', [])
+            kept = []
+            changed = False
+            for c in commands:
+                if c.get('source') != source or (cat['name'], tool['name'], c['name']) in seen:
+                    kept.append(c)
+                    continue
+                changed = True
+                if 'local_original' in c:
+                    kept.append(c['local_original'])
+                    stats['updated'] += 1
+                else:
+                    stats['removed'] += 1
+            if changed:
+                tool['commands'] = kept
+            if not kept and commands and tool.get('source') == source:
+                tools.remove(tool)
+        if not tools and cat.get('source') == source:
+            categories.remove(cat)
+    return stats
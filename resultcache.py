@@ -0,0 +1,298 @@
+"""运行结果缓存与对比
+
+每次运行按 (渲染后的命令, 输入文件的内容摘要) 计算键，输出原样保存到
+cache/results/<运行编号>.out，运行记录（时间、退出码、提取到的结果）记在 index.json。
+每个键只保留最近几次运行，用于在有效期内直接复用上一次的结果，以及和上一次
+运行对比新增、消失的输出行和提取结果。总大小超过上限时按最近使用时间删除
+最久没用的键。输出由后台写入线程保存，不阻塞界面线程。本模块不依赖 Qt。
+"""
+import os
+import json
+import time
+import queue
+import hashlib
+import tempfile
+import threading
+
+from ansi import strip_ansi
+
+RESULT_CACHE_DIR = os.path.join('cache', 'results')
+# 每个键保留的运行次数，至少 2 次才能和上一次对比
+KEEP_RUNS = 2
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+# 对比结果中每类最多列出的行数，超出的只计数
+DIFF_LIMIT = 10000
+
+
+def run_key(command, inputs=None):
+    """inputs 为 {参数: 文件内容摘要}，文件内容变化后键随之变化"""
+    data = json.dumps([command, sorted((inputs or {}).items())], ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def output_lines(path):
+    """逐行读取保存的输出，去掉颜色和行尾"""
+    with open(path, 'rb') as f:
+        for raw in f:
+            yield strip_ansi(raw.decode('utf-8', errors='replace')).rstrip('\r\n')
+
+
+def diff_outputs(old_path, new_path, limit=DIFF_LIMIT):
+    """按行对比两次输出，返回新增和消失的行（去重、保持出现顺序）及各自的总数"""
+    old = set(line for line in output_lines(old_path) if line.strip())
+    seen = set()
+    added = []
+    added_count = 0
+    for line in output_lines(new_path):
+        if not line.strip() or line in seen:
+            continue
+        seen.add(line)
+        if line not in old:
+            added_count += 1
+            if len(added) < limit:
+                added.append(line)
+    removed = []
+    removed_count = 0
+    for line in output_lines(old_path):
+        if line in old and line not in seen:
+            # 同一行只计一次
+            old.discard(line)
+            removed_count += 1
+            if len(removed) < limit:
+                removed.append(line)
+    return {'added': added, 'removed': removed, 'added_count': added_count, 'removed_count': removed_count}
+
+
+def diff_findings(old, new):
+    """对比两次提取到的结果（[规则, 各字段值...] 列表），返回 (新增, 消失)"""
+    old_keys = set(map(tuple, old or []))
+    new_keys = set(map(tuple, new or []))
+    return ([f for f in new or [] if tuple(f) not in old_keys],
+            [f for f in old or [] if tuple(f) not in new_keys])
+
+
+class ResultWriter:
+    """一次运行的输出，write/commit/discard 可以在界面线程直接调用
+
+    数据由缓存的写入线程先写到临时文件，commit 后才进入缓存。
+    """
+    def __init__(self, cache, key, command):
+        self.cache = cache
+        self.key = key
+        self.command = command
+        # commit 或 discard 之后为 True，不再接受数据
+        self.closed = False
+        self.file = None
+        self.tmp = None
+        self.error = None
+
+    def write(self, data):
+        if data and not self.closed:
+            self.cache.queue.put((self, self.write_data, (bytes(data),)))
+
+    def commit(self, exit_code, findings=None, on_done=None):
+        """保存这次运行，on_done(运行记录, 错误) 在写入线程中调用，写入失败时运行记录为 None"""
+        if self.closed:
+            return
+        self.closed = True
+        self.cache.queue.put((self, self.save, (exit_code, findings, on_done)))
+
+    def discard(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.cache.queue.put((self, self.remove_file, ()))
+
+    # 以下方法只在写入线程中调用
+    def open_file(self):
+        os.makedirs(self.cache.cache_dir, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=self.cache.cache_dir, prefix='.run-', suffix='.part')
+        self.file = os.fdopen(fd, 'wb')
+
+    def write_data(self, data):
+        if self.error is not None:
+            return
+        try:
+            if self.file is None:
+                self.open_file()
+            self.file.write(data)
+        except OSError as e:
+            # 写入失败的运行不进入缓存，不影响任务本身
+            self.error = e
+            self.remove_file()
+
+    def save(self, exit_code, findings, on_done):
+        run = None
+        if self.error is None:
+            try:
+                if self.file is None:
+                    self.open_file()
+                self.file.close()
+                self.file = None
+                run = self.cache.add_run(self.key, self.command, self.tmp, exit_code, findings)
+            except OSError as e:
+                self.error = e
+                self.remove_file()
+        if on_done is not None:
+            on_done(run, self.error)
+
+    def remove_file(self):
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+        if self.tmp is not None:
+            try:
+                os.remove(self.tmp)
+            except OSError:
+                pass
+
+
+class ResultCache:
+    def __init__(self, cache_dir=RESULT_CACHE_DIR, max_bytes=CACHE_MAX_BYTES, keep=KEEP_RUNS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.lock = threading.Lock()
+        self._index = None
+        # 所有运行共用一个写入线程，界面线程只把数据放进队列
+        self.queue = queue.Queue()
+        self.thread = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    @property
+    def index(self):
+        # {键: {'command', 'used', 'runs': [{'id', 'time', 'exit_code', 'size', 'findings'}]}}，
+        # 调用方持有 self.lock
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def save_index(self):
+        # 调用方持有 self.lock
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.index-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, ensure_ascii=False)
+            os.replace(tmp, self.index_path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def run_path(self, run):
+        return os.path.join(os.path.abspath(self.cache_dir), run['id'] + '.out')
+
+    def open(self, key, command):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='result-writer', daemon=True)
+            self.thread.start()
+        return ResultWriter(self, key, command)
+
+    def close(self, timeout=5):
+        """写完队列中的数据后停止写入线程，还没有 commit 的运行不保存"""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def run(self):
+        pending = set()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            writer, func, args = item
+            func(*args)
+            if writer.file is not None:
+                pending.add(writer)
+            else:
+                pending.discard(writer)
+        for writer in pending:
+            writer.remove_file()
+
+    def lookup(self, key, max_age):
+        """返回 max_age 秒内最近一次成功运行的记录，没有时返回 None"""
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                return None
+            for run in reversed(entry['runs']):
+                if run['exit_code'] != 0:
+                    continue
+                if time.time() - run['time'] > max_age or not os.path.exists(self.run_path(run)):
+                    return None
+                entry['used'] = time.time()
+                try:
+                    self.save_index()
+                except OSError:
+                    pass
+                return run
+        return None
+
+    def previous(self, key, run_id):
+        """run_id 之前的一次运行，用于对比"""
+        with self.lock:
+            runs = self.index.get(key, {}).get('runs', [])
+            ids = [run['id'] for run in runs]
+            if run_id not in ids or ids.index(run_id) == 0:
+                return None
+            return runs[ids.index(run_id) - 1]
+
+    def add_run(self, key, command, tmp, exit_code, findings=None):
+        now = time.time()
+        run = {
+            'id': f'{key[:16]}-{time.time_ns()}',
+            'time': now,
+            'exit_code': exit_code,
+            'size': os.path.getsize(tmp),
+            'findings': findings,
+        }
+        os.replace(tmp, self.run_path(run))
+        with self.lock:
+            entry = self.index.setdefault(key, {'command': command, 'runs': []})
+            entry['used'] = now
+            entry['runs'].append(run)
+            while len(entry['runs']) > self.keep:
+                self.remove_run(entry['runs'].pop(0))
+            self.evict(key)
+            self.save_index()
+        return run
+
+    def remove_run(self, run):
+        try:
+            os.remove(self.run_path(run))
+        except OSError:
+            pass
+
+    def evict(self, current=None):
+        """总大小超过上限时删除最久没用的键，调用方持有 self.lock"""
+        index = self.index
+        total = sum(run['size'] for entry in index.values() for run in entry['runs'])
+        for key in sorted(index, key=lambda k: index[k].get('used', 0)):
+            if total <= self.max_bytes:
+                break
+            if key == current:
+                continue
+            for run in index.pop(key)['runs']:
+                total -= run['size']
+                self.remove_run(run)
+
+    def clear(self):
+        with self.lock:
+            for entry in self.index.values():
+                for run in entry['runs']:
+                    self.remove_run(run)
+            self.index.clear()
+            self.save_index()
@@ -0,0 +1,236 @@
+"""命令目录搜索索引
+
+把分类名、工具名、描述、命令名和模板切分成词，建立 词 -> 条目 的倒排表，
+名称中的词另外单独建表用于排序。查询词先在词表（所有词用换行拼成的一个字符串）
+中做子串查找得到包含它的词，再合并倒排表求交得到结果；没有匹配时退回到名称的
+模糊子序列匹配。索引支持增量增删，大目录可以分批构建，不阻塞界面。
+"""
+import re
+import heapq
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import islice
+
+WORD_RE = re.compile(r'\w+')
+# 候选条目超过这个数量时改为按预先排好的全局顺序挑选，避免逐个计算排序键
+LARGE_RESULT = 2000
+
+
+# 目录中各级条目存放子条目的键和子条目的类型
+CHILDREN = {'root': ('categories', 'category'), 'category': ('tools', 'tool'), 'tool': ('commands', 'command')}
+
+
+def catalog_entries(data, kind='root', key=(), owners=()):
+    """生成目录条目及其所有子条目的索引条目 (键, 名称, 字段)
+
+    直接读取配置数据，不需要目录节点。键为条目在目录中的行号路径，例如
+    (分类, 工具, 命令)，目录模型据此找到节点；owners 为所属工具和分类的名称，
+    也参与搜索。默认从 data（完整配置）生成整个目录的条目。
+    """
+    stack = [(data, kind, tuple(key), list(owners))]
+    while stack:
+        data, kind, key, owners = stack.pop()
+        if kind != 'root':
+            if kind == 'command':
+                fields = [data['name'], data.get('template', '')] + owners
+            elif kind == 'tool':
+                fields = [data['name'], data.get('description', '')] + owners
+            else:
+                fields = [data['name']]
+            yield key, data['name'], fields
+            owners = [data['name']] + owners
+        if kind in CHILDREN:
+            child_key, child_kind = CHILDREN[kind]
+            children = data.get(child_key, [])
+            # 倒序入栈，按目录顺序生成
+            for row in range(len(children) - 1, -1, -1):
+                stack.append((children[row], child_kind, key + (row,), owners))
+
+
+class SearchIndex:
+    def __init__(self):
+        self.docs = {}
+        self.postings = defaultdict(set)
+        self.name_postings = defaultdict(set)
+        self.next_seq = 0
+        self.vocab = None
+        self.names = None
+        self.order = None
+        # 查询词 -> (匹配的条目, 名称匹配的条目)，输入过程中重复的查询词直接复用
+        self.token_cache = {}
+        self.building = None
+        self.skipped = set()
+
+    def add(self, key, name, fields):
+        if key in self.docs:
+            self.remove(key)
+        self.skipped.discard(key)
+        name = name.lower()
+        name_words = set(WORD_RE.findall(name))
+        words = name_words.union(*(WORD_RE.findall(f.lower()) for f in fields if f))
+        self.docs[key] = (name, words, name_words, self.next_seq)
+        self.next_seq += 1
+        for word in words:
+            posting = self.postings[word]
+            if not posting:
+                self.vocab = None
+            posting.add(key)
+        for word in name_words:
+            self.name_postings[word].add(key)
+        self.names = self.order = None
+        self.token_cache.clear()
+
+    def remove(self, key):
+        if self.building is not None:
+            # 分批构建尚未处理到的条目不再加入
+            self.skipped.add(key)
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        for table, words in ((self.postings, doc[1]), (self.name_postings, doc[2])):
+            for word in words:
+                posting = table.get(word)
+                if posting is not None:
+                    posting.discard(key)
+                    if not posting:
+                        del table[word]
+                        self.vocab = None
+        self.names = self.order = None
+        self.token_cache.clear()
+
+    def start_build(self, entries):
+        """清空索引并准备分批构建，随后反复调用 build_step 直到返回 False"""
+        self.docs.clear()
+        self.postings.clear()
+        self.name_postings.clear()
+        self.vocab = self.names = self.order = None
+        self.token_cache.clear()
+        self.skipped = set()
+        self.building = iter(entries)
+
+    def build_step(self, count=500):
+        """处理最多 count 个条目，还有剩余时返回 True"""
+        if self.building is None:
+            return False
+        processed = 0
+        for entry in islice(self.building, count):
+            processed += 1
+            if entry[0] not in self.skipped:
+                self.add(*entry)
+        if processed < count:
+            self.building = None
+            self.skipped = set()
+            self.prepare()
+            return False
+        return True
+
+    def prepare(self):
+        """预先生成词表和全局排序，避免构建后的第一次查询变慢"""
+        docs = self.docs
+        if self.vocab is None:
+            self.vocab = '\n' + '\n'.join(self.postings) + '\n'
+        if self.order is None:
+            self.order = sorted(docs, key=lambda k: (len(docs[k][0]), docs[k][3]))
+
+    @property
+    def ready(self):
+        return self.building is None
+
+    def words_containing(self, token):
+        """在词表中查找包含 token 的所有词"""
+        if self.vocab is None:
+            self.prepare()
+        vocab = self.vocab
+        words = []
+        pos = vocab.find(token)
+        while pos >= 0:
+            start = vocab.rfind('\n', 0, pos) + 1
+            end = vocab.find('\n', pos)
+            words.append(vocab[start:end])
+            pos = vocab.find(token, end)
+        return words
+
+    def search(self, query, limit=200):
+        """返回按相关度排序的键列表：名称匹配优先，名称以查询开头、越短越靠前"""
+        tokens = WORD_RE.findall(query.lower())
+        if not tokens:
+            return []
+
+        candidates = None
+        name_hits = None
+        for token in tokens:
+            docs, name_docs = self.match_token(token)
+            candidates = docs if candidates is None else candidates & docs
+            name_hits = name_docs if name_hits is None else name_hits & name_docs
+            if not candidates:
+                return self.fuzzy_search(''.join(tokens), limit)
+        name_hits = name_hits & candidates
+
+        result = self.ranked(name_hits, limit, tokens[0])
+        if len(result) < limit:
+            # 其余条目的名称里没有查询词，不再比较前缀
+            result += self.ranked(candidates - name_hits, limit - len(result), None)
+        return result
+
+    def match_token(self, token):
+        cached = self.token_cache.get(token)
+        if cached is None:
+            docs = set()
+            name_docs = set()
+            for word in self.words_containing(token):
+                docs.update(self.postings[word])
+                name_docs.update(self.name_postings.get(word, ()))
+            if len(self.token_cache) > 64:
+                self.token_cache.clear()
+            cached = self.token_cache[token] = (docs, name_docs)
+        return cached
+
+    def ranked(self, keys, limit, first):
+        """名称以 first 开头的优先，其次名称越短、越早加入越靠前"""
+        docs = self.docs
+        if len(keys) <= LARGE_RESULT:
+            def rank(key):
+                name, _, _, seq = docs[key]
+                return first is not None and not name.startswith(first), len(name), seq
+            return heapq.nsmallest(limit, keys, key=rank)
+
+        if self.order is None:
+            self.prepare()
+        prefixed = []
+        rest = []
+        for key in self.order:
+            if key in keys:
+                if first is None or docs[key][0].startswith(first):
+                    prefixed.append(key)
+                    if len(prefixed) >= limit:
+                        break
+                elif len(rest) < limit:
+                    rest.append(key)
+        return (prefixed + rest)[:limit]
+
+    def fuzzy_search(self, query, limit=200):
+        """名称的子序列匹配，在拼接后的名称串上用正则一次扫描完成"""
+        if self.names is None:
+            keys = list(self.docs)
+            self.names = (keys, '\n'.join(self.docs[k][0] for k in keys))
+            offsets = [0]
+            for key in keys[:-1]:
+                offsets.append(offsets[-1] + len(self.docs[key][0]) + 1)
+            self.names += (offsets,)
+        keys, names, offsets = self.names
+        pattern = re.compile('[^\n]*?'.join(re.escape(ch) for ch in query))
+        scored = []
+        pos = 0
+        while True:
+            match = pattern.search(names, pos)
+            if match is None:
+                break
+            line = bisect_right(offsets, match.start()) - 1
+            # 匹配跨度越短越好，出现位置越靠前越好
+            span = match.end() - match.start()
+            scored.append((span, match.start() - offsets[line], line))
+            next_line = names.find('\n', match.start())
+            if next_line < 0:
+                break
+            pos = next_line + 1
+        return [keys[line] for _, _, line in heapq.nsmallest(limit, scored)]
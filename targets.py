@@ -0,0 +1,341 @@
+"""目标列表预处理
+
+文件类型参数常常是几百万行的目标列表（IP、域名、URL），其中有重复、大小写不一致，
+也有 CIDR 网段和端口范围。预处理逐块流式读取文件，边计算内容摘要边去重、规范化、
+展开网段和端口范围，结果保存到 cache/targets/<摘要>-<选项>.txt。同一份内容再次
+选择时直接使用已有结果，不用重新处理。
+
+行数和内容摘要按 (路径, 大小, 修改时间) 记在 index.json 中，再次打开没有改动的
+文件只需要一次 stat，预览行数不需要把文件读入内存。去重只保存每行的哈希值，
+几百万行也只占用有限的内存。本模块不依赖 Qt。
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import ipaddress
+
+TARGET_CACHE_DIR = os.path.join('cache', 'targets')
+CHUNK_SIZE = 1024 * 1024
+# 单个网段或 IP 范围最多展开的地址数，更大的原样保留交给工具自己处理
+EXPAND_LIMIT = 65536
+# index.json 最多记录的文件数
+INDEX_ENTRIES = 1000
+# 预处理结果的总大小上限，超过后删除最久没有用过的结果
+CACHE_MAX_BYTES = 1024 * 1024 * 1024
+PORTS_CHARS = set('0123456789,-')
+
+
+class PreprocessCancelled(Exception):
+    pass
+
+
+def normalize_target(line):
+    """去掉空白，主机名转小写并去掉末尾的点；URL 只转换协议和主机部分"""
+    line = line.strip()
+    scheme, sep, rest = line.partition('://')
+    if sep:
+        host, slash, path = rest.partition('/')
+        return f'{scheme.lower()}://{host.lower().rstrip(".")}{slash}{path}'
+    host, sep, ports = line.rpartition(':')
+    if sep and host.count(':') == 0:
+        return f'{host.lower().rstrip(".")}:{ports}'
+    return line.lower().rstrip('.')
+
+
+def parse_ports(text):
+    """'80,443,8000-8010' -> 端口列表，格式不对时返回 None"""
+    ports = []
+    for part in text.split(','):
+        start, sep, end = part.partition('-')
+        if not start.isdigit() or (sep and not end.isdigit()):
+            return None
+        start, end = int(start), int(end) if sep else int(start)
+        if not 0 < start <= end <= 65535:
+            return None
+        ports.extend(range(start, end + 1))
+    return ports
+
+
+def expand_hosts(host, limit):
+    """展开 CIDR 网段和 IPv4 范围（1.1.1.1-1.1.1.9 或 1.1.1.1-9），不是网段时返回 None
+
+    超过 limit 个地址时抛出 ValueError。
+    """
+    if '/' in host:
+        try:
+            net = ipaddress.ip_network(host, strict=False)
+        except ValueError:
+            return None
+        if net.num_addresses > limit:
+            raise ValueError(host)
+        return [str(ip) for ip in (net.hosts() if net.num_addresses > 2 else net)]
+    first, sep, last = host.partition('-')
+    if not sep:
+        return None
+    try:
+        start = ipaddress.IPv4Address(first)
+        if last.isdigit():
+            last = first.rsplit('.', 1)[0] + '.' + last
+        end = ipaddress.IPv4Address(last)
+    except ValueError:
+        return None
+    count = int(end) - int(start) + 1
+    if count <= 0:
+        return None
+    if count > limit:
+        raise ValueError(host)
+    return [str(ipaddress.IPv4Address(n)) for n in range(int(start), int(end) + 1)]
+
+
+def expand_target(line, limit=EXPAND_LIMIT):
+    """展开一行目标，返回目标列表；无需展开时返回 [line]，网段过大时抛出 ValueError"""
+    if '://' in line:
+        return [line]
+    host, sep, ports = line.rpartition(':')
+    port_list = None
+    if sep and host.count(':') == 0 and ports and set(ports) <= PORTS_CHARS:
+        port_list = parse_ports(ports)
+    if port_list is None:
+        host = line
+    hosts = expand_hosts(host, limit) if ('/' in host or '-' in host) else None
+    if hosts is None:
+        hosts = [host]
+    if port_list is None:
+        return hosts
+    if len(hosts) * len(port_list) > limit:
+        raise ValueError(line)
+    return [f'{h}:{p}' for h in hosts for p in port_list]
+
+
+def options_key(options):
+    """预处理选项在结果文件名中的标记，例如 dne65536"""
+    return ''.join(flag for flag, key in (('d', 'dedupe'), ('n', 'normalize'), ('e', 'expand'))
+                   if options.get(key)) + str(options.get('limit', EXPAND_LIMIT))
+
+
+def write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class TargetCache:
+    """目标文件的行数预览和预处理结果缓存，可以在多个线程中同时使用"""
+    def __init__(self, cache_dir=TARGET_CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._index = None
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    @property
+    def index(self):
+        # 调用方持有 self.lock
+        if self._index is None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def lookup(self, path, stat):
+        """文件没有改动时返回记录的 {'digest', 'lines', 'size'}，否则返回 None"""
+        with self.lock:
+            entry = self.index.get(os.path.abspath(path))
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def remember(self, path, stat, digest, lines):
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest, 'lines': lines}
+        with self.lock:
+            index = self.index
+            index.pop(os.path.abspath(path), None)
+            index[os.path.abspath(path)] = entry
+            while len(index) > INDEX_ENTRIES:
+                del index[next(iter(index))]
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                write_atomic(self.index_path, json.dumps(index, ensure_ascii=False).encode('utf-8'))
+            except OSError:
+                # 索引只是加速，写入失败下次重新计算
+                pass
+        return entry
+
+    def inspect(self, path, cancel_event=None):
+        """返回 {'digest', 'lines', 'size'}，没有改动的文件直接使用记录，否则流式读取一遍"""
+        stat = os.stat(path)
+        entry = self.lookup(path, stat)
+        if entry is not None:
+            return entry
+        digest = hashlib.blake2b(digest_size=16)
+        lines = 0
+        last = b''
+        with open(path, 'rb') as f:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise PreprocessCancelled()
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                lines += chunk.count(b'\n')
+                last = chunk[-1:]
+        lines += 1 if last not in (b'', b'\n') else 0
+        return self.remember(path, stat, digest.hexdigest(), lines)
+
+    def artifact_paths(self, digest, options):
+        # 结果路径会填进命令行，使用绝对路径，与任务的工作目录无关
+        base = os.path.join(os.path.abspath(self.cache_dir), f'{digest}-{options_key(options)}')
+        return base + '.txt', base + '.json'
+
+    def cached_result(self, path, options):
+        """文件没有改动且已经处理过时返回 (结果文件, 统计)，否则返回 None"""
+        entry = self.lookup(path, os.stat(path))
+        if entry is None:
+            return None
+        return self.load_result(entry['digest'], options)
+
+    def load_result(self, digest, options):
+        out_path, meta_path = self.artifact_paths(digest, options)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(out_path):
+            return None
+        # 修改时间作为最近使用时间，清理时先删最久没用的
+        try:
+            os.utime(out_path)
+        except OSError:
+            pass
+        return out_path, stats
+
+    def preprocess(self, path, options, cancel_event=None, progress=None):
+        """去重、规范化、展开网段和端口范围，返回 (结果文件, 统计)
+
+        options 为 {'dedupe', 'normalize', 'expand', 'limit'}。统计包括 source_lines、
+        lines、duplicates、expanded、skipped（空行和注释）和 too_large（超过上限未展开）。
+        progress(已读字节, 总字节) 每读一块调用一次。
+        """
+        stat = os.stat(path)
+        entry = self.lookup(path, stat)
+        if entry is not None:
+            result = self.load_result(entry['digest'], options)
+            if result is not None:
+                return result
+
+        dedupe = options.get('dedupe', True)
+        normalize = options.get('normalize', True)
+        expand = options.get('expand', True)
+        limit = options.get('limit', EXPAND_LIMIT)
+        stats = {'source_lines': 0, 'lines': 0, 'duplicates': 0, 'expanded': 0, 'skipped': 0, 'too_large': 0}
+        # 只保存哈希值，64 位哈希碰撞导致误删一行的概率可以忽略
+        seen = set()
+        digest = hashlib.blake2b(digest_size=16)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            with open(path, 'rb') as src, os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as out:
+                carry = b''
+                done = 0
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise PreprocessCancelled()
+                    chunk = src.read(CHUNK_SIZE)
+                    digest.update(chunk)
+                    done += len(chunk)
+                    data = carry + chunk
+                    if chunk:
+                        cut = data.rfind(b'\n') + 1
+                        carry = data[cut:]
+                        data = data[:cut]
+                    else:
+                        carry = b''
+                    # 只按 \n 分行，与 inspect 统计的行数一致，\r 在 strip 时去掉
+                    lines = data.decode('utf-8', errors='replace').split('\n')
+                    if not lines[-1]:
+                        lines.pop()
+                    stats['source_lines'] += len(lines)
+                    kept = []
+                    for line in lines:
+                        line = line.strip()
+                        if not line or line.startswith('#'):
+                            stats['skipped'] += 1
+                            continue
+                        if normalize:
+                            line = normalize_target(line)
+                        targets = [line]
+                        if expand:
+                            try:
+                                targets = expand_target(line, limit)
+                            except ValueError:
+                                stats['too_large'] += 1
+                            stats['expanded'] += len(targets) - 1
+                        for target in targets:
+                            if dedupe:
+                                key = hash(target)
+                                if key in seen:
+                                    stats['duplicates'] += 1
+                                    continue
+                                seen.add(key)
+                            kept.append(target)
+                    stats['lines'] += len(kept)
+                    if kept:
+                        out.write('\n'.join(kept))
+                        out.write('\n')
+                    if progress is not None:
+                        progress(done, stat.st_size)
+                    if not chunk:
+                        break
+            digest = digest.hexdigest()
+            self.remember(path, stat, digest, stats['source_lines'])
+            out_path, meta_path = self.artifact_paths(digest, options)
+            os.replace(tmp, out_path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        write_atomic(meta_path, json.dumps(stats).encode('utf-8'))
+        self.prune(keep=out_path)
+        return out_path, stats
+
+    def prune(self, keep=None):
+        """结果总大小超过上限时，按最近使用时间从旧到新删除"""
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith('.txt')]
+        except OSError:
+            return
+        files = []
+        for name in names:
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            for victim in (path, path[:-4] + '.json'):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
@@ -0,0 +1,119 @@
+"""命令模板
+
+模板中用 {参数} 或 {{参数}} 标记参数。每个模板文本只解析一次，编译结果按文本缓存，
+参数列表、校验和渲染都使用同一个编译结果；批量运行展开成千上万个目标时不再重复解析。
+
+渲染时 {参数} 的值按当前系统的 shell 规则加引号，路径中的空格和特殊字符不会被拆开
+或被 shell 解释；{{参数}} 原样插入，用于需要传入多个选项的参数，例如 {{extra_args}}。
+本模块不依赖 Qt，图形界面和命令行模式共用。
+"""
+import re
+import shlex
+import platform
+import itertools
+from functools import lru_cache
+
+PARAM_RE = re.compile(r'\{\{([^{}]+)\}\}|\{([^{}]+)\}')
+# cmd.exe 中不需要加引号的字符
+WINDOWS_SAFE_RE = re.compile(r'[\w@%+=:,./\\-]+')
+
+
+def quote_windows(value):
+    """按 cmd.exe / MSVCRT 的规则加引号，双引号写成两个"""
+    if value and WINDOWS_SAFE_RE.fullmatch(value):
+        return value
+    return '"' + value.replace('"', '""') + '"'
+
+
+def shell_quote(value, system=None):
+    if (system or platform.system()) == 'Windows':
+        return quote_windows(value)
+    return shlex.quote(value)
+
+
+class Template:
+    """编译后的模板：文本片段与参数交替排列"""
+    __slots__ = ('text', 'parts', 'params')
+
+    def __init__(self, text):
+        self.text = text
+        # [(前面的文本, 参数名, 是否原样插入, 原始标记)]，最后一段文本的参数名为 None
+        self.parts = []
+        params = []
+        pos = 0
+        for match in PARAM_RE.finditer(text):
+            raw = match.group(1) is not None
+            name = match.group(1) if raw else match.group(2)
+            self.parts.append((text[pos:match.start()], name, raw, match.group(0)))
+            if name not in params:
+                params.append(name)
+            pos = match.end()
+        self.parts.append((text[pos:], None, False, ''))
+        self.params = tuple(params)
+
+    def missing(self, values):
+        """返回未填写（缺失或为空）的参数"""
+        return [p for p in self.params if not values.get(p)]
+
+    def render(self, values, quote=True, system=None):
+        """一次拼接出命令，没有提供值的参数保留原样"""
+        if quote:
+            system = system or platform.system()
+        out = []
+        for literal, name, raw, token in self.parts:
+            out.append(literal)
+            if name is None:
+                continue
+            value = values.get(name)
+            if value is None:
+                out.append(token)
+            elif raw or not quote or not value:
+                # 空值不加引号，保持可选参数留空时的原有效果
+                out.append(value)
+            else:
+                out.append(shell_quote(value, system))
+        return ''.join(out)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(text):
+    return Template(text)
+
+
+def template_params(text):
+    return compile_template(text).params
+
+
+def render_template(text, values, quote=True):
+    return compile_template(text).render(values, quote)
+
+
+def load_batch_values(source):
+    """读取批量参数的取值：文件按行读取，忽略空行和 # 开头的注释行"""
+    kind, value = source
+    if kind == 'list':
+        lines = value
+    else:
+        with open(value, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.strip().startswith('#')]
+
+
+def expand_batch(template, values, batch_values, quote=True):
+    """按批量参数的笛卡尔积展开模板，返回 [(目标说明, 命令)]"""
+    compiled = compile_template(template)
+    system = platform.system()
+    names = list(batch_values)
+    targets = []
+    for combo in itertools.product(*(batch_values[n] for n in names)):
+        run_values = dict(values)
+        run_values.update(zip(names, combo))
+        targets.append((' '.join(combo), compiled.render(run_values, quote, system)))
+    return targets
+
+
+def job_shell_command(cmd):
+    """单条命令的非交互式执行方式"""
+    if platform.system() == 'Windows':
+        return 'cmd.exe', ['/C', cmd]
+    return '/bin/bash', ['-c', cmd]